@@ -2,6 +2,8 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn backend.asgi:application``) so the
+async query endpoint (``api/query/async/``) runs on the event loop.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
@@ -14,3 +16,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Pre-load the embeddings model and check Neo4j when RAG_WARM_ON_STARTUP=1
+from rag_api.rag_service import warm_up_if_configured  # noqa: E402
+
+warm_up_if_configured()
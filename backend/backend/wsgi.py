@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Pre-load the embeddings model and check Neo4j when RAG_WARM_ON_STARTUP=1
+from rag_api.rag_service import warm_up_if_configured  # noqa: E402
+
+warm_up_if_configured()
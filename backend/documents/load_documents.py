@@ -1,8 +1,22 @@
+import argparse
+import hashlib
 import json
 import os
-from neo4j import GraphDatabase
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from langchain_huggingface import HuggingFaceEmbeddings
 from dotenv import load_dotenv
+from neo4j import READ_ACCESS
+
+# The index builders live in the rag_api app so the API reads exactly what we write.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag_api.vector_index import DEFAULT_INDEX_DIR, build_local_index  # noqa: E402
+from rag_api.sparse_index import build_sparse_index  # noqa: E402
+from rag_api.typeahead import build_typeahead_index  # noqa: E402
+from rag_api.content_quality import is_toc_like  # noqa: E402
+from rag_api.neo4j_client import Neo4jClient  # noqa: E402
 
 # 1. LOAD THE .ENV FILE
 load_dotenv()
@@ -16,74 +30,441 @@ JSON_FILE_PATH = "PEC.json"  # Ensure path is correct
 # Name of the index your App is looking for (based on your error message)
 VECTOR_INDEX_NAME = "vector" 
 
-def load_data_into_graph(tx, part_data):
+# Number of rows sent per UNWIND statement during ingestion.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+
+# Texts sent to the embedding model per call, and node rows pulled per read.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_PAGE_SIZE = int(os.getenv("EMBED_PAGE_SIZE", "1000"))
+
+# Labels whose text is embedded.
+EMBED_LABELS = ["Clause", "SubClause", "Article"]
+
+# Stored on every embedded node so a model switch triggers re-embedding.
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+# Embeddable row lists, their label and the properties that identify a node.
+EMBEDDABLE_ROWS = {
+    "articles": ("Article", ["title"]),
+    "clauses": ("Clause", ["article_title", "number"]),
+    "subclauses": ("SubClause", ["article_title", "clause_number", "number"]),
+}
+
+# One parameterized UNWIND statement per node type. Each statement also
+# merges the relationship to the parent node, so a batch is a single round trip.
+# Every row is written on every run, so page and parent changes always land;
+# only a changed content hash clears the stored embedding so the embedding
+# stage picks the node up again. A chapter or article that moved loses its
+# link to the old parent.
+INGEST_QUERIES = {
+    "parts": """
+        UNWIND $rows AS row
+        MERGE (p:Part {name: row.name})
+        SET p.page = row.page
+    """,
+    "chapters": """
+        UNWIND $rows AS row
+        MERGE (c:Chapter {name: row.name})
+        SET c.title = row.title, c.page = row.page
+        WITH c, row
+        OPTIONAL MATCH (old:Part)-[r:HAS_CHAPTER]->(c)
+        WHERE old.name <> row.part
+        DELETE r
+        WITH DISTINCT c, row
+        MATCH (p:Part {name: row.part})
+        MERGE (p)-[:HAS_CHAPTER]->(c)
+    """,
+    "articles": """
+        UNWIND $rows AS row
+        MERGE (a:Article {title: row.title})
+        SET a.embedding = CASE WHEN a.content_hash = row.hash THEN a.embedding ELSE null END
+        SET a.page = row.page, a.content_hash = row.hash, a.is_toc = row.is_toc
+        WITH a, row
+        OPTIONAL MATCH (old:Chapter)-[r:HAS_ARTICLE]->(a)
+        WHERE old.name <> row.chapter
+        DELETE r
+        WITH DISTINCT a, row
+        MATCH (c:Chapter {name: row.chapter})
+        MERGE (c)-[:HAS_ARTICLE]->(a)
+    """,
+    "clauses": """
+        UNWIND $rows AS row
+        MERGE (cl:Clause {number: row.num, article_title: row.article})
+        SET cl.embedding = CASE WHEN cl.content_hash = row.hash THEN cl.embedding ELSE null END
+        SET cl.text = row.text, cl.content_hash = row.hash, cl.is_toc = row.is_toc
+        WITH cl, row
+        MATCH (a:Article {title: row.article})
+        MERGE (a)-[:HAS_CLAUSE]->(cl)
+    """,
+    "subclauses": """
+        UNWIND $rows AS row
+        MERGE (s:SubClause {number: row.num, clause_number: row.clause, article_title: row.article})
+        SET s.embedding = CASE WHEN s.content_hash = row.hash THEN s.embedding ELSE null END
+        SET s.text = row.text, s.content_hash = row.hash, s.is_toc = row.is_toc
+        WITH s, row
+        MATCH (cl:Clause {number: row.clause, article_title: row.article})
+        MERGE (cl)-[:HAS_SUBCLAUSE]->(s)
+    """,
+}
+
+# Parents must exist before their children are matched, so order matters.
+INGEST_ORDER = ["parts", "chapters", "articles", "clauses", "subclauses"]
+
+# Lookup indexes used by the MERGE/MATCH clauses above. Without them every
+# row of an UNWIND batch falls back to a label scan.
+LOOKUP_INDEXES = [
+    "CREATE INDEX part_name IF NOT EXISTS FOR (n:Part) ON (n.name)",
+    "CREATE INDEX chapter_name IF NOT EXISTS FOR (n:Chapter) ON (n.name)",
+    "CREATE INDEX article_title IF NOT EXISTS FOR (n:Article) ON (n.title)",
+    "CREATE INDEX clause_key IF NOT EXISTS FOR (n:Clause) ON (n.article_title, n.number)",
+    "CREATE INDEX subclause_key IF NOT EXISTS FOR (n:SubClause) ON (n.article_title, n.clause_number, n.number)",
+]
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def row_key(key, row):
+    if key == "articles":
+        return (row["title"],)
+    if key == "clauses":
+        return (row["article"], row["num"])
+    return (row["article"], row["clause"], row["num"])
+
+
+def flatten_parts(parts):
     """
-    Parses the JSON data and creates nodes and relationships in Neo4j.
+    Flattens the parsed JSON into typed row lists, one list per node type.
     """
-    part_name = part_data.get("part_name", "Unknown Part")
-    part_page = part_data.get("part_page_number")
-    
-    print(f"   Processing Part: {part_name}")
-    
-    tx.run("""
-        MERGE (p:Part {name: $name})
-        SET p.page = $page
-    """, {"name": part_name, "page": part_page})
-
-    chapters = part_data.get("chapters", {})
-    for ch_key, chapter in chapters.items():
-        ch_title = chapter.get("chapter_title", "Untitled")
-        ch_page = chapter.get("chapter_page_number")
-
-        tx.run("""
-            MERGE (c:Chapter {name: $name})
-            SET c.title = $title, c.page = $page
-            WITH c
-            MATCH (p:Part {name: $part})
-            MERGE (p)-[:HAS_CHAPTER]->(c)
-        """, {"name": ch_key, "title": ch_title, "page": ch_page, "part": part_name})
-
-        for art in chapter.get("articles", []):
-            art_title = art.get("title", "Untitled Article")
-            art_page = art.get("page")
-
-            tx.run("""
-                MERGE (a:Article {title: $title})
-                SET a.page = $page
-                WITH a
-                MATCH (c:Chapter {name: $chapter})
-                MERGE (c)-[:HAS_ARTICLE]->(a)
-            """, {"title": art_title, "page": art_page, "chapter": ch_key})
-
-            content = art.get("content", {})
-            for cl in content.get("clauses", []):
-                cl_num = cl.get("clause_number")
-                cl_text = cl.get("clause_text", "")
-
-                tx.run("""
-                    MERGE (cl:Clause {number: $num, article_title: $article})
-                    SET cl.text = $text
-                    WITH cl
-                    MATCH (a:Article {title: $article})
-                    MERGE (a)-[:HAS_CLAUSE]->(cl)
-                """, {"num": cl_num, "text": cl_text, "article": art_title})
-
-                for sub in cl.get("sub_clauses", []):
-                    sub_num = sub.get("sub_clause_number")
-                    sub_text = sub.get("sub_clause_text", "")
-                    
-                    if not sub_text.strip():
-                        continue
-
-                    tx.run("""
-                        MERGE (s:SubClause {number: $num, clause_number: $clause, article_title: $article})
-                        SET s.text = $text
-                        WITH s
-                        MATCH (cl:Clause {number: $clause, article_title: $article})
-                        MERGE (cl)-[:HAS_SUBCLAUSE]->(s)
-                    """, {"num": sub_num, "text": sub_text, "clause": cl_num, "article": art_title})
-
-def create_vector_indices(driver):
+    rows = {key: [] for key in INGEST_ORDER}
+
+    for part_data in parts:
+        part_name = part_data.get("part_name", "Unknown Part")
+        rows["parts"].append({"name": part_name, "page": part_data.get("part_page_number")})
+
+        chapters = part_data.get("chapters", {})
+        for ch_key, chapter in chapters.items():
+            rows["chapters"].append({
+                "name": ch_key,
+                "title": chapter.get("chapter_title", "Untitled"),
+                "page": chapter.get("chapter_page_number"),
+                "part": part_name,
+            })
+
+            for art in chapter.get("articles", []):
+                art_title = art.get("title", "Untitled Article")
+                rows["articles"].append({
+                    "title": art_title,
+                    "page": art.get("page"),
+                    "chapter": ch_key,
+                    "hash": content_hash(art_title),
+                    "is_toc": is_toc_like(art_title),
+                })
+
+                content = art.get("content", {})
+                for cl in content.get("clauses", []):
+                    cl_num = cl.get("clause_number")
+                    cl_text = cl.get("clause_text", "")
+                    rows["clauses"].append({
+                        "num": cl_num,
+                        "text": cl_text,
+                        "article": art_title,
+                        "hash": content_hash(cl_text),
+                        "is_toc": is_toc_like(cl_text),
+                    })
+
+                    for sub in cl.get("sub_clauses", []):
+                        sub_text = sub.get("sub_clause_text", "")
+
+                        if not sub_text.strip():
+                            continue
+
+                        rows["subclauses"].append({
+                            "num": sub.get("sub_clause_number"),
+                            "text": sub_text,
+                            "clause": cl_num,
+                            "article": art_title,
+                            "hash": content_hash(sub_text),
+                            "is_toc": is_toc_like(sub_text),
+                        })
+
+    return rows
+
+
+def batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def write_batch(tx, query, rows):
+    tx.run(query, {"rows": rows}).consume()
+
+
+def create_lookup_indexes(client):
+    with client.session() as session:
+        for statement in LOOKUP_INDEXES:
+            session.run(statement)
+
+
+def load_data_into_graph(client, rows, batch_size=INGEST_BATCH_SIZE):
+    """
+    Writes the flattened rows into Neo4j with one UNWIND statement per batch.
+
+    Returns the number of nodes written.
+    """
+    total = 0
+    started = time.perf_counter()
+
+    with client.session() as session:
+        for key in INGEST_ORDER:
+            node_rows = rows[key]
+            if not node_rows:
+                continue
+
+            print(f"   Writing {len(node_rows)} {key} in batches of {batch_size}...")
+            for batch in batches(node_rows, batch_size):
+                session.execute_write(write_batch, INGEST_QUERIES[key], batch)
+            total += len(node_rows)
+
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed if elapsed > 0 else float("inf")
+    print(f" Wrote {total} nodes in {elapsed:.2f}s ({rate:.0f} nodes/sec).")
+    return total
+
+def diff_against_graph(client, rows, model=EMBEDDING_MODEL):
+    """
+    Compares the flattened rows with the nodes already in Neo4j.
+
+    Returns (stale_node_ids, summary). Every row is still written (MERGE is
+    idempotent and picks up page and parent changes); the summary counts
+    which embeddable nodes are new, changed (text or embedding model) or
+    unchanged. Stale ids cover every Part, Chapter, Article, Clause and
+    SubClause that is no longer in the source.
+    """
+    stale_ids = []
+    summary = {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+
+    with client.session() as session:
+        for key, (label, fields) in EMBEDDABLE_ROWS.items():
+            key_expr = ", ".join(f"n.{field}" for field in fields)
+            existing = {
+                tuple(r["key"]): r
+                for r in session.run(f"""
+                    MATCH (n:{label})
+                    RETURN elementId(n) AS id, [{key_expr}] AS key, n.content_hash AS hash,
+                           n.embedding_model AS model, n.embedding IS NOT NULL AS embedded
+                """)
+            }
+
+            for row in rows[key]:
+                node = existing.pop(row_key(key, row), None)
+                if node is None:
+                    summary["added"] += 1
+                elif node["hash"] != row["hash"] or node["model"] != model or not node["embedded"]:
+                    summary["updated"] += 1
+                else:
+                    summary["unchanged"] += 1
+
+            stale_ids.extend(node["id"] for node in existing.values())
+            summary["deleted"] += len(existing)
+
+        # Structural nodes that disappeared from the source
+        for key, label in (("parts", "Part"), ("chapters", "Chapter")):
+            names = {row["name"] for row in rows[key]}
+            for r in session.run(f"MATCH (n:{label}) RETURN elementId(n) AS id, n.name AS name"):
+                if r["name"] not in names:
+                    stale_ids.append(r["id"])
+                    summary["deleted"] += 1
+
+    return stale_ids, summary
+
+
+def corpus_version(rows, model=EMBEDDING_MODEL):
+    """
+    Fingerprint of the embeddable corpus; changes whenever any text or the model changes.
+    """
+    digest = hashlib.sha256(model.encode("utf-8"))
+    for key in EMBEDDABLE_ROWS:
+        for row in sorted(rows[key], key=lambda r: row_key(key, r)):
+            digest.update(json.dumps([key, row_key(key, row), row["hash"]]).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def write_corpus_version(client, version):
+    """
+    Records the corpus version so the API can invalidate cached answers.
+    """
+    with client.session() as session:
+        session.run("""
+            MERGE (m:CorpusMeta {name: 'default'})
+            SET m.version = $version, m.updated_at = datetime()
+        """, {"version": version})
+
+
+def delete_nodes(client, node_ids, batch_size=INGEST_BATCH_SIZE):
+    with client.session() as session:
+        for batch in batches(node_ids, batch_size):
+            session.execute_write(write_batch, """
+                UNWIND $rows AS id
+                MATCH (n) WHERE elementId(n) = id
+                DETACH DELETE n
+            """, batch)
+
+
+def fetch_embedding_pages(client, label, page_size, model=EMBEDDING_MODEL):
+    """
+    Yields pages of (id, text) rows for nodes of a label that have no embedding
+    for the current model, using keyset pagination on elementId.
+    """
+    query = f"""
+        MATCH (n:{label})
+        WHERE elementId(n) > $after AND coalesce(n.text, n.title) IS NOT NULL
+          AND (n.embedding IS NULL OR coalesce(n.embedding_model, '') <> $model)
+        RETURN elementId(n) AS id, coalesce(n.text, n.title) AS text
+        ORDER BY id
+        LIMIT $limit
+    """
+    after = ""
+    with client.session(default_access_mode=READ_ACCESS) as session:
+        while True:
+            page = [(r["id"], r["text"]) for r in session.run(query, {"after": after, "limit": page_size, "model": model})]
+            if not page:
+                return
+            yield [(node_id, text) for node_id, text in page if text.strip()]
+            after = page[-1][0]
+
+
+def write_embeddings(client, rows):
+    with client.session() as session:
+        session.execute_write(write_batch, """
+            UNWIND $rows AS row
+            MATCH (n) WHERE elementId(n) = row.id
+            SET n.embedding = row.vec, n.embedding_model = row.model
+        """, rows)
+
+
+def embed_nodes(client, embedder, labels=EMBED_LABELS, batch_size=EMBED_BATCH_SIZE,
+                page_size=EMBED_PAGE_SIZE, model=EMBEDDING_MODEL):
+    """
+    Streams the texts of nodes that still need an embedding out of Neo4j, encodes them in batches and writes the
+    vectors back. The write of one batch runs on a background thread while
+    the next batch is being encoded.
+
+    Returns the number of nodes embedded.
+    """
+    total = 0
+    started = time.perf_counter()
+    pending = None
+
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for label in labels:
+            print(f"    Processing {label} nodes...")
+
+            for page in fetch_embedding_pages(client, label, page_size, model):
+                for batch in batches(page, batch_size):
+                    vectors = embedder.embed_documents([text for _, text in batch])
+                    rows = [{"id": node_id, "vec": vec, "model": model} for (node_id, _), vec in zip(batch, vectors)]
+
+                    # Keep at most one write in flight so memory stays bounded.
+                    if pending is not None:
+                        pending.result()
+                    pending = writer.submit(write_embeddings, client, rows)
+                    total += len(rows)
+
+        if pending is not None:
+            pending.result()
+
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed if elapsed > 0 else float("inf")
+    print(f" Embedded {total} nodes in {elapsed:.2f}s ({rate:.1f} nodes/sec).")
+    return total
+
+def write_local_indexes(chunks, vectors, out_dir, version, partitions=0, model=EMBEDDING_MODEL):
+    """
+    Writes the local vector index used when RAG_RETRIEVER_BACKEND=local and
+    builds the BM25 and typeahead indexes next to it.
+    """
+    build_local_index(chunks, vectors, out_dir, {"model": model, "corpus_version": version}, partitions)
+    print(f" Local index written ({len(chunks)} chunks).")
+
+    # BM25 index over the same chunk rows, used by hybrid retrieval
+    terms = build_sparse_index(out_dir)
+    print(f" Sparse index written ({terms} terms).")
+
+    # Article titles and clause headings for the suggestions endpoint
+    entries = build_typeahead_index(out_dir)
+    print(f" Typeahead index written ({entries} entries).")
+
+def export_local_index(client, out_dir, version, partitions=0, model=EMBEDDING_MODEL):
+    """
+    Dumps every embedded node into the local indexes.
+    """
+    print(f" Building local vector index in {out_dir}...")
+    chunks = []
+    vectors = []
+    with client.session(default_access_mode=READ_ACCESS) as session:
+        records = session.run("""
+            MATCH (n)
+            WHERE (n:Clause OR n:SubClause OR n:Article) AND n.embedding IS NOT NULL
+            RETURN elementId(n) AS id, labels(n)[0] AS label, coalesce(n.text, n.title) AS text,
+                   n {.*, text: null, embedding: null} AS metadata, n.embedding AS embedding
+            ORDER BY id
+        """)
+        for r in records:
+            metadata = {k: v for k, v in r["metadata"].items() if v is not None}
+            metadata.update(chunk_id=r["id"], label=r["label"])
+            chunks.append({"id": r["id"], "label": r["label"], "text": r["text"], "metadata": metadata})
+            vectors.append(r["embedding"])
+
+    if not chunks:
+        print("  Warning: No embedded nodes found, local index not written.")
+        return
+
+    write_local_indexes(chunks, vectors, out_dir, version, partitions, model)
+
+def offline_chunks(rows, model=EMBEDDING_MODEL):
+    """
+    The local index rows straight from the flattened source, with the
+    metadata the Neo4j export would give them. Chunk ids are built from the
+    node keys, since there is no elementId without the graph.
+    """
+    node_rows = {
+        "articles": lambda row: {"title": row["title"], "page": row["page"]},
+        "clauses": lambda row: {"number": row["num"], "article_title": row["article"]},
+        "subclauses": lambda row: {"number": row["num"], "clause_number": row["clause"],
+                                   "article_title": row["article"]},
+    }
+    chunks = []
+    for key, (label, _) in EMBEDDABLE_ROWS.items():
+        for row in rows[key]:
+            text = row["title"] if key == "articles" else row["text"]
+            if not text.strip():
+                continue
+            chunk_id = f"{label}:" + "/".join(str(part) for part in row_key(key, row))
+            metadata = {k: v for k, v in node_rows[key](row).items() if v is not None}
+            metadata.update(content_hash=row["hash"], is_toc=row["is_toc"], embedding_model=model,
+                            chunk_id=chunk_id, label=label)
+            chunks.append({"id": chunk_id, "label": label, "text": text, "metadata": metadata})
+    return chunks
+
+def build_offline_index(rows, embedder, out_dir, version, batch_size=EMBED_BATCH_SIZE, partitions=0,
+                        model=EMBEDDING_MODEL):
+    """
+    Builds the local indexes from the source JSON alone, embedding with the
+    local model, so RAG_RETRIEVER_BACKEND=local and the retrieval benchmark
+    run without Neo4j.
+    """
+    print(f" Building local vector index in {out_dir} without Neo4j...")
+    chunks = offline_chunks(rows, model)
+    started = time.perf_counter()
+    vectors = []
+    for batch in batches([chunk["text"] for chunk in chunks], batch_size):
+        vectors.extend(embedder.embed_documents(batch))
+    print(f" Embedded {len(chunks)} chunks in {time.perf_counter() - started:.2f}s.")
+    write_local_indexes(chunks, vectors, out_dir, version, partitions, model)
+
+def create_vector_indices(client):
     """
     Creates the vector index in Neo4j so the app can query it.
     """
@@ -102,77 +483,104 @@ def create_vector_indices(driver):
     """
     
     try:
-        with driver.session() as session:
+        with client.session() as session:
             session.run(query_index)
         print(f" Vector Index '{VECTOR_INDEX_NAME}' created successfully on :Clause nodes.")
     except Exception as e:
         print(f"  Warning: Could not create index (it might already exist or have a conflict). \nError: {e}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load the legal corpus into Neo4j.")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE,
+                        help="Rows per UNWIND statement during ingestion.")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help="Texts encoded per embed_documents call.")
+    parser.add_argument("--page-size", type=int, default=EMBED_PAGE_SIZE,
+                        help="Nodes read from Neo4j per page during embedding.")
+    parser.add_argument("--local-index-dir", default=str(DEFAULT_INDEX_DIR),
+                        help="Where to write the local vector index.")
+    parser.add_argument("--index-partitions", type=int, default=0,
+                        help="k-means partitions for the local index (0 = flat, fine for a few thousand chunks).")
+    parser.add_argument("--no-local-index", action="store_true",
+                        help="Skip building the local vector index.")
+    parser.add_argument("--offline", action="store_true",
+                        help="Only build the local indexes from the JSON, without Neo4j.")
+    return parser.parse_args()
+
+def load_source_rows():
+    print(f" Loading data from {JSON_FILE_PATH}...")
+    try:
+        with open(JSON_FILE_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        print(f" Error: File {JSON_FILE_PATH} not found.")
+        return None
+    parts = data if isinstance(data, list) else [data]
+    return flatten_parts(parts)
+
 def main():
+    args = parse_args()
+
+    if args.offline:
+        source_rows = load_source_rows()
+        if source_rows is None:
+            return
+        embedder = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        build_offline_index(source_rows, embedder, args.local_index_dir, corpus_version(source_rows),
+                            batch_size=args.embed_batch_size, partitions=args.index_partitions)
+        print(" Success! Local indexes built.")
+        return
+
     if not NEO4J_URI:
         print(" Error: NEO4J_URL not found. Please check your .env file.")
         return
 
     print(" Connecting to Neo4j...")
     try:
-        driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-        driver.verify_connectivity()
+        # Same pool settings as the API; batch writes keep the driver's
+        # managed-transaction retries
+        client = Neo4jClient.from_env(transaction_retry_time=30.0)
+        client.query("RETURN 1")
         print(" Connected.")
     except Exception as e:
         print(f" Connection Failed: {e}")
         return
 
     # 1. Load JSON Data
-    print(f" Loading data from {JSON_FILE_PATH}...")
-    try:
-        with open(JSON_FILE_PATH, encoding="utf-8") as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        print(f" Error: File {JSON_FILE_PATH} not found.")
+    source_rows = load_source_rows()
+    if source_rows is None:
         return
 
     # 2. Create Graph Structure
     print(" Constructing Graph Structure...")
-    with driver.session() as session:
-        if isinstance(data, list):
-            for part in data:
-                session.execute_write(load_data_into_graph, part)
-        else:
-            session.execute_write(load_data_into_graph, data)
+    create_lookup_indexes(client)
+    stale_ids, summary = diff_against_graph(client, source_rows)
+    if stale_ids:
+        print(f"   Removing {len(stale_ids)} nodes no longer in the source...")
+        delete_nodes(client, stale_ids, batch_size=args.batch_size)
+    load_data_into_graph(client, source_rows, batch_size=args.batch_size)
     print(" Graph structure created.")
 
     # 3. Generate Embeddings
     print(" Generating Embeddings (this may take a moment)...")
-    embedder = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
-    
-    # We focus on generating embeddings for Clauses as they are the primary search target
-    # If you need SubClauses searched too, add "SubClause" to this list.
-    node_types = ["Clause", "SubClause", "Article"] 
-
-    with driver.session() as session:
-        for label in node_types:
-            print(f"    Processing {label} nodes...")
-            
-            records = session.run(f"MATCH (n:{label}) RETURN elementId(n) AS id, n.text AS text, n.title AS title")
-            
-            for row in records:
-                text_content = row["text"] or row["title"]
-                node_id = row["id"]
-
-                if not text_content: continue
-                
-                vector = embedder.embed_query(text_content)
-                
-                session.run(
-                    "MATCH (n) WHERE elementId(n) = $id SET n.embedding = $vec", 
-                    {"id": node_id, "vec": vector}
-                )
+    embedder = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    embed_nodes(client, embedder, batch_size=args.embed_batch_size, page_size=args.page_size)
 
     # 4. Create Index (CRITICAL STEP)
-    create_vector_indices(driver)
+    create_vector_indices(client)
+    version = corpus_version(source_rows)
+    write_corpus_version(client, version)
+
+    # 5. Local vector, BM25 and typeahead indexes (RAG_RETRIEVER_BACKEND=local, hybrid retrieval, suggestions)
+    if not args.no_local_index:
+        export_local_index(client, args.local_index_dir, version, partitions=args.index_partitions)
 
     print(" Success! Data loaded, embeddings generated, and INDEX created.")
-    driver.close()
+    print(
+        f" Summary: {summary['added']} added, {summary['updated']} updated, "
+        f"{summary['unchanged']} unchanged, {summary['deleted']} deleted."
+    )
+    client.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
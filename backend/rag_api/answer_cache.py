@@ -0,0 +1,201 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_PATH = Path(__file__).resolve().parent.parent / "answer_cache.sqlite3"
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a question so trivially different spellings share a cache entry:
+    case-folded, whitespace collapsed, trailing punctuation removed.
+    """
+    text = re.sub(r"\s+", " ", question).strip().casefold()
+    return text.rstrip("?!. ")
+
+
+def make_cache_key(question: str, prompt: str, model: str, corpus_version: str) -> str:
+    """
+    Builds the cache key from the normalized question plus everything that can
+    change the answer: the prompt template, the LLM and the corpus version.
+    """
+    payload = json.dumps([normalize_question(question), prompt, model, corpus_version])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InMemoryBackend:
+    """
+    Per-process LRU store with a TTL. Suitable for a single worker.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    LRU store with a TTL kept in a local SQLite file, so every worker process
+    on the host shares the same entries.
+    """
+
+    def __init__(self, path, max_entries: int, ttl: float):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_last_access ON answers (last_access)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value FROM answers WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE answers SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict):
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO answers (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, default=str), now + self.ttl, now),
+        )
+        conn.execute("DELETE FROM answers WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM answers WHERE key IN "
+            "(SELECT key FROM answers ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM answers")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+class AnswerCache:
+    """
+    Exact-match cache for full RAG answers with hit/miss counters.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Answer cache read failed: {str(e)}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: dict):
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning(f"Answer cache write failed: {str(e)}")
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def build_answer_cache():
+    """
+    Builds the answer cache from environment variables.
+
+    RAG_CACHE_BACKEND: "memory" (default), "sqlite" or "none"
+    RAG_CACHE_MAX_ENTRIES: maximum number of cached answers (default 1024)
+    RAG_CACHE_TTL: seconds an answer stays valid (default 86400)
+    RAG_CACHE_PATH: SQLite file used by the "sqlite" backend
+    """
+    backend_name = os.getenv("RAG_CACHE_BACKEND", "memory").lower()
+    max_entries = int(os.getenv("RAG_CACHE_MAX_ENTRIES", "1024"))
+    ttl = float(os.getenv("RAG_CACHE_TTL", "86400"))
+
+    if backend_name == "none":
+        return None
+    if backend_name == "sqlite":
+        path = os.getenv("RAG_CACHE_PATH", str(DEFAULT_SQLITE_PATH))
+        return AnswerCache(SQLiteBackend(path, max_entries, ttl))
+    if backend_name != "memory":
+        raise ValueError(f"Unknown RAG_CACHE_BACKEND: {backend_name}")
+    return AnswerCache(InMemoryBackend(max_entries, ttl))
@@ -0,0 +1,254 @@
+import json
+import logging
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+
+from .content_quality import is_toc_like
+from .graph_context import chunk_ref
+from .metrics import Timings
+from .sparse_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent.parent / "documents" / "PEC.json"
+# Hand-written questions in a user's own words, labeled with their article
+# (and clause, where one clause answers it)
+DEFAULT_HELD_OUT = DEFAULT_CORPUS.parent / "benchmark_queries.json"
+DEFAULT_KS = (1, 3, 5, 10)
+
+# Article titles are turned into questions; rotating the wording keeps the
+# set from rewarding one phrasing
+ARTICLE_TEMPLATES = (
+    "What does the law say about {title}?",
+    "Explain the provisions on {title}.",
+    "What is {title} under the Act?",
+)
+# Clause queries are a window of content terms from the middle of the
+# clause, so they are not a copy of the chunk's opening
+CLAUSE_TEMPLATES = (
+    "Which provision covers {terms}?",
+    "What is the rule on {terms}?",
+)
+CLAUSE_QUERY_TERMS = 6
+MIN_CLAUSE_WORDS = 5
+BOILERPLATE_TERMS = frozenset("whoever person shall punished punishment imprisonment term extend fine rupees both".split())
+
+
+def clause_terms(text: str) -> list:
+    terms = [t for t in tokenize(text) if t not in BOILERPLATE_TERMS]
+    start = max(0, min(len(terms) // 3, len(terms) - CLAUSE_QUERY_TERMS))
+    return terms[start:start + CLAUSE_QUERY_TERMS]
+
+
+def load_held_out(path=DEFAULT_HELD_OUT) -> list:
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    return [
+        {
+            "id": f"held_out:{number}",
+            "kind": "held_out",
+            "query": entry["query"],
+            "article": entry["article"],
+            "clause": entry.get("clause"),
+        }
+        for number, entry in enumerate(entries, start=1)
+    ]
+
+
+def load_queries(corpus_path=DEFAULT_CORPUS, limit: int = None, held_out_path=DEFAULT_HELD_OUT) -> list:
+    """
+    Builds a labeled query set from the corpus JSON.
+
+    Every article gives an "article" query (its title in a question
+    template) answered by any chunk of that article. Every clause gives a
+    "clause" query (a window of its content terms in a question template)
+    answered by that clause or one of its sub-clauses. TOC-like and very
+    short entries are left out. The held-out questions, if a path is given,
+    come first; a "held_out" query without a clause is answered by any chunk
+    of its article.
+    """
+    with open(corpus_path, encoding="utf-8") as f:
+        data = json.load(f)
+    parts = data if isinstance(data, list) else [data]
+
+    queries = load_held_out(held_out_path) if held_out_path else []
+    generated = 0
+    for part in parts:
+        for chapter in part.get("chapters", {}).values():
+            for article in chapter.get("articles", []):
+                title = article.get("title", "").strip()
+                if not title or is_toc_like(title):
+                    continue
+                template = ARTICLE_TEMPLATES[generated % len(ARTICLE_TEMPLATES)]
+                generated += 1
+                queries.append({
+                    "id": f"article:{title}",
+                    "kind": "article",
+                    "query": template.format(title=title.lower()),
+                    "article": title,
+                    "clause": None,
+                })
+
+                for clause in article.get("content", {}).get("clauses", []):
+                    text = clause.get("clause_text", "")
+                    terms = clause_terms(text)
+                    if len(text.split()) < MIN_CLAUSE_WORDS or len(terms) < 3 or is_toc_like(text):
+                        continue
+                    template = CLAUSE_TEMPLATES[generated % len(CLAUSE_TEMPLATES)]
+                    generated += 1
+                    queries.append({
+                        "id": f"clause:{title}{clause.get('clause_number')}",
+                        "kind": "clause",
+                        "query": template.format(terms=" ".join(terms)),
+                        "article": title,
+                        "clause": clause.get("clause_number"),
+                    })
+
+    return queries[:limit] if limit else queries
+
+
+def is_relevant(query: dict, metadata: dict) -> bool:
+    ref = chunk_ref(metadata)
+    if ref is None or ref[0] != query["article"]:
+        return False
+    return query["clause"] is None or ref[1] == query["clause"]
+
+
+def first_relevant_rank(query: dict, retrieved: list):
+    """
+    1-based rank of the first relevant chunk in a list of chunk metadata,
+    or None.
+    """
+    for rank, metadata in enumerate(retrieved, start=1):
+        if is_relevant(query, metadata):
+            return rank
+    return None
+
+
+def score(ranks: list, ks: tuple) -> dict:
+    """
+    recall@k (the share of queries with a relevant chunk in the top k; each
+    query has one target) and MRR over the retrieved depth.
+    """
+    n = len(ranks)
+    if not n:
+        return {"queries": 0}
+    metrics = {"queries": n}
+    for k in ks:
+        metrics[f"recall@{k}"] = round(sum(1 for r in ranks if r is not None and r <= k) / n, 4)
+    metrics["mrr"] = round(sum(1.0 / r for r in ranks if r is not None) / n, 4)
+    return metrics
+
+
+def latency_summary(samples: dict) -> dict:
+    return {
+        stage: {
+            "p50": round(float(np.percentile(values, 50)), 3),
+            "p95": round(float(np.percentile(values, 95)), 3),
+            "p99": round(float(np.percentile(values, 99)), 3),
+            "mean": round(float(np.mean(values)), 3),
+        }
+        for stage, values in sorted(samples.items())
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmark(service, queries: list, ks: tuple = DEFAULT_KS, end_to_end: bool = False,
+                  warmup: int = 3, include_queries: bool = False) -> dict:
+    """
+    Runs every query against the service's configured retriever and returns
+    a JSON-serializable report.
+
+    By default only retrieval runs (embed, dense/sparse search, fusion,
+    rerank) with top_k raised to max(ks). With end_to_end the full query()
+    path runs, prompt and LLM included, so the service should be configured
+    with the local LLM and without answer caches.
+    """
+    depth = max(ks)
+    service.top_k = max(service.top_k, depth)
+
+    def retrieve(question: str):
+        if end_to_end:
+            result = service.query(question)
+            if not result.get("success"):
+                raise RuntimeError(result.get("error"))
+            return [source["metadata"] for source in result["sources"]], result["timings"]
+        timings = Timings()
+        with timings.span("embed"):
+            embedding = service.embeddings.embed_query(question)
+        docs = service._retrieve(question, embedding, timings)
+        return [doc.metadata for doc in docs], timings.finish()
+
+    # Model loading and first-call costs stay out of the numbers
+    for query in queries[:warmup]:
+        retrieve(query["query"] + " (warm up)")
+
+    ranks = {"all": []}
+    samples = {}
+    per_query = []
+    failures = 0
+    started = time.perf_counter()
+    for query in queries:
+        try:
+            retrieved, stage_ms = retrieve(query["query"])
+        except Exception as e:
+            failures += 1
+            logger.warning(f"Benchmark query failed ({query['id']}): {str(e)}")
+            continue
+        rank = first_relevant_rank(query, retrieved[:depth])
+        ranks["all"].append(rank)
+        ranks.setdefault(query["kind"], []).append(rank)
+        for stage, ms in stage_ms.items():
+            samples.setdefault(stage, []).append(ms)
+        if include_queries:
+            per_query.append({"id": query["id"], "query": query["query"], "rank": rank})
+
+    report = {
+        "commit": git_commit(),
+        "config": {
+            "retriever_backend": service.retriever_backend,
+            "hybrid": service.hybrid is not None,
+            "rerank": service.reranker is not None,
+            "depth": depth,
+            "end_to_end": end_to_end,
+            "corpus_version": service.corpus_version(),
+        },
+        "queries": len(queries),
+        "failures": failures,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "metrics": {kind: score(kind_ranks, ks) for kind, kind_ranks in ranks.items()},
+        "latency_ms": latency_summary(samples),
+    }
+    if include_queries:
+        report["per_query"] = per_query
+    return report
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """
+    Metric and p95 latency deltas of a report against an earlier one
+    (positive = higher than the baseline).
+    """
+    deltas = {}
+    for kind, metrics in report["metrics"].items():
+        base = baseline.get("metrics", {}).get(kind, {})
+        for name, value in metrics.items():
+            if name != "queries" and name in base:
+                deltas[f"{kind}.{name}"] = round(value - base[name], 4)
+    for stage, summary in report["latency_ms"].items():
+        base = baseline.get("latency_ms", {}).get(stage)
+        if base:
+            deltas[f"latency.{stage}.p95"] = round(summary["p95"] - base["p95"], 3)
+    return deltas
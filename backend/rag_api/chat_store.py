@@ -0,0 +1,311 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import ChatMessage, ChatSession
+
+logger = logging.getLogger(__name__)
+
+# Session columns the chat endpoints need: identity plus multi-turn state
+SESSION_FIELDS = ('session_id', 'title', 'user_id', 'summary', 'last_chunk_ids')
+
+
+def session_title(question: str) -> str:
+    # Title = first 50 chars of question
+    return question[:50] + "..." if len(question) > 50 else question
+
+
+class ChatStore:
+    """
+    Persists one question/answer exchange per request.
+
+    A new session is only built in memory when the question arrives; the
+    session insert, both messages (one bulk_create) and the session's
+    updated_at touch are written together in one transaction once the
+    answer exists. With write_behind=True the exchange is queued and a
+    background thread writes queued exchanges in batches, so nothing is
+    written on the request path. Exchanges not yet flushed are invisible
+    to the history endpoints for up to flush_interval seconds, but
+    get_session() already returns a queued session with its latest
+    multi-turn state. That bookkeeping is per process, so write-behind
+    needs a single worker (see build_chat_store).
+
+    A batch that fails is retried once, then its exchanges are written one
+    by one; only exchanges that still fail are dropped and counted.
+    """
+
+    def __init__(self, write_behind: bool = False, batch_size: int = 100,
+                 flush_interval: float = 0.2, max_pending: int = 10000):
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # session_id -> (session, queued exchanges) for sessions whose insert
+        # or multi-turn state is still in the queue; the latest state wins
+        self._pending_sessions = {}
+        self.exchanges = 0
+        self.batches = 0
+        self.overflow = 0
+        self.failed = 0
+        self._queue = None
+
+        if write_behind:
+            self._queue = queue.Queue(maxsize=max_pending)
+            self._worker = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+            self._worker.start()
+            atexit.register(self.flush)
+
+    # Sessions
+
+    def new_session(self, user, question: str) -> ChatSession:
+        """
+        Returns an unsaved session; it is inserted with its first exchange.
+        """
+        return ChatSession(user=user, title=session_title(question))
+
+    def _pending(self, user, session_id):
+        with self._lock:
+            entry = self._pending_sessions.get(str(session_id))
+        if entry is not None and entry[0].user_id == user.pk:
+            return entry[0]
+        return None
+
+    def get_session(self, user, session_id) -> ChatSession:
+        """
+        Returns the user's session, as left by its latest exchange when that
+        is still waiting in the write-behind queue. Raises
+        ChatSession.DoesNotExist otherwise.
+        """
+        pending = self._pending(user, session_id)
+        if pending is not None:
+            return pending
+        try:
+            return ChatSession.objects.only(*SESSION_FIELDS).get(session_id=session_id, user=user)
+        except ValidationError:
+            raise ChatSession.DoesNotExist()
+
+    async def aget_session(self, user, session_id) -> ChatSession:
+        pending = self._pending(user, session_id)
+        if pending is not None:
+            return pending
+        try:
+            return await ChatSession.objects.only(*SESSION_FIELDS).aget(session_id=session_id, user=user)
+        except ValidationError:
+            raise ChatSession.DoesNotExist()
+
+    @staticmethod
+    def history(session: ChatSession) -> dict:
+        """
+        The session's multi-turn state, as RAGService.query expects it.
+        """
+        return {"summary": session.summary, "chunk_ids": session.last_chunk_ids}
+
+    # Writes
+
+    def _exchange(self, session: ChatSession, question: str, answer: str, new_session: bool,
+                  conversation: dict):
+        if conversation is not None:
+            session.summary = conversation["summary"]
+            session.last_chunk_ids = conversation["chunk_ids"]
+        return (session, new_session, conversation is not None, [
+            ChatMessage(session=session, role='user', content=question),
+            ChatMessage(session=session, role='assistant', content=answer),
+        ])
+
+    def _enqueue(self, exchange) -> bool:
+        """
+        Hands an exchange to the write-behind worker without blocking.
+        Returns False when the caller has to write it: write-behind is off
+        or the queue is full.
+        """
+        if self._queue is None:
+            return False
+        with self._lock:
+            try:
+                self._queue.put_nowait(exchange)
+            except queue.Full:
+                self.overflow += 1
+                return False
+            session, new_session, has_state, _ = exchange
+            if new_session or has_state:
+                key = str(session.session_id)
+                _, queued = self._pending_sessions.get(key, (None, 0))
+                self._pending_sessions[key] = (session, queued + 1)
+            return True
+
+    def _settle(self, exchanges: list):
+        # Queued exchanges are written (or given up on): stop serving their
+        # sessions from memory once nothing else for them is queued
+        with self._lock:
+            for session, new_session, has_state, _ in exchanges:
+                if not (new_session or has_state):
+                    continue
+                key = str(session.session_id)
+                latest, queued = self._pending_sessions.get(key, (None, 0))
+                if queued <= 1:
+                    self._pending_sessions.pop(key, None)
+                else:
+                    self._pending_sessions[key] = (latest, queued - 1)
+
+    def _write_now(self, exchange):
+        # Back-pressure on a full queue: drain it (it may hold this session's
+        # insert) and write on the caller's thread rather than drop messages
+        self.flush()
+        self._write([exchange])
+
+    def save_exchange(self, session: ChatSession, question: str, answer: str, new_session: bool = False,
+                      conversation: dict = None):
+        """
+        Saves both messages; conversation (the "conversation" entry of a RAG
+        result) also updates the session's summary and last chunk ids.
+        """
+        exchange = self._exchange(session, question, answer, new_session, conversation)
+        if not self._enqueue(exchange):
+            self._write_now(exchange)
+
+    async def asave_exchange(self, session: ChatSession, question: str, answer: str, new_session: bool = False,
+                             conversation: dict = None):
+        exchange = self._exchange(session, question, answer, new_session, conversation)
+        if not self._enqueue(exchange):
+            # flush() blocks and _write() uses the sync ORM: keep both off the event loop
+            await sync_to_async(self._write_now)(exchange)
+
+    def _write(self, exchanges: list):
+        """
+        Writes exchanges in one transaction: new sessions, every message in
+        one bulk_create, and one updated_at touch for existing sessions
+        (per session when its multi-turn state changed).
+        """
+        new_sessions = {}
+        touched = set()
+        changed = {}
+        messages = []
+        for session, is_new, has_state, exchange_messages in exchanges:
+            if is_new:
+                new_sessions[session.session_id] = session
+            elif has_state:
+                # The latest exchange's state wins
+                changed[session.session_id] = session
+            else:
+                touched.add(session.session_id)
+            messages.extend(exchange_messages)
+
+        now = timezone.now()
+        with transaction.atomic():
+            if new_sessions:
+                ChatSession.objects.bulk_create(list(new_sessions.values()))
+            ChatMessage.objects.bulk_create(messages)
+            for session_id, session in changed.items():
+                if session_id not in new_sessions:
+                    ChatSession.objects.filter(session_id=session_id).update(
+                        updated_at=now, summary=session.summary, last_chunk_ids=session.last_chunk_ids
+                    )
+            touched -= set(new_sessions) | set(changed)
+            if touched:
+                ChatSession.objects.filter(session_id__in=touched).update(updated_at=now)
+
+        with self._lock:
+            self.exchanges += len(exchanges)
+            self.batches += 1
+
+    # Write-behind worker
+
+    def _drain(self, first) -> list:
+        batch = [first]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            # Let a burst accumulate into one batch
+            time.sleep(self.flush_interval)
+            batch = self._drain(first)
+            try:
+                self._write_batch(batch)
+            finally:
+                self._settle(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch: list):
+        close_old_connections()
+        try:
+            self._write(batch)
+            return
+        except Exception as e:
+            logger.warning(f"Chat write-behind batch of {len(batch)} exchanges failed, retrying: {str(e)}")
+
+        # The connection may have dropped: retry once, then isolate the
+        # exchanges that cannot be written so the rest of the batch survives
+        time.sleep(self.flush_interval)
+        close_old_connections()
+        try:
+            self._write(batch)
+            return
+        except Exception as e:
+            logger.warning(f"Chat write-behind retry failed, writing {len(batch)} exchanges one by one: {str(e)}")
+
+        failed = 0
+        for exchange in batch:
+            try:
+                self._write([exchange])
+            except Exception as e:
+                failed += 1
+                logger.error(f"Chat write-behind dropped an exchange for session {exchange[0].session_id}: {str(e)}")
+        if failed:
+            with self._lock:
+                self.failed += failed
+            logger.error(f"Chat write-behind dropped {failed} of {len(batch)} exchanges")
+
+    def flush(self):
+        """
+        Blocks until every queued exchange has been written.
+        """
+        if self._queue is not None:
+            self._queue.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "write_behind": self.write_behind,
+                "pending": self._queue.qsize() if self._queue is not None else 0,
+                "exchanges": self.exchanges,
+                "batches": self.batches,
+                "overflow": self.overflow,
+                "failed": self.failed,
+            }
+
+
+def build_chat_store():
+    """
+    RAG_CHAT_WRITE_BEHIND=1 queues chat writes for a background thread;
+    RAG_CHAT_BATCH_SIZE, RAG_CHAT_FLUSH_INTERVAL and RAG_CHAT_MAX_PENDING
+    tune it. Queued sessions are only visible to the process that queued
+    them, so write-behind is refused when WEB_CONCURRENCY (read by uvicorn
+    and gunicorn) asks for more than one worker.
+    """
+    write_behind = os.getenv("RAG_CHAT_WRITE_BEHIND", "0") == "1"
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if write_behind and workers > 1:
+        raise ImproperlyConfigured(
+            f"RAG_CHAT_WRITE_BEHIND=1 needs a single worker process, WEB_CONCURRENCY is {workers}"
+        )
+    return ChatStore(
+        write_behind=write_behind,
+        batch_size=int(os.getenv("RAG_CHAT_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("RAG_CHAT_FLUSH_INTERVAL", "0.2")),
+        max_pending=int(os.getenv("RAG_CHAT_MAX_PENDING", "10000")),
+    )
@@ -0,0 +1,18 @@
+import re
+
+# "301. ", "302. " ... entries of a table of contents or section index
+SECTION_ENTRY = re.compile(r"\d+\.\s")
+
+
+def is_toc_like(text: str) -> bool:
+    """
+    True for table-of-contents / index pages that carry no legal content.
+    Computed once at ingest and stored as `is_toc` on each node.
+    """
+    # Pages that explicitly say "CONTENTS" (case insensitive)
+    if "CONTENTS" in text.upper():
+        return True
+
+    # Lists of sections (e.g. "301. ... 302. ..."): more than 3 entries
+    # means it is most likely an index page
+    return len(SECTION_ENTRY.findall(text)) > 3
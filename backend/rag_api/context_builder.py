@@ -0,0 +1,165 @@
+import logging
+import re
+import threading
+
+from .sparse_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Sentence-ish units: sentence ends, clause separators and line breaks
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.;:])\s+|\n+")
+
+# Sentences shorter than this are kept even when repeated ("(a)", "Provided that")
+MIN_DEDUP_WORDS = 4
+
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in SENTENCE_BOUNDARY.split(text) if s and s.strip()]
+
+
+def _dedup_key(sentence: str) -> str:
+    return " ".join(sentence.lower().split())
+
+
+class TokenCounter:
+    """
+    Counts tokens with a local Hugging Face tokenizer, falling back to a
+    four-characters-per-token estimate when transformers or the tokenizer
+    files are unavailable.
+    """
+
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name
+        self.tokenizer = None
+        if model_name:
+            try:
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+            except Exception as e:
+                logger.warning(f"Could not load tokenizer {model_name}, estimating tokens: {str(e)}")
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    def count_many(self, texts: list) -> list:
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [max(1, len(text) // 4) for text in texts]
+        encoded = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+
+class ContextBuilder:
+    """
+    Assembles the prompt context under a token budget.
+
+    Chunks are taken in retrieval order. Sentences already seen in a higher
+    ranked chunk (repeated headers, provisos, boilerplate) are dropped, a
+    chunk longer than max_chunk_tokens keeps only its sentences that share
+    the most terms with the question, and assembly stops at token_budget.
+    """
+
+    def __init__(self, counter: TokenCounter, token_budget: int = 1500, max_chunk_tokens: int = 400):
+        self.counter = counter
+        self.token_budget = token_budget
+        self.max_chunk_tokens = max_chunk_tokens
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.total_context_tokens = 0
+        self.total_prompt_tokens = 0
+        self.max_prompt_tokens = 0
+
+    def _extract(self, question_terms: set, sentences: list, counts: list, limit: int) -> list:
+        """
+        Returns the indices of the most query-relevant sentences fitting in
+        limit tokens, in their original order. The first sentence usually
+        names the clause, so it wins ties.
+        """
+        ranked = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(question_terms & set(tokenize(sentences[i]))), i)
+        )
+        keep = []
+        used = 0
+        for i in ranked:
+            if used + counts[i] <= limit:
+                keep.append(i)
+                used += counts[i]
+        return sorted(keep)
+
+    def build(self, question: str, docs: list):
+        """
+        Returns (context_text, stats).
+        """
+        question_terms = set(tokenize(question))
+        seen = set()
+        blocks = []
+        stats = {
+            "chunks_in": len(docs),
+            "chunks_used": 0,
+            "chunks_trimmed": 0,
+            "duplicate_sentences": 0,
+            "original_tokens": 0,
+            "context_tokens": 0,
+            "token_budget": self.token_budget,
+        }
+
+        for doc in docs:
+            remaining = self.token_budget - stats["context_tokens"]
+            if remaining <= 0:
+                break
+
+            sentences = []
+            for sentence in split_sentences(doc.page_content):
+                key = _dedup_key(sentence)
+                if len(key.split()) >= MIN_DEDUP_WORDS:
+                    if key in seen:
+                        stats["duplicate_sentences"] += 1
+                        continue
+                    seen.add(key)
+                sentences.append(sentence)
+            if not sentences:
+                continue
+
+            counts = self.counter.count_many(sentences)
+            stats["original_tokens"] += self.counter.count(doc.page_content)
+            limit = min(remaining, self.max_chunk_tokens)
+            if sum(counts) > limit:
+                keep = self._extract(question_terms, sentences, counts, limit)
+                if not keep:
+                    continue
+                stats["chunks_trimmed"] += 1
+                sentences = [sentences[i] for i in keep]
+                counts = [counts[i] for i in keep]
+
+            blocks.append(" ".join(sentences))
+            stats["context_tokens"] += sum(counts)
+            stats["chunks_used"] += 1
+
+        return "\n\n".join(blocks), stats
+
+    def record(self, stats: dict, prompt_tokens: int):
+        stats["prompt_tokens"] = prompt_tokens
+        with self._lock:
+            self.requests += 1
+            self.total_context_tokens += stats.get("context_tokens", 0)
+            self.total_prompt_tokens += prompt_tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+        logger.info(
+            f"Prompt: {prompt_tokens} tokens, context {stats.get('context_tokens', 0)}/"
+            f"{stats.get('token_budget')} from {stats.get('chunks_used', 0)} chunks"
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.requests
+            return {
+                "tokenizer": self.counter.model_name if self.counter.tokenizer is not None else "estimate",
+                "token_budget": self.token_budget,
+                "max_chunk_tokens": self.max_chunk_tokens,
+                "requests": requests,
+                "avg_context_tokens": round(self.total_context_tokens / requests, 1) if requests else 0.0,
+                "avg_prompt_tokens": round(self.total_prompt_tokens / requests, 1) if requests else 0.0,
+                "max_prompt_tokens": self.max_prompt_tokens,
+            }
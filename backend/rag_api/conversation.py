@@ -0,0 +1,146 @@
+import logging
+import re
+import threading
+
+from .sparse_index import STOPWORDS, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Pronouns that only make sense with an earlier turn
+REFERENCE_PRONOUNS = frozenset("it its they them their theirs".split())
+# Demonstratives refer back only when they stand alone ("the punishment for
+# that?"); followed by a noun ("this law") they are determiners
+DEMONSTRATIVES = frozenset("this that these those same above former latter".split())
+
+FOLLOW_UP_OPENERS = ("and ", "also ", "what about ", "how about ", "what if ")
+
+# Filler, and words so common in the corpus that they say nothing about the
+# topic or about whether earlier chunks cover a question
+FILLER_WORDS = frozenset("""
+that this it its those these they them their theirs such same above former latter
+about also else more then too tell me explain
+""".split())
+GENERIC_TERMS = frozenset("""
+article articles section sections clause clauses sub act acts law laws ordinance code
+offence offences offense offenses provision provisions chapter part rule rules pakistan person
+""".split())
+
+SUMMARY_SEPARATOR = " / "
+
+
+def content_terms(text: str) -> set:
+    return set(tokenize(text)) - FILLER_WORDS - GENERIC_TERMS
+
+
+class Conversation:
+    """
+    Multi-turn support for the chat endpoints.
+
+    A question that refers back ("is it bailable?", "and the punishment for
+    that?") and brings no new topic (no numbers, no names and at most
+    max_new_terms words that are not in the summary) is a follow-up. Its
+    standalone form, the question plus the session summary, is what gets
+    searched; the LLM still sees the user's own wording. The summary is the
+    session's anchor question followed by its latest follow-ups, kept under
+    summary_chars, so the history cost per request is bounded however long
+    the chat gets.
+
+    A follow-up may reuse the previous turn's chunks instead of a fresh
+    search when those chunks already contain reuse_coverage of its own
+    (non-generic) terms.
+    """
+
+    def __init__(self, summary_chars: int = 300, reuse_coverage: float = 0.8, max_new_terms: int = 2):
+        self.summary_chars = summary_chars
+        self.reuse_coverage = reuse_coverage
+        self.max_new_terms = max_new_terms
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.follow_ups = 0
+        self.reused = 0
+        self.reuse_misses = 0
+
+    def is_follow_up(self, question: str, summary: str) -> bool:
+        words = re.findall(r"[A-Za-z0-9]+", question)
+        lower = [w.lower() for w in words]
+        if not lower or not summary:
+            return False
+
+        refers_back = (
+            (" ".join(lower) + " ").startswith(FOLLOW_UP_OPENERS)
+            or any(w in REFERENCE_PRONOUNS for w in lower)
+            or any(
+                w in DEMONSTRATIVES and (i + 1 == len(lower) or lower[i + 1] in STOPWORDS)
+                for i, w in enumerate(lower)
+            )
+        )
+        if not refers_back:
+            return False
+
+        # A number ("Article 25") or a name the conversation has not seen yet
+        # starts a new topic
+        known = set(tokenize(summary))
+        if any(any(c.isdigit() for c in w) for w in lower):
+            return False
+        if any(len(w) > 1 and w[0].isupper() and w.lower() not in known for w in words[1:]):
+            return False
+        return len(content_terms(question) - known) <= self.max_new_terms
+
+    def rewrite(self, question: str, summary: str):
+        """
+        Returns (standalone_question, follow_up).
+        """
+        follow_up = self.is_follow_up(question, summary)
+        with self._lock:
+            self.turns += 1
+            if follow_up:
+                self.follow_ups += 1
+        if not follow_up:
+            return question, False
+        standalone = f"{question.strip()} (follow-up to: {summary})"
+        logger.info(f"Rewrote follow-up question: {standalone}")
+        return standalone, True
+
+    def update_summary(self, summary: str, question: str, follow_up: bool) -> str:
+        """
+        A new topic replaces the summary; a follow-up is appended, dropping
+        the oldest follow-ups (never the anchor) to stay under summary_chars.
+        """
+        question = " ".join(question.split())
+        if not follow_up or not summary:
+            return question[:self.summary_chars]
+
+        anchor, *recent = summary.split(SUMMARY_SEPARATOR)
+        recent.append(question)
+        while recent and len(SUMMARY_SEPARATOR.join([anchor] + recent)) > self.summary_chars:
+            recent.pop(0)
+        return SUMMARY_SEPARATOR.join([anchor] + recent)[:self.summary_chars]
+
+    def covers(self, question: str, docs: list) -> bool:
+        """
+        True when the previous turn's chunks contain enough of the follow-up's
+        own terms to answer it without a fresh search.
+        """
+        terms = content_terms(question)
+        if terms and docs:
+            found = set()
+            for doc in docs:
+                found.update(terms.intersection(tokenize(doc.page_content)))
+            covered = len(found) / len(terms) >= self.reuse_coverage
+        else:
+            covered = bool(docs)
+        with self._lock:
+            if covered:
+                self.reused += 1
+            else:
+                self.reuse_misses += 1
+        return covered
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "follow_ups": self.follow_ups,
+                "chunks_reused": self.reused,
+                "reuse_misses": self.reuse_misses,
+            }
@@ -0,0 +1,82 @@
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Memoizing wrapper around an Embeddings model.
+
+    Vectors are stored as float32 arrays in an LRU keyed by the
+    whitespace-normalized text, so repeated queries, suggestion keystrokes
+    and health probes skip the transformer forward pass.
+    """
+
+    def __init__(self, base: Embeddings, max_entries: int = 4096):
+        self.base = base
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def _put(self, key: str, vector):
+        with self._lock:
+            self._entries[key] = np.asarray(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def embed_query(self, text: str) -> list:
+        key = normalize_text(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.base.embed_query(key)
+            self._put(key, vector)
+            return list(vector)
+        return vector.tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [normalize_text(text) for text in texts]
+        vectors = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            vector = self._get(key)
+            if vector is None:
+                missing.append(key)
+            else:
+                vectors[key] = vector.tolist()
+
+        if missing:
+            for key, vector in zip(missing, self.base.embed_documents(missing)):
+                self._put(key, vector)
+                vectors[key] = list(vector)
+
+        return [vectors[key] for key in keys]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,129 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One round trip for all retrieved chunks: the parent article, its chapter,
+# the matched clause (every clause for an article-level hit) and the
+# clause's sub-clauses.
+GRAPH_CONTEXT_QUERY = """
+UNWIND $refs AS ref
+MATCH (a:Article {title: ref.article})
+OPTIONAL MATCH (ch:Chapter)-[:HAS_ARTICLE]->(a)
+OPTIONAL MATCH (a)-[:HAS_CLAUSE]->(cl:Clause)
+WHERE ref.clause IS NULL OR cl.number = ref.clause
+OPTIONAL MATCH (cl)-[:HAS_SUBCLAUSE]->(s:SubClause)
+WITH ref, a, ch, cl, collect(s {.number, .text}) AS sub_clauses
+RETURN ref.rank AS rank, a.title AS article, a.page AS page,
+       ch.name AS chapter, ch.title AS chapter_title,
+       collect(cl {.number, .text, sub_clauses: sub_clauses}) AS clauses
+ORDER BY rank
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English legal text
+    return max(1, len(text) // 4)
+
+
+def chunk_ref(metadata: dict):
+    """
+    Maps a retrieved chunk to (article_title, clause_number); the clause is
+    None for an Article chunk. SubClause chunks resolve to their parent
+    clause, so a clause and its sub-clauses collapse into one reference.
+    """
+    if metadata.get("clause_number") is not None:
+        return metadata.get("article_title"), metadata["clause_number"]
+    if metadata.get("article_title") is not None:
+        return metadata["article_title"], metadata.get("number")
+    if metadata.get("title") is not None:
+        return metadata["title"], None
+    return None
+
+
+def citation(article: str, chapter: str = None, chapter_title: str = None, clause: str = None) -> str:
+    parts = []
+    if chapter:
+        parts.append(f"{chapter} ({chapter_title})" if chapter_title else chapter)
+    parts.append(f"Article: {article}")
+    if clause:
+        parts.append(f"Clause {clause}")
+    return " > ".join(parts)
+
+
+class GraphContextBuilder:
+    """
+    Builds a citation-annotated context from the Part/Chapter/Article/Clause
+    graph instead of concatenating raw chunk text.
+    """
+
+    def __init__(self, run_query, token_budget: int = 1500, count_tokens=estimate_tokens):
+        # run_query(cypher, params) -> list of dict rows
+        self.run_query = run_query
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens
+
+    def fetch(self, docs: list) -> list:
+        refs = []
+        seen = set()
+        for doc in docs:
+            ref = chunk_ref(doc.metadata)
+            if ref is None or ref in seen:
+                continue
+            seen.add(ref)
+            refs.append({"rank": len(refs), "article": ref[0], "clause": ref[1]})
+        if not refs:
+            return []
+        return self.run_query(GRAPH_CONTEXT_QUERY, {"refs": refs})
+
+    def build(self, docs: list):
+        """
+        Returns (context_text, citations) where citations maps
+        (article, clause) to its citation string.
+        """
+        rows = self.fetch(docs)
+
+        # Merge rows per article, keeping retrieval order and dropping
+        # clauses already included through another chunk
+        articles = {}
+        for row in rows:
+            entry = articles.setdefault(row["article"], {"row": row, "clauses": {}})
+            for clause in row["clauses"]:
+                entry["clauses"].setdefault(clause["number"], clause)
+
+        blocks = []
+        citations = {}
+        used = 0
+        for article, entry in articles.items():
+            row = entry["row"]
+            header = f"[{citation(article, row['chapter'], row['chapter_title'])}]"
+            clauses = []
+            for number, clause in entry["clauses"].items():
+                subs = sorted(clause.get("sub_clauses") or [], key=lambda s: s.get("number") or "")
+                text = "\n".join(
+                    [f"{number} {clause.get('text') or ''}".strip()]
+                    + [f"   {s.get('number') or ''} {s.get('text') or ''}".rstrip() for s in subs]
+                )
+                clauses.append((number, text, self.count_tokens(text)))
+
+            # The header is only worth its tokens with at least one clause
+            # under it; an article whose first clause does not fit is skipped
+            cost = self.count_tokens(header) + (clauses[0][2] if clauses else 0)
+            if used + cost > self.token_budget:
+                continue
+            lines = [header]
+            citations[(article, None)] = citation(article, row["chapter"], row["chapter_title"])
+            used += self.count_tokens(header)
+
+            for number, text, cost in clauses:
+                if used + cost > self.token_budget:
+                    break
+                lines.append(text)
+                citations[(article, number)] = citation(article, row["chapter"], row["chapter_title"], number)
+                used += cost
+
+            blocks.append("\n".join(lines))
+            if used >= self.token_budget:
+                break
+
+        logger.info(f"Graph context: {len(blocks)} articles, ~{used} tokens")
+        return "\n\n".join(blocks), citations
@@ -0,0 +1,73 @@
+import time
+
+
+def reciprocal_rank_fusion(ranked_lists: list, rrf_k: int = 60) -> list:
+    """
+    Merges ranked candidate lists with weighted reciprocal-rank fusion.
+
+    ranked_lists: [(weight, [(key, item), ...]), ...], best first
+    Returns [(key, item, score)] sorted by fused score, where
+    score = sum(weight / (rrf_k + rank)) over the lists containing the key.
+    """
+    scores = {}
+    items = {}
+    for weight, ranked in ranked_lists:
+        for rank, (key, item) in enumerate(ranked, start=1):
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+            items.setdefault(key, item)
+    return sorted(
+        ((key, items[key], score) for key, score in scores.items()),
+        key=lambda entry: entry[2],
+        reverse=True,
+    )
+
+
+def _doc_key(doc) -> str:
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+class HybridRetriever:
+    """
+    Dense + BM25 first-stage retrieval fused with reciprocal-rank fusion.
+    """
+
+    def __init__(self, sparse_index, dense_weight: float = 1.0, sparse_weight: float = 1.0,
+                 candidates: int = 20, rrf_k: int = 60):
+        self.sparse_index = sparse_index
+        self.dense_weight = dense_weight
+        self.sparse_weight = sparse_weight
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+    def fuse(self, dense_docs: list, sparse_docs: list, k: int) -> list:
+        fused = reciprocal_rank_fusion(
+            [
+                (self.dense_weight, [(_doc_key(doc), doc) for doc in dense_docs]),
+                (self.sparse_weight, [(_doc_key(doc), doc) for doc in sparse_docs]),
+            ],
+            rrf_k=self.rrf_k,
+        )
+        return [doc for _, doc, _ in fused[:k]]
+
+    def retrieve(self, question: str, dense_search, k: int):
+        """
+        dense_search(n) returns the top n dense candidates.
+
+        Returns (docs, timings) where timings holds the dense, sparse and
+        fusion latency in milliseconds.
+        """
+        timings = {}
+
+        started = time.perf_counter()
+        dense_docs = dense_search(self.candidates)
+        timings["dense_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        sparse_docs = self.sparse_index.search_documents(question, self.candidates)
+        timings["sparse_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        docs = self.fuse(dense_docs, sparse_docs, k)
+        timings["fusion_ms"] = (time.perf_counter() - started) * 1000
+
+        return docs, timings
@@ -0,0 +1,114 @@
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Fixed replies, worded exactly as in the prompt template rules
+GREETING_REPLY = "Hello! How can I assist you with Pakistani or Islamic law today?"
+NON_ENGLISH_REPLY = "Please enter your query in English."
+
+GREETING_WORDS = frozenset("""
+hi hii hello helo hey heya hiya yo salam salaam slam assalam asalam assalamu assalamualaikum
+asalamualaikum assalamoalaikum aoa alaikum alaykum walaikum
+""".split())
+# Greet only as "good <time of day>"
+TIMES_OF_DAY = frozenset("morning afternoon evening day".split())
+# Words that can follow a greeting ("hi there", "salam o alaikum") but are
+# not greetings on their own
+GREETING_MODIFIERS = frozenset("o there sir madam bro all everyone".split())
+
+# Common Roman Urdu function words that do not occur in English questions
+ROMAN_URDU_WORDS = frozenset("""
+kya kia hai hain hy ka ki ke mein mai ko se aur nahi nahin kaise kese kyun kyu kab kahan
+kon kaun mujhe mujhy hum ap aap apna karna karta karte hota hoti hote tha thi gaya wala wali
+batao bataen bataiye chahiye sakta sakti agar lekin ya bhi
+""".split())
+
+# Arabic script, which covers Urdu
+ARABIC_SCRIPT = re.compile(r"[؀-ۿݐ-ݿﭐ-﷿ﹰ-﻿]")
+WORD = re.compile(r"[^\W\d_]+")
+
+
+def is_greeting(words: list) -> bool:
+    """
+    True when words is nothing but a greeting, optionally followed by
+    modifiers such as "there" or "sir".
+    """
+    greeted = False
+    after_good = False
+    for word in words:
+        if word in GREETING_WORDS or (after_good and word in TIMES_OF_DAY):
+            greeted = True
+        elif not (word == "good" or (greeted and word in GREETING_MODIFIERS)):
+            return False
+        after_good = word == "good"
+    return greeted and not after_good
+
+
+def classify(question: str):
+    """
+    Returns "greeting", "non_english" or None for a question that should go
+    through retrieval. Only cheap local checks; anything ambiguous is None.
+    """
+    letters = [c for c in question if c.isalpha()]
+    if not letters:
+        return None
+
+    if len(ARABIC_SCRIPT.findall(question)) / len(letters) > 0.3:
+        return "non_english"
+
+    words = WORD.findall(question.lower())
+    if len(words) <= 6 and is_greeting(words):
+        return "greeting"
+
+    urdu = sum(1 for w in words if w in ROMAN_URDU_WORDS)
+    if urdu >= 2 and urdu / len(words) >= 0.3:
+        return "non_english"
+
+    return None
+
+
+class IntentGate:
+    """
+    Answers greetings and non-English input with the template's fixed replies
+    before any embedding, retrieval or LLM call.
+    """
+
+    REPLIES = {"greeting": GREETING_REPLY, "non_english": NON_ENGLISH_REPLY}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.counts = {intent: 0 for intent in self.REPLIES}
+
+    def check(self, question: str):
+        """
+        Returns the canned result for a short-circuited question, else None.
+        """
+        intent = classify(question)
+        with self._lock:
+            self.checked += 1
+            if intent is not None:
+                self.counts[intent] += 1
+        if intent is None:
+            return None
+
+        logger.info(f"Intent gate: answered {intent} without retrieval")
+        return {
+            "answer": self.REPLIES[intent],
+            "sources": [],
+            "success": True,
+            "num_sources": 0,
+            "intent": intent
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            short_circuited = sum(self.counts.values())
+            return dict(
+                self.counts,
+                checked=self.checked,
+                short_circuited=short_circuited,
+                short_circuit_rate=round(short_circuited / self.checked, 4) if self.checked else 0.0,
+            )
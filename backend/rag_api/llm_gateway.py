@@ -0,0 +1,419 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limited, or the provider is briefly unavailable
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMBusyError(Exception):
+    """
+    Raised when a request cannot get an LLM slot: the wait queue is full or
+    the wait timed out.
+    """
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def retry_delay(error, attempt: int, backoff: float, max_backoff: float):
+    """
+    Seconds to wait before retrying a failed LLM call, or None when the
+    error is not retryable. A Retry-After header from the provider wins over
+    exponential backoff.
+    """
+    status = _status_code(error)
+    name = type(error).__name__
+    if status is None and "Connection" not in name and "Timeout" not in name:
+        return None
+    if status is not None and status not in RETRYABLE_STATUS:
+        return None
+
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after")
+    if retry_after is not None:
+        try:
+            return min(max(float(retry_after), 0.0), max_backoff)
+        except ValueError:
+            pass
+    return min(backoff * (2 ** attempt), max_backoff)
+
+
+class _Waiter:
+    """
+    A caller queued for an LLM slot. wake() and the granted flag are only
+    touched under the gateway lock.
+    """
+
+    __slots__ = ("wake", "granted")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def prompt_key(prompt) -> str:
+    text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LLMGateway:
+    """
+    Sits between RAGService and the chat model.
+
+    - at most max_in_flight provider calls run at once
+    - identical prompts already in flight share one call (single flight);
+      followers wait at most queue_timeout, and start over if the leader
+      is cancelled
+    - callers wait for a slot in a FIFO queue of at most max_queue, for at
+      most queue_timeout seconds, then get LLMBusyError; a released slot is
+      handed straight to the longest waiting caller, thread or coroutine
+    - rate-limit and transient errors are retried with backoff, honouring
+      Retry-After; a 429 pauses every caller until the provider's window
+      reopens rather than letting each one hit the limit again
+    """
+
+    def __init__(self, model, max_in_flight: int = 4, max_queue: int = 32, queue_timeout: float = 30.0,
+                 retries: int = 3, backoff: float = 1.0, max_backoff: float = 20.0):
+        self.model = model
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._free = max_in_flight
+        self._waiters = deque()
+        self._pending = {}
+        self._paused_until = 0.0
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.hedge_slots = 0
+        self.hedges_refused = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.waits = 0
+
+    # Slot management
+
+    def _enter_queue(self):
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise LLMBusyError("The assistant is busy right now, please try again in a moment.")
+            self.waiting += 1
+        return time.perf_counter()
+
+    def _leave_queue(self, started: float, acquired: bool):
+        wait_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.waiting -= 1
+            self.waits += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            if acquired:
+                self.in_flight += 1
+                self.calls += 1
+            else:
+                self.timeouts += 1
+        if not acquired:
+            raise LLMBusyError("Timed out waiting for the assistant, please try again in a moment.")
+
+    def _take_free_slot(self) -> bool:
+        # Caller holds the lock. Queued callers go first.
+        if self._free > 0 and not self._waiters:
+            self._free -= 1
+            return True
+        return False
+
+    def _hand_over(self):
+        """
+        Gives a freed slot to the longest waiting caller, or back to the pool.
+        Caller holds the lock.
+        """
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            try:
+                waiter.wake()
+            except RuntimeError:
+                # The waiting coroutine's event loop is closed
+                continue
+            waiter.granted = True
+            return
+        self._free += 1
+
+    def _settle(self, waiter: _Waiter) -> bool:
+        """
+        True when the waiter was handed a slot; otherwise it leaves the queue.
+        """
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def _wait_for_slot(self, timeout: float) -> bool:
+        with self._lock:
+            if self._take_free_slot():
+                return True
+            event = threading.Event()
+            waiter = _Waiter(event.set)
+            self._waiters.append(waiter)
+        event.wait(timeout)
+        return self._settle(waiter)
+
+    async def _await_slot(self, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._take_free_slot():
+                return True
+            future = loop.create_future()
+            waiter = _Waiter(lambda: loop.call_soon_threadsafe(_resolve, future))
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Cancelled: pass on a slot that was handed over meanwhile
+            if self._settle(waiter):
+                with self._lock:
+                    self._hand_over()
+            raise
+        return self._settle(waiter)
+
+    def _acquire(self):
+        started = self._enter_queue()
+        acquired = False
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                time.sleep(min(pause, self.queue_timeout))
+            remaining = self.queue_timeout - (time.perf_counter() - started)
+            acquired = remaining > 0 and self._wait_for_slot(remaining)
+        finally:
+            self._leave_queue(started, acquired)
+
+    async def _aacquire(self):
+        started = self._enter_queue()
+        acquired = False
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(min(pause, self.queue_timeout))
+            # Woken by _release, so waiting requests hold neither a thread nor a poll loop
+            remaining = self.queue_timeout - (time.perf_counter() - started)
+            acquired = remaining > 0 and await self._await_slot(remaining)
+        finally:
+            self._leave_queue(started, acquired)
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._hand_over()
+
+    def try_acquire_extra(self):
+        """
+        A slot for a hedged call made on behalf of a caller that already
+        holds one. Never waits or jumps the queue: returns the release
+        callable, or None when no slot is free or calls are paused after a 429.
+        """
+        with self._lock:
+            if time.monotonic() < self._paused_until or not self._take_free_slot():
+                self.hedges_refused += 1
+                return None
+            self.in_flight += 1
+            self.hedge_slots += 1
+        return self._release
+
+    def _on_error(self, error, attempt: int):
+        """
+        Returns the delay before the next attempt, or raises the error.
+        """
+        delay = retry_delay(error, attempt, self.backoff, self.max_backoff)
+        if delay is None or attempt >= self.retries:
+            raise error
+        with self._lock:
+            self.retried += 1
+            if _status_code(error) == 429:
+                self.rate_limited += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        logger.warning(f"LLM call failed ({type(error).__name__}), retrying in {delay:.1f}s")
+        return delay
+
+    # Single flight
+
+    def _join(self, key: str):
+        """
+        Returns (future, leader). The leader makes the call and resolves the
+        future; followers wait on it.
+        """
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._pending[key] = future
+            return future, True
+
+    def _finish(self, key: str, future: Future, result=None, error=None):
+        """
+        Always called by the leader, however its call ended, so the key never
+        outlives the call.
+        """
+        with self._lock:
+            self._pending.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            # The leader was cancelled (client disconnect) or interrupted:
+            # its followers start over, one of them as the new leader
+            future.cancel()
+
+    def _follower_timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+        return LLMBusyError("Timed out waiting for the assistant, please try again in a moment.")
+
+    # Public API
+
+    def invoke(self, prompt):
+        key = prompt_key(prompt)
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result(timeout=self.queue_timeout)
+            except CancelledError:
+                continue
+            except TimeoutError:
+                raise self._follower_timed_out()
+
+        try:
+            result = self._invoke(prompt)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def _invoke(self, prompt):
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                return self.model.invoke(prompt)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+            finally:
+                self._release()
+            time.sleep(delay)
+            attempt += 1
+
+    async def ainvoke(self, prompt):
+        key = prompt_key(prompt)
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # Shielded: a cancelled follower must not cancel the shared call
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.queue_timeout)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    continue
+                raise
+            except asyncio.TimeoutError:
+                raise self._follower_timed_out()
+
+        try:
+            result = await self._ainvoke(prompt)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def _ainvoke(self, prompt):
+        attempt = 0
+        while True:
+            await self._aacquire()
+            try:
+                return await self.model.ainvoke(prompt)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+            finally:
+                self._release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stream(self, prompt):
+        """
+        Streams chunks under the same slot limit. Each stream owns its tokens,
+        so streams are not coalesced; a failure is retried only before the
+        first chunk has been sent.
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            sent = False
+            try:
+                for chunk in self.model.stream(prompt):
+                    sent = True
+                    yield chunk
+                return
+            except Exception as e:
+                if sent:
+                    raise
+                delay = self._on_error(e, attempt)
+            finally:
+                self._release()
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "max_queue": self.max_queue,
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "retried": self.retried,
+                "rate_limited": self.rate_limited,
+                "hedge_slots": self.hedge_slots,
+                "hedges_refused": self.hedges_refused,
+                "avg_wait_ms": round(self.total_wait_ms / self.waits, 2) if self.waits else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 2),
+            }
@@ -0,0 +1,349 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from .metrics import FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+
+def build_chat_model(spec: str):
+    """
+    Builds a chat model from a "provider:model" spec:
+
+    groq:llama-3.1-8b-instant       Groq (GROQ_API_KEY)
+    huggingface:HuggingFaceH4/zephyr-7b-beta
+                                    Hugging Face endpoint (HUGGINGFACEHUB_API_TOKEN)
+    local                           LocalChatModel, no network
+    """
+    provider, _, model = spec.strip().partition(":")
+    provider = provider.lower()
+
+    if provider == "groq":
+        from langchain_groq import ChatGroq
+
+        if not os.getenv("GROQ_API_KEY"):
+            raise ValueError("GROQ API token not found in environment variables")
+        # Retries are handled by the LLM gateway
+        return ChatGroq(model=model or "llama-3.1-8b-instant", temperature=0.3, max_retries=0)
+
+    if provider == "huggingface":
+        from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
+
+        hf_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
+        if not hf_token:
+            raise ValueError("HuggingFace API token not found in environment variables")
+        llm = HuggingFaceEndpoint(
+            repo_id=model or "HuggingFaceH4/zephyr-7b-beta",
+            task="text-generation",
+            huggingfacehub_api_token=hf_token,
+            max_new_tokens=512,
+            temperature=0.7,
+        )
+        return ChatHuggingFace(llm=llm)
+
+    if provider == "local":
+        from .local_llm import LocalChatModel
+
+        return LocalChatModel(delay_ms=float(os.getenv("RAG_LOCAL_LLM_DELAY_MS", "0")))
+
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
+
+class Backend:
+    """
+    One configured chat model plus a rolling window of its latencies and
+    outcomes.
+    """
+
+    def __init__(self, name: str, model, window: int = 200, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.name = name
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.failed_at = 0.0
+        self.calls = 0
+        self.hedged = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(elapsed_ms)
+                self.consecutive_failures = 0
+            else:
+                self.consecutive_failures += 1
+                self.failed_at = time.monotonic()
+
+    def percentile(self, q: float):
+        with self._lock:
+            if not self.latencies:
+                return None
+            return float(np.percentile(np.fromiter(self.latencies, dtype=np.float64), q))
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            return (len(self.outcomes) - sum(self.outcomes)) / len(self.outcomes) if self.outcomes else 0.0
+
+    @property
+    def healthy(self) -> bool:
+        # A failing backend is skipped for cooldown seconds, then tried again
+        return (self.consecutive_failures < self.failure_threshold
+                or time.monotonic() - self.failed_at > self.cooldown)
+
+    def stats(self) -> dict:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "p50_ms": round(p50, 1) if p50 is not None else None,
+            "p95_ms": round(p95, 1) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "healthy": self.healthy,
+        }
+
+
+class LLMRouter:
+    """
+    Routes each call to the fastest healthy backend by rolling p50.
+
+    If the chosen backend has not answered within the hedge delay (its own
+    p95, capped at deadline_ms), the same prompt is also sent to the next
+    backend and the first answer wins; an error fails over immediately.
+    Exposes invoke/ainvoke/stream, so it can stand in for a single chat model.
+
+    The caller's own concurrency slot covers one call at a time. A call that
+    would run alongside another one (a hedge) needs a slot from extra_slot,
+    which returns a release callable or None when none is free; with None
+    the router keeps waiting instead of hedging. The LLM gateway sets it, so
+    hedges count against RAG_LLM_MAX_IN_FLIGHT.
+    """
+
+    def __init__(self, backends: list, deadline_ms: float = 5000.0, min_samples: int = 10, max_workers: int = 16):
+        if not backends:
+            raise ValueError("At least one LLM backend is required")
+        self.backends = backends
+        self.deadline_ms = deadline_ms
+        self.min_samples = min_samples
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+        self.extra_slot = None
+
+    @classmethod
+    def from_specs(cls, specs: list, **kwargs):
+        backends = []
+        errors = []
+        for spec in specs:
+            try:
+                backends.append(Backend(spec.strip(), build_chat_model(spec)))
+            except Exception as e:
+                logger.warning(f"Skipping LLM backend {spec}: {str(e)}")
+                errors.append(f"{spec}: {str(e)}")
+        if not backends:
+            raise ValueError("No usable LLM backend (" + "; ".join(errors) + ")")
+        return cls(backends, **kwargs)
+
+    def ranked(self) -> list:
+        """
+        Healthy backends fastest first (unmeasured ones first, so they get
+        measured), then unhealthy ones as a last resort.
+        """
+        def p50(backend):
+            value = backend.percentile(50)
+            return -1.0 if value is None else value
+
+        healthy = sorted((b for b in self.backends if b.healthy), key=p50)
+        return healthy + [b for b in self.backends if not b.healthy]
+
+    def hedge_after(self, backend: Backend) -> float:
+        """
+        Seconds to wait on a backend before hedging to the next one.
+        """
+        p95 = backend.percentile(95) if len(backend.latencies) >= self.min_samples else None
+        return min(p95, self.deadline_ms) / 1000 if p95 is not None else self.deadline_ms / 1000
+
+    def _call(self, backend: Backend, prompt):
+        started = time.perf_counter()
+        try:
+            result = backend.model.invoke(prompt)
+        except Exception:
+            backend.record((time.perf_counter() - started) * 1000, ok=False)
+            raise
+        backend.record((time.perf_counter() - started) * 1000, ok=True)
+        return result
+
+    async def _acall(self, backend: Backend, prompt):
+        started = time.perf_counter()
+        try:
+            result = await backend.model.ainvoke(prompt)
+        except Exception:
+            backend.record((time.perf_counter() - started) * 1000, ok=False)
+            raise
+        backend.record((time.perf_counter() - started) * 1000, ok=True)
+        return result
+
+    def _slot_for(self, running: dict):
+        """
+        Returns (allowed, release) for one more call. The first running call
+        uses the caller's slot (release None); every other one needs an extra
+        slot.
+        """
+        if not any(release is None for _, release in running.values()):
+            return True, None
+        release = self.extra_slot() if self.extra_slot is not None else (lambda: None)
+        if release is None:
+            return False, None
+        return True, release
+
+    @staticmethod
+    def _track(running: dict, future, backend: Backend, release):
+        # Released when the call ends, however it ends (a hedge cancelled
+        # before it ever ran included)
+        if release is not None:
+            future.add_done_callback(lambda _: release())
+        running[future] = (backend, release)
+
+    def _cover_stragglers(self, running: dict):
+        """
+        The caller's slot is released when invoke returns, so a call still
+        running on it moves to a slot of its own.
+        """
+        if self.extra_slot is None:
+            return
+        for future, (_, release) in running.items():
+            if release is None:
+                slot = self.extra_slot()
+                if slot is not None:
+                    future.add_done_callback(lambda _, slot=slot: slot())
+
+    def _hedge_log(self, running: dict, backend: Backend):
+        backend.hedged += 1
+        FALLBACKS.inc(kind="llm_hedge")
+        slow = list(running.values())[-1][0]
+        logger.info(f"LLM hedge: {slow.name} is slow, also asking {backend.name}")
+
+    def invoke(self, prompt):
+        queue = self.ranked()
+        if len(queue) == 1:
+            return self._call(queue[0], prompt)
+
+        running = {}
+        last_error = None
+        can_hedge = True
+        while queue or running:
+            if queue and (not running or last_error is not None):
+                allowed, release = self._slot_for(running)
+                if allowed:
+                    backend = queue.pop(0)
+                    self._track(running, self._executor.submit(self._call, backend, prompt), backend, release)
+                last_error = None
+            timeout = self.hedge_after(list(running.values())[-1][0]) if queue and can_hedge else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # Deadline passed: hedge to the next backend if the gateway
+                # has a free slot, and keep waiting on both
+                allowed, release = self._slot_for(running)
+                if not allowed:
+                    can_hedge = False
+                    continue
+                backend = queue.pop(0)
+                self._hedge_log(running, backend)
+                self._track(running, self._executor.submit(self._call, backend, prompt), backend, release)
+                continue
+
+            for future in done:
+                backend, _ = running.pop(future)
+                try:
+                    # Slower calls still running finish in the background,
+                    # holding a slot, and only update their latency window
+                    result = future.result()
+                    self._cover_stragglers(running)
+                    return result
+                except Exception as e:
+                    logger.warning(f"LLM backend {backend.name} failed: {str(e)}")
+                    FALLBACKS.inc(kind="llm_failover")
+                    last_error = e
+        raise last_error
+
+    async def ainvoke(self, prompt):
+        queue = self.ranked()
+        if len(queue) == 1:
+            return await self._acall(queue[0], prompt)
+
+        running = {}
+        last_error = None
+        can_hedge = True
+        try:
+            while queue or running:
+                if queue and (not running or last_error is not None):
+                    allowed, release = self._slot_for(running)
+                    if allowed:
+                        backend = queue.pop(0)
+                        self._track(running, asyncio.ensure_future(self._acall(backend, prompt)), backend, release)
+                    last_error = None
+                timeout = self.hedge_after(list(running.values())[-1][0]) if queue and can_hedge else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    allowed, release = self._slot_for(running)
+                    if not allowed:
+                        can_hedge = False
+                        continue
+                    backend = queue.pop(0)
+                    self._hedge_log(running, backend)
+                    self._track(running, asyncio.ensure_future(self._acall(backend, prompt)), backend, release)
+                    continue
+
+                for task in done:
+                    backend, _ = running.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        logger.warning(f"LLM backend {backend.name} failed: {str(e)}")
+                        FALLBACKS.inc(kind="llm_failover")
+                        last_error = e
+            raise last_error
+        finally:
+            # Losing hedged calls are cancelled rather than left to finish
+            for task in running:
+                task.cancel()
+
+    def stream(self, prompt):
+        """
+        Streams from the fastest healthy backend, failing over to the next
+        one if a backend errors before its first chunk.
+        """
+        last_error = None
+        for backend in self.ranked():
+            started = time.perf_counter()
+            sent = False
+            try:
+                for chunk in backend.model.stream(prompt):
+                    sent = True
+                    yield chunk
+                backend.record((time.perf_counter() - started) * 1000, ok=True)
+                return
+            except Exception as e:
+                backend.record((time.perf_counter() - started) * 1000, ok=False)
+                if sent:
+                    raise
+                logger.warning(f"LLM backend {backend.name} failed: {str(e)}")
+                FALLBACKS.inc(kind="llm_failover")
+                last_error = e
+        raise last_error
+
+    def stats(self) -> dict:
+        return {backend.name: backend.stats() for backend in self.backends}
@@ -0,0 +1,56 @@
+import asyncio
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+NO_CONTEXT_REPLY = "I don't have enough information in the provided context to answer this question accurately."
+
+CONTEXT_PATTERN = re.compile(r"Context:(.*?)Question:", re.S)
+SENTENCE_END = re.compile(r"(?<=[.;])\s+")
+
+
+class LocalChatModel(BaseChatModel):
+    """
+    Offline stand-in for the hosted chat models, for tests, benchmarks and
+    development without an API key.
+
+    Answers extractively with the first sentences of the prompt context after
+    an optional fixed delay, so the pipeline around the LLM can be exercised
+    and timed without network calls.
+    """
+
+    delay_ms: float = 0.0
+    max_sentences: int = 2
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-extractive"
+
+    def _answer(self, messages) -> str:
+        text = "\n".join(str(message.content) for message in messages)
+        match = CONTEXT_PATTERN.search(text)
+        context = " ".join(match.group(1).split()) if match else ""
+        if not context:
+            return NO_CONTEXT_REPLY
+        sentences = SENTENCE_END.split(context)[:self.max_sentences]
+        return "According to the provided context: " + " ".join(sentences)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.delay_ms:
+            await asyncio.sleep(self.delay_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000)
+        for token in re.split(r"(\s+)", self._answer(messages)):
+            if token:
+                yield ChatGenerationChunk(message=AIMessageChunk(content=token))
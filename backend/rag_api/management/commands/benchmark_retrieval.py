@@ -0,0 +1,87 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rag_api.benchmark import DEFAULT_CORPUS, DEFAULT_HELD_OUT, DEFAULT_KS, compare, load_queries, run_benchmark
+from rag_api.vector_index import DEFAULT_INDEX_DIR, MANIFEST_FILE
+
+# Offline defaults: in-process index, extractive stub LLM, no answer caches
+# (a cached answer would skip the stages being measured)
+OFFLINE_ENV = {
+    "RAG_RETRIEVER_BACKEND": "local",
+    "RAG_LLM_BACKENDS": "local",
+    "RAG_CACHE_BACKEND": "none",
+    "RAG_SEMANTIC_CACHE": "0",
+    "RAG_INTENT_GATE": "0",
+}
+
+
+class Command(BaseCommand):
+    help = "Measure recall@k, MRR and per-stage latency of the configured retriever on queries built from PEC.json"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="Corpus JSON the queries are built from.")
+        parser.add_argument("--held-out", default=str(DEFAULT_HELD_OUT),
+                            help="Hand-written labeled questions to run as well (empty to skip).")
+        parser.add_argument("--ks", default=",".join(str(k) for k in DEFAULT_KS), help="Comma-separated cut-offs.")
+        parser.add_argument("--limit", type=int, default=None, help="Only run the first N queries.")
+        parser.add_argument("--end-to-end", action="store_true",
+                            help="Run the full query path (prompt and LLM) instead of retrieval only.")
+        parser.add_argument("--use-env", action="store_true",
+                            help="Keep the environment's backend, LLM and cache settings instead of the offline ones.")
+        parser.add_argument("--output", default="-", help="Where to write the JSON report (- for stdout).")
+        parser.add_argument("--baseline", default=None, help="Earlier report to print deltas against.")
+        parser.add_argument("--per-query", action="store_true", help="Include each query's rank in the report.")
+
+    def handle(self, *args, **options):
+        if not options["use_env"]:
+            os.environ.update(OFFLINE_ENV)
+        # Imported after the environment is set: the service reads it on creation
+        from rag_api.rag_service import RAGService
+
+        index_dir = os.getenv("RAG_LOCAL_INDEX_DIR", str(DEFAULT_INDEX_DIR))
+        if os.getenv("RAG_RETRIEVER_BACKEND") == "local" and not os.path.exists(os.path.join(index_dir, MANIFEST_FILE)):
+            raise CommandError(
+                f"No local index in {index_dir}. Build one without Neo4j by running "
+                f"'python load_documents.py --offline' in documents/"
+            )
+
+        try:
+            ks = tuple(sorted({int(k) for k in options["ks"].split(",") if k.strip()}))
+        except ValueError:
+            raise CommandError(f"Invalid --ks: {options['ks']}")
+        if not ks or ks[0] < 1:
+            raise CommandError("--ks needs positive cut-offs")
+
+        try:
+            queries = load_queries(options["corpus"], limit=options["limit"], held_out_path=options["held_out"] or None)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not load queries from {options['corpus']}: {e}")
+        if not queries:
+            raise CommandError("The corpus produced no queries")
+
+        self.stderr.write(f"Running {len(queries)} queries...")
+        try:
+            report = run_benchmark(
+                RAGService(), queries, ks,
+                end_to_end=options["end_to_end"],
+                include_queries=options["per_query"]
+            )
+        except Exception as e:
+            raise CommandError(f"Benchmark failed: {e}")
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                report["baseline_deltas"] = compare(report, json.load(f))
+
+        text = json.dumps(report, indent=2)
+        if options["output"] == "-":
+            self.stdout.write(text)
+        else:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+
+        overall = report["metrics"]["all"]
+        summary = ", ".join(f"{name}={value}" for name, value in overall.items() if name != "queries")
+        self.stderr.write(self.style.SUCCESS(f"{overall.get('queries', 0)} queries: {summary}"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from rag_api.rag_service import RAGService
+
+
+class Command(BaseCommand):
+    help = "Load the embeddings model, connect to Neo4j and the LLM, and report startup timings"
+
+    def handle(self, *args, **options):
+        try:
+            timings = RAGService().warm_up()
+        except Exception as e:
+            raise CommandError(f"Warm-up failed: {e}")
+
+        for phase, seconds in timings.items():
+            self.stdout.write(f"{phase}: {seconds:.2f}s")
+        self.stdout.write(self.style.SUCCESS("RAG service is warm"))
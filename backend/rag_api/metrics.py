@@ -0,0 +1,197 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache hit to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> list:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + ("+Inf" if bound == float("inf") else repr(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Process-local metrics rendered in the Prometheus text exposition format.
+
+    Collectors are callables run at scrape time to refresh gauges from
+    component stats (pool sizes, queue depths, ...).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Latency of each stage of a RAG request.", ("stage",)
+)
+REQUESTS = REGISTRY.counter(
+    "rag_requests_total", "RAG requests by entry point and outcome.", ("path", "outcome")
+)
+CACHE_EVENTS = REGISTRY.counter(
+    "rag_cache_events_total", "Cache lookups by cache and result.", ("cache", "result")
+)
+FALLBACKS = REGISTRY.counter(
+    "rag_fallbacks_total", "Degraded paths taken (dense-only, plain context, skipped rerank, LLM failover, ...).", ("kind",)
+)
+ERRORS = REGISTRY.counter(
+    "rag_errors_total", "Errors by stage.", ("stage",)
+)
+COMPONENT_GAUGES = REGISTRY.gauge(
+    "rag_component_value", "Point-in-time component stats (pool and queue sizes, cache sizes, ...).", ("component", "stat")
+)
+
+
+class Timings:
+    """
+    Per-request stage timings. Every span is also recorded in the
+    rag_stage_seconds histogram.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def record(self, stage: str, elapsed_ms: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed_ms
+        STAGE_SECONDS.observe(elapsed_ms / 1000, stage=stage)
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - started) * 1000)
+
+    def finish(self) -> dict:
+        """
+        Records the total and returns {stage: milliseconds}.
+        """
+        self.record("total", (time.perf_counter() - self.started) * 1000)
+        return self.as_dict()
+
+    def as_dict(self) -> dict:
+        return {stage: round(ms, 2) for stage, ms in self.stages.items()}
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', '-updated_at', '-session_id'], name='chat_sessions_user_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'created_at', 'message_id'], name='chat_messages_session_order'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rag_api', '0002_chat_history_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_chunk_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
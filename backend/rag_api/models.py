@@ -13,10 +13,18 @@ class ChatSession(models.Model):
     title = models.CharField(max_length=255, default="New Chat")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Multi-turn state: rolling summary used to rewrite follow-ups, and the
+    # chunks behind the last answer, which a follow-up may reuse
+    summary = models.TextField(blank=True, default="")
+    last_chunk_ids = models.JSONField(blank=True, default=list)
     
     class Meta:
         db_table = 'chat_sessions'
         ordering = ['-updated_at']
+        indexes = [
+            # Sidebar history: a user's sessions, most recent first (keyset pagination)
+            models.Index(fields=['user', '-updated_at', '-session_id'], name='chat_sessions_user_recent'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.title}"
@@ -43,6 +51,10 @@ class ChatMessage(models.Model):
     class Meta:
         db_table = 'chat_messages'
         ordering = ['created_at']
+        indexes = [
+            # Messages of a session in order (keyset pagination)
+            models.Index(fields=['session', 'created_at', 'message_id'], name='chat_messages_session_order'),
+        ]
     
     def __str__(self):
         return f"{self.session.session_id} - {self.role}"
\ No newline at end of file
@@ -0,0 +1,181 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from neo4j import GraphDatabase, RoutingControl
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: the server or a connection went away, or the
+# transaction hit a transient condition (deadlock, leader switch, ...)
+RETRYABLE_ERRORS = (ServiceUnavailable, SessionExpired, TransientError)
+
+
+class Neo4jClient:
+    """
+    One explicitly configured Neo4j driver shared by the API and the loader.
+
+    Queries are retried with jittered exponential backoff on transient
+    errors, and ping() caches a RETURN 1 liveness check so health probes do
+    not each take a pooled connection.
+    """
+
+    def __init__(self, url: str, username: str, password: str, database: str = "neo4j",
+                 max_pool_size: int = 50, acquisition_timeout: float = 10.0,
+                 max_lifetime: float = 3600.0, retries: int = 3, backoff: float = 0.2,
+                 ping_ttl: float = 5.0, transaction_retry_time: float = 0.0):
+        self.database = database
+        self.max_pool_size = max_pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.ping_ttl = ping_ttl
+        self.driver = GraphDatabase.driver(
+            url,
+            auth=(username, password),
+            max_connection_pool_size=max_pool_size,
+            connection_acquisition_timeout=acquisition_timeout,
+            max_connection_lifetime=max_lifetime,
+            # Idle connections are checked before reuse instead of failing mid-query
+            liveness_check_timeout=float(min(60.0, max_lifetime / 2)),
+            # By default the driver's own 30s retry loop is replaced by retry()
+            # below, so a failed ping or query surfaces in milliseconds
+            max_transaction_retry_time=transaction_retry_time,
+        )
+
+        self._lock = threading.Lock()
+        self._ping = None
+        self._ping_at = 0.0
+        self.in_flight = 0
+        self.queries = 0
+        self.retried = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """
+        Builds a client from NEO4J_URL/USERNAME/PASSWORD/DATABASE and the
+        NEO4J_POOL_SIZE, NEO4J_ACQUISITION_TIMEOUT, NEO4J_MAX_LIFETIME,
+        NEO4J_RETRIES and NEO4J_PING_TTL settings; keyword arguments
+        override them.
+        """
+        url = os.getenv("NEO4J_URL")
+        username = os.getenv("NEO4J_USERNAME")
+        password = os.getenv("NEO4J_PASSWORD")
+        if not all([url, username, password]):
+            raise ValueError("Neo4j credentials not found in environment variables")
+        settings = dict(
+            database=os.getenv("NEO4J_DATABASE", "neo4j"),
+            max_pool_size=int(os.getenv("NEO4J_POOL_SIZE", "50")),
+            acquisition_timeout=float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "10")),
+            max_lifetime=float(os.getenv("NEO4J_MAX_LIFETIME", "3600")),
+            retries=int(os.getenv("NEO4J_RETRIES", "3")),
+            ping_ttl=float(os.getenv("NEO4J_PING_TTL", "5")),
+        )
+        settings.update(overrides)
+        return cls(url, username, password, **settings)
+
+    def retry(self, operation, *args, **kwargs):
+        """
+        Runs operation(*args, **kwargs), retrying transient Neo4j errors with
+        jittered exponential backoff.
+        """
+        with self._lock:
+            self.in_flight += 1
+            self.queries += 1
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    return operation(*args, **kwargs)
+                except RETRYABLE_ERRORS as e:
+                    if attempt == self.retries:
+                        with self._lock:
+                            self.failed += 1
+                        raise
+                    delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                    with self._lock:
+                        self.retried += 1
+                    logger.warning(f"Neo4j {type(e).__name__}, retrying in {delay:.2f}s: {str(e)}")
+                    time.sleep(delay)
+                except Exception:
+                    with self._lock:
+                        self.failed += 1
+                    raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def query(self, cypher: str, params: dict = None, read: bool = False) -> list:
+        """
+        Runs a statement and returns the records as dicts. read=True routes
+        it to a reader, so on a cluster searches stay off the leader.
+        """
+        routing = RoutingControl.READ if read else RoutingControl.WRITE
+
+        def run():
+            records, _, _ = self.driver.execute_query(
+                cypher, parameters_=params or {}, database_=self.database, routing_=routing
+            )
+            return [record.data() for record in records]
+        return self.retry(run)
+
+    def session(self, **kwargs):
+        return self.driver.session(database=self.database, **kwargs)
+
+    def ping(self, force: bool = False) -> dict:
+        """
+        RETURN 1 liveness check, cached for ping_ttl seconds.
+        """
+        now = time.monotonic()
+        cached = self._ping
+        if not force and cached is not None and now - self._ping_at < self.ping_ttl:
+            return cached
+
+        started = time.perf_counter()
+        try:
+            self.driver.execute_query("RETURN 1", database_=self.database, routing_=RoutingControl.READ)
+            result = {"connected": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                      "message": "Connection successful"}
+        except Exception as e:
+            logger.error(f"Neo4j ping failed: {str(e)}")
+            result = {"connected": False, "latency_ms": None, "message": str(e)}
+        self._ping = result
+        self._ping_at = now
+        return result
+
+    def pool_stats(self) -> dict:
+        stats = {
+            "max_pool_size": self.max_pool_size,
+            "in_flight": self.in_flight,
+            "queries": self.queries,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+        stats.update(self._connection_stats())
+        return stats
+
+    def _connection_stats(self) -> dict:
+        """
+        Open and in-use connections, read from the driver's private pool
+        since it has no public pool metrics. Empty when the driver's
+        internals are not what this expects.
+        """
+        pool = getattr(self.driver, "_pool", None)
+        lock = getattr(pool, "lock", None)
+        connections = getattr(pool, "connections", None)
+        if lock is None or not hasattr(connections, "values"):
+            return {}
+        try:
+            with lock:
+                connections = [c for queue in connections.values() for c in queue]
+        except Exception:
+            return {}
+        return {
+            "open_connections": len(connections),
+            "in_use_connections": sum(1 for c in connections if getattr(c, "in_use", False)),
+        }
+
+    def close(self):
+        self.driver.close()
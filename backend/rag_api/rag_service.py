@@ -1,10 +1,28 @@
-from langchain_huggingface import HuggingFaceEmbeddings, ChatHuggingFace, HuggingFaceEndpoint
+from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.documents import Document
 from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-from langchain_neo4j import Neo4jVector
+import asyncio
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import logging
+from .answer_cache import build_answer_cache, make_cache_key
+from .semantic_cache import build_semantic_cache
+from .embeddings import CachedEmbeddings
+from .vector_index import DEFAULT_INDEX_DIR, LocalVectorStore
+from .sparse_index import SparseIndex
+from .hybrid import HybridRetriever
+from .rerank import CrossEncoderReranker
+from .graph_context import GraphContextBuilder, chunk_ref
+from .context_builder import ContextBuilder, TokenCounter
+from .intent_gate import IntentGate
+from .conversation import Conversation
+from .typeahead import TypeaheadIndex, clamp_k
+from .neo4j_client import Neo4jClient
+from .llm_gateway import LLMGateway
+from .llm_router import LLMRouter
+from .metrics import CACHE_EVENTS, COMPONENT_GAUGES, ERRORS, FALLBACKS, REGISTRY, REQUESTS, Timings
 
 logger = logging.getLogger(__name__)
 
@@ -29,78 +47,57 @@ class RAGService:
         
         # Load environment variables
         load_dotenv()
-        
-        try:
-            # Initialize embeddings 
-            logger.info("Loading embeddings model...")
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-mpnet-base-v2"
-            )
-            # To this (384 model):
-            # self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-            
-            # Neo4j connection details
-            self.url = os.getenv("NEO4J_URL")
-            self.username = os.getenv("NEO4J_USERNAME")
-            self.password = os.getenv("NEO4J_PASSWORD")
-            self.database = os.getenv("NEO4J_DATABASE", "neo4j")
-            
-            if not all([self.url, self.username, self.password]):
-                raise ValueError("Neo4j credentials not found in environment variables")
-            
-            # Connect to existing Neo4j vector store
-            logger.info("Connecting to Neo4j vector store...")
-            self.vector_store = Neo4jVector(
-                embedding=self.embeddings,
-                url=self.url,
-                username=self.username,
-                password=self.password,
-                database=self.database,
-                index_name="vector",
-                node_label="Document",
-                text_node_property="text",
-                embedding_node_property="embedding"
-            )
-            
-            # Initialize retriever
-            self.retriever = self.vector_store.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": 5}  # Retrieve top 5 most similar documents
-            )
-            logger.info("Retriever initialized with k=5")
-            
-            # Initialize LLM with explicit parameters (not in model_kwargs)
-            # hf_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
-            # if not hf_token:
-            #     raise ValueError("HuggingFace API token not found in environment variables")
-            
-            # logger.info("Initialiing HuggingFace LLM...")
-            # llm = HuggingFaceEndpoint(
-            #     repo_id="HuggingFaceH4/zephyr-7b-beta",
-            #     task="text-generation",
-            #     huggingfacehub_api_token=hf_token,
-            #     max_new_tokens=512,  # Explicit parameter
-            #     temperature=0.7,      # Explicit parameter
-            # )
-            
-            # self.model = ChatHuggingFace(llm=llm)
 
+        # Heavy components (embeddings model, Neo4j connection, LLM client) are
+        # built on first use, so importing the views or running manage.py
+        # commands does not load the model or need Neo4j to be up.
+        # Call warm_up() to build them before traffic arrives.
+        self._components = {}
+        self._init_lock = threading.RLock()
+        self.startup_timings = {}
 
-            groq_api = os.getenv("GROQ_API_KEY")
-            if not groq_api:
-                # The exception below will prevent self.model from being created
-                raise ValueError("GROQ API token not found in environment variables")
-            
-            logger.info("Initializing GROQ LLM...")
+        # Neo4j connection and pool settings are read by Neo4jClient.from_env
+        self.index_name = "vector"
 
-            # ChatGroq instance 
-            self.model = ChatGroq(
-                model="llama-3.1-8b-instant",
-                temperature=0.3
-            )
-            # Initialize prompt template
-            self.prompt = PromptTemplate(
-               template="""
+        # Retriever backend: "neo4j" (default) or "local" for the in-process
+        # index built by load_documents.py
+        self.retriever_backend = os.getenv("RAG_RETRIEVER_BACKEND", "neo4j").lower()
+        if self.retriever_backend not in ("neo4j", "local"):
+            raise ValueError(f"Unknown RAG_RETRIEVER_BACKEND: {self.retriever_backend}")
+        self.local_index_dir = os.getenv("RAG_LOCAL_INDEX_DIR", str(DEFAULT_INDEX_DIR))
+
+        # Number of documents retrieved per question. The question is embedded
+        # once in query() and the vector is reused for caching and retrieval.
+        self.top_k = int(os.getenv("RAG_TOP_K", "5"))
+
+        # Hybrid retrieval: BM25 over the index directory fused with the dense
+        # results. Falls back to dense-only when the sparse index is missing.
+        self.hybrid_enabled = os.getenv("RAG_HYBRID", "1") == "1"
+
+        # Context assembly: "plain" joins chunk text, "graph" expands chunks
+        # through the Part/Chapter/Article/Clause graph (Neo4j backend only)
+        self.context_mode = os.getenv("RAG_CONTEXT_MODE", "plain").lower()
+        self.context_token_budget = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+        # Longer chunks are cut down to their most query-relevant sentences
+        self.context_chunk_tokens = int(os.getenv("RAG_CONTEXT_CHUNK_TOKENS", "400"))
+
+        # Optional cross-encoder rerank over an over-fetched candidate set
+        self.rerank_enabled = os.getenv("RAG_RERANK", "0") == "1"
+
+        # Extra vector candidates fetched on Neo4j to make up for TOC/index
+        # chunks excluded inside the query
+        self.toc_overfetch = int(os.getenv("RAG_TOC_OVERFETCH", "10"))
+
+        self.model_name = "llama-3.1-8b-instant"
+        self.llm_backends = [
+            spec.strip() for spec in os.getenv("RAG_LLM_BACKENDS", f"groq:{self.model_name}").split(",") if spec.strip()
+        ]
+        # Cached answers are keyed on the configured backends, not one model name
+        self.llm_key = ",".join(self.llm_backends)
+
+        # Initialize prompt template
+        self.prompt = PromptTemplate(
+           template="""
                           You are a precise and reliable legal assistant specializing in Pakistani and Islamic laws.
 
                           Follow these rules strictly in order:
@@ -119,93 +116,862 @@ class RAGService:
                     Question: {question}
 
                     Answer:""",
-               input_variables=['context', 'question']
-            )
+           input_variables=['context', 'question']
+        )
 
-          
-            
-            self._initialized = True
-            logger.info("RAG Service initialized successfully!")
-            
+        # Greetings and non-English input get the template's fixed replies
+        # without embedding, retrieval or an LLM call
+        self.intent_gate = IntentGate() if os.getenv("RAG_INTENT_GATE", "1") == "1" else None
+
+        # Multi-turn mode: follow-ups are rewritten with the session summary
+        # and may reuse the previous turn's chunks instead of a fresh search
+        self.conversation = Conversation(
+            summary_chars=int(os.getenv("RAG_CONVERSATION_SUMMARY_CHARS", "300")),
+            reuse_coverage=float(os.getenv("RAG_CONVERSATION_REUSE_COVERAGE", "0.8"))
+        ) if os.getenv("RAG_CONVERSATION", "1") == "1" else None
+
+        # Exact-match answer cache, keyed by question, prompt, model and corpus version
+        self.answer_cache = build_answer_cache()
+        # Embedding-similarity cache for paraphrased questions
+        self.semantic_cache = build_semantic_cache()
+        self._corpus_version = None
+        self._corpus_version_checked_at = 0.0
+        self._documents_loaded = False
+        self.corpus_version_ttl = float(os.getenv("RAG_CORPUS_VERSION_TTL", "60"))
+
+        # Component stats are refreshed into gauges on every metrics scrape
+        REGISTRY.add_collector(self._collect_metrics)
+
+        self._initialized = True
+        logger.info("RAG Service initialized (components load on first use)")
+
+    def _component(self, name: str, builder):
+        """
+        Returns a lazily built component, building it once under a lock and
+        logging how long it took.
+        """
+        if name in self._components:
+            return self._components[name]
+
+        with self._init_lock:
+            if name not in self._components:
+                started = time.perf_counter()
+                try:
+                    component = builder()
+                except Exception as e:
+                    logger.error(f"Error initializing {name}: {str(e)}")
+                    raise
+                elapsed = time.perf_counter() - started
+                self.startup_timings[name] = round(elapsed, 3)
+                logger.info(f"Initialized {name} in {elapsed:.2f}s")
+                self._components[name] = component
+        return self._components[name]
+
+    @property
+    def embeddings(self):
+        return self._component("embeddings", self._build_embeddings)
+
+    @property
+    def neo4j(self):
+        return self._component("neo4j", Neo4jClient.from_env)
+
+    @property
+    def vector_store(self):
+        return self._component("vector_store", self._build_vector_store)
+
+    @property
+    def hybrid(self):
+        if not self.hybrid_enabled:
+            return None
+        return self._component("hybrid", self._build_hybrid)
+
+    @property
+    def reranker(self):
+        if not self.rerank_enabled:
+            return None
+        return self._component("reranker", self._build_reranker)
+
+    @property
+    def graph_context(self):
+        if self.context_mode != "graph":
+            return None
+        return self._component("graph_context", self._build_graph_context)
+
+    @property
+    def context_builder(self):
+        return self._component("context_builder", self._build_context_builder)
+
+    @property
+    def typeahead(self):
+        return self._component("typeahead", self._build_typeahead)
+
+    @property
+    def model(self):
+        return self._component("llm", self._build_model)
+
+    @property
+    def llm_gateway(self):
+        return self._component("llm_gateway", self._build_llm_gateway)
+
+    def _build_embeddings(self):
+        # Initialize embeddings 
+        logger.info("Loading embeddings model...")
+        # Memoized so repeated questions and health probes skip the forward pass
+        return CachedEmbeddings(
+            HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2"),
+            max_entries=int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "4096"))
+        )
+        # To this (384 model):
+        # self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+
+    def _build_vector_store(self):
+        # Local backend only: on Neo4j, _dense_search queries the vector
+        # index with Cypher over the shared client
+        if self.retriever_backend != "local":
+            raise ValueError("The in-process vector store needs RAG_RETRIEVER_BACKEND=local")
+        logger.info(f"Loading local vector index from {self.local_index_dir}...")
+        return LocalVectorStore(
+            self.local_index_dir,
+            self.embeddings,
+            nprobe=int(os.getenv("RAG_LOCAL_INDEX_NPROBE", "4"))
+        )
+
+    def _build_hybrid(self):
+        if not SparseIndex.exists(self.local_index_dir):
+            logger.warning(f"No sparse index in {self.local_index_dir}, using dense retrieval only")
+            return None
+
+        # Share the chunk table with the local vector index when it is loaded
+        chunks = self.vector_store.chunks if self.retriever_backend == "local" else None
+        return HybridRetriever(
+            SparseIndex(self.local_index_dir, chunks=chunks),
+            dense_weight=float(os.getenv("RAG_HYBRID_DENSE_WEIGHT", "1.0")),
+            sparse_weight=float(os.getenv("RAG_HYBRID_SPARSE_WEIGHT", "1.0")),
+            candidates=int(os.getenv("RAG_HYBRID_CANDIDATES", "20")),
+            rrf_k=int(os.getenv("RAG_RRF_K", "60"))
+        )
+
+    def _build_reranker(self):
+        logger.info("Loading cross-encoder reranker...")
+        return CrossEncoderReranker(
+            os.getenv("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+            candidates=int(os.getenv("RAG_RERANK_CANDIDATES", "20")),
+            budget_ms=float(os.getenv("RAG_RERANK_BUDGET_MS", "150")),
+            probe_interval=float(os.getenv("RAG_RERANK_PROBE_INTERVAL", "30"))
+        )
+
+    def _build_context_builder(self):
+        # Token counts come from a local tokenizer; the embedding model's is
+        # already on disk and close enough to the LLM's for budgeting
+        counter = TokenCounter(os.getenv("RAG_TOKENIZER", "sentence-transformers/all-mpnet-base-v2"))
+        return ContextBuilder(
+            counter,
+            token_budget=self.context_token_budget,
+            max_chunk_tokens=self.context_chunk_tokens
+        )
+
+    def _build_graph_context(self):
+        if self.retriever_backend != "neo4j":
+            logger.warning("Graph context needs the Neo4j backend, using plain context")
+            return None
+        return GraphContextBuilder(
+            lambda cypher, params: self.neo4j.query(cypher, params, read=True),
+            token_budget=self.context_token_budget,
+            count_tokens=self.context_builder.counter.count
+        )
+
+    def _build_typeahead(self):
+        if not TypeaheadIndex.exists(self.local_index_dir):
+            logger.warning(f"No typeahead index in {self.local_index_dir}, suggestions use vector search")
+            return None
+        return TypeaheadIndex.load(
+            self.local_index_dir,
+            vector_fallback=self.get_similar_questions,
+            vector_min_chars=int(os.getenv("RAG_TYPEAHEAD_VECTOR_MIN_CHARS", "24")),
+            debounce_ttl=float(os.getenv("RAG_TYPEAHEAD_DEBOUNCE_TTL", "30"))
+        )
+
+    def _build_model(self):
+        # Chat backends, tried fastest first with hedging and failover, e.g.
+        # RAG_LLM_BACKENDS="groq:llama-3.1-8b-instant,huggingface:HuggingFaceH4/zephyr-7b-beta"
+        # "local" is an offline extractive stand-in for tests and benchmarks
+        logger.info(f"Initializing LLM backends: {', '.join(self.llm_backends)}...")
+        router = LLMRouter.from_specs(
+            self.llm_backends,
+            deadline_ms=float(os.getenv("RAG_LLM_DEADLINE_MS", "5000"))
+        )
+        logger.info(f"LLM router ready with {len(router.backends)} backend(s)")
+        return router
+
+    def _build_llm_gateway(self):
+        gateway = LLMGateway(
+            self.model,
+            max_in_flight=int(os.getenv("RAG_LLM_MAX_IN_FLIGHT", "4")),
+            max_queue=int(os.getenv("RAG_LLM_MAX_QUEUE", "32")),
+            queue_timeout=float(os.getenv("RAG_LLM_QUEUE_TIMEOUT", "30")),
+            retries=int(os.getenv("RAG_LLM_RETRIES", "3"))
+        )
+        # Hedged calls take their own gateway slot, so they count against
+        # RAG_LLM_MAX_IN_FLIGHT and are skipped when the gateway is full
+        self.model.extra_slot = gateway.try_acquire_extra
+        return gateway
+
+    def warm_up(self) -> dict:
+        """
+        Builds every component and verifies the Neo4j connection so the first
+        request does not pay for model loading.
+
+        Returns the per-phase startup timings in seconds.
+        """
+        started = time.perf_counter()
+        self.embeddings.embed_query("warm up")
+        if self.retriever_backend == "local":
+            self.vector_store
+        else:
+            self.neo4j
+        self.hybrid
+        self.context_builder
+        self.typeahead
+        # The reranker runs its own untimed warm-up predict when it is built
+        self.reranker
+        self.llm_gateway
+        connection = self.check_connection()
+        if not connection["connected"]:
+            raise RuntimeError(f"Neo4j connection check failed: {connection['message']}")
+        self.startup_timings["warm_up_total"] = round(time.perf_counter() - started, 3)
+        logger.info(f"RAG Service warmed up: {self.startup_timings}")
+        return dict(self.startup_timings)
+
+    def embedding_cache_stats(self) -> dict:
+        embeddings = self._components.get("embeddings")
+        if embeddings is None:
+            return {"loaded": False}
+        return embeddings.stats()
+
+    def corpus_version(self) -> str:
+        """
+        Version of the loaded corpus, written by load_documents.py.
+        RAG_CORPUS_VERSION overrides it; the stored value is re-read at most
+        every RAG_CORPUS_VERSION_TTL seconds.
+        """
+        override = os.getenv("RAG_CORPUS_VERSION")
+        if override:
+            return override
+
+        if self.retriever_backend == "local":
+            return self.vector_store.corpus_version
+
+        now = time.monotonic()
+        if self._corpus_version is None or now - self._corpus_version_checked_at > self.corpus_version_ttl:
+            try:
+                rows = self.neo4j.query(
+                    "MATCH (m:CorpusMeta {name: 'default'}) RETURN m.version AS version", read=True
+                )
+                self._corpus_version = rows[0]["version"] if rows else "unversioned"
+            except Exception as e:
+                logger.warning(f"Could not read corpus version: {str(e)}")
+                self._corpus_version = self._corpus_version or "unversioned"
+            self._corpus_version_checked_at = now
+        return self._corpus_version
+
+    def answer_cache_stats(self) -> dict:
+        if self.answer_cache is None:
+            return {"enabled": False}
+        return self.answer_cache.stats()
+
+    def reranker_stats(self) -> dict:
+        reranker = self._components.get("reranker")
+        if reranker is None:
+            return {"enabled": self.rerank_enabled, "loaded": False}
+        return dict(reranker.stats(), enabled=True, loaded=True)
+
+    def typeahead_stats(self) -> dict:
+        typeahead = self._components.get("typeahead")
+        if typeahead is None:
+            return {"loaded": False}
+        return dict(typeahead.stats(), loaded=True)
+
+    def context_stats(self) -> dict:
+        builder = self._components.get("context_builder")
+        if builder is None:
+            return {"loaded": False}
+        return builder.stats()
+
+    def intent_gate_stats(self) -> dict:
+        if self.intent_gate is None:
+            return {"enabled": False}
+        return self.intent_gate.stats()
+
+    def conversation_stats(self) -> dict:
+        if self.conversation is None:
+            return {"enabled": False}
+        return self.conversation.stats()
+
+    def llm_backend_stats(self) -> dict:
+        router = self._components.get("llm")
+        if router is None:
+            return {"loaded": False}
+        return router.stats()
+
+    def llm_gateway_stats(self) -> dict:
+        gateway = self._components.get("llm_gateway")
+        if gateway is None:
+            return {"loaded": False}
+        return gateway.stats()
+
+    def neo4j_stats(self) -> dict:
+        client = self._components.get("neo4j")
+        if client is None:
+            return {"loaded": False}
+        return client.pool_stats()
+
+    def semantic_cache_stats(self) -> dict:
+        if self.semantic_cache is None:
+            return {"enabled": False}
+        return self.semantic_cache.stats()
+
+    def _collect_metrics(self):
+        for component, stats in (
+            ("answer_cache", self.answer_cache_stats()),
+            ("semantic_cache", self.semantic_cache_stats()),
+            ("embedding_cache", self.embedding_cache_stats()),
+            ("context", self.context_stats()),
+            ("intent_gate", self.intent_gate_stats()),
+            ("typeahead", self.typeahead_stats()),
+            ("conversation", self.conversation_stats()),
+            ("neo4j_pool", self.neo4j_stats()),
+            ("llm_gateway", self.llm_gateway_stats()),
+        ):
+            for stat, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    COMPONENT_GAUGES.set(value, component=component, stat=stat)
+
+    def _resolve_follow_up(self, question: str, history: dict):
+        """
+        Returns (standalone_question, turn). history is the session's
+        {"summary", "chunk_ids"}; turn is None outside multi-turn mode and
+        otherwise carries the updated summary for the session.
+        """
+        if self.conversation is None or history is None:
+            return question, None
+        summary = history.get("summary") or ""
+        standalone, follow_up = self.conversation.rewrite(question, summary)
+        turn = {
+            "question": question,
+            "standalone_question": standalone,
+            "follow_up": follow_up,
+            "previous_chunk_ids": list(history.get("chunk_ids") or []) if follow_up else [],
+            "reused_chunks": False,
+            "summary": self.conversation.update_summary(summary, question, follow_up),
+        }
+        return standalone, turn
+
+    @staticmethod
+    def _chunk_document(row) -> Document:
+        """
+        Builds a Document from a chunk row. The Cypher projection nulls text
+        and embedding so neither is sent twice over the wire; the null keys
+        are dropped here so they never reach the sources in API responses.
+        """
+        metadata = {key: value for key, value in row["metadata"].items() if key not in ("text", "embedding")}
+        return Document(page_content=row["text"], metadata=metadata)
+
+    def _fetch_chunks(self, chunk_ids: list) -> list:
+        if self.retriever_backend == "local":
+            return self.vector_store.get_documents(chunk_ids)
+
+        rows = self.neo4j.query(
+            """
+            MATCH (node) WHERE elementId(node) IN $ids
+            RETURN node.text AS text,
+                   node {.*, text: Null, embedding: Null, chunk_id: elementId(node)} AS metadata
+            """,
+            {"ids": chunk_ids},
+            read=True
+        )
+        docs = {row["metadata"]["chunk_id"]: self._chunk_document(row) for row in rows}
+        return [docs[chunk_id] for chunk_id in chunk_ids if chunk_id in docs]
+
+    def _reuse_chunks(self, turn: dict, timings: Timings):
+        """
+        Returns the previous turn's chunks when they cover a follow-up,
+        otherwise None and the caller runs a fresh search.
+        """
+        if turn is None or not turn["previous_chunk_ids"]:
+            return None
+        try:
+            with timings.span("chunk_reuse"):
+                docs = self._fetch_chunks(turn["previous_chunk_ids"])
+                reused = self.conversation.covers(turn["question"], docs)
         except Exception as e:
-            logger.error(f"Error initializing RAG Service: {str(e)}")
-            raise
-    
-   
-    def query(self, question: str) -> dict:
+            logger.warning(f"Could not load previous chunks, searching again: {str(e)}")
+            return None
+        CACHE_EVENTS.inc(cache="chunks", result="hit" if reused else "miss")
+        if not reused:
+            return None
+        turn["reused_chunks"] = True
+        logger.info(f"Follow-up reuses {len(docs)} chunks from the previous turn")
+        return docs
+
+    async def _areuse_chunks(self, turn: dict, timings: Timings):
+        if self.retriever_backend == "local":
+            return self._reuse_chunks(turn, timings)
+        return await asyncio.to_thread(self._reuse_chunks, turn, timings)
+
+    @staticmethod
+    def _with_turn(result: dict, turn: dict, sources: list = None) -> dict:
+        """
+        Adds the session state for the next turn: the rolling summary and the
+        chunk ids this answer used. Kept out of the answer caches.
+        """
+        if turn is None:
+            return dict(result)
+        if sources is None:
+            sources = result.get("sources", [])
+        return dict(result, conversation={
+            "follow_up": turn["follow_up"],
+            "standalone_question": turn["standalone_question"],
+            "reused_chunks": turn["reused_chunks"],
+            "summary": turn["summary"],
+            "chunk_ids": [
+                source["metadata"]["chunk_id"] for source in sources
+                if source["metadata"].get("chunk_id")
+            ],
+        })
+
+    def _check_caches(self, question: str, timings: Timings, turn: dict = None):
+        """
+        Looks the question up in the answer caches.
+
+        A rewritten follow-up skips the semantic cache: its text is mostly the
+        session summary, so two different follow-ups in one session embed
+        close enough to share an answer. The exact-match cache still applies.
+
+        Returns (cached_result, state); state carries the cache key, corpus
+        version and question embedding on to retrieval and _remember().
+        """
+        with timings.span("corpus_version"):
+            corpus_version = self.corpus_version()
+        state = {
+            "corpus_version": corpus_version,
+            "cache_key": None,
+            "embedding": None,
+            "semantic": self.semantic_cache is not None and not (turn and turn["follow_up"]),
+        }
+
+        if self.answer_cache is not None:
+            with timings.span("answer_cache"):
+                state["cache_key"] = make_cache_key(question, self.prompt.template, self.llm_key, corpus_version)
+                cached = self.answer_cache.get(state["cache_key"])
+            CACHE_EVENTS.inc(cache="answer", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                logger.info("Answer cache hit")
+                return dict(cached, cached=True), state
+
+        # Embed once; the vector serves the semantic cache and retrieval
+        with timings.span("embed"):
+            state["embedding"] = self.embeddings.embed_query(question)
+
+        if state["semantic"]:
+            with timings.span("semantic_cache"):
+                cached, similarity = self.semantic_cache.lookup(question, state["embedding"], corpus_version)
+            CACHE_EVENTS.inc(cache="semantic", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                logger.info(f"Semantic cache hit (similarity {similarity:.3f})")
+                if state["cache_key"] is not None:
+                    self.answer_cache.set(state["cache_key"], cached)
+                return dict(cached, cached=True), state
+
+        return None, state
+
+    def _remember(self, question: str, state: dict, result: dict):
+        if state["cache_key"] is not None:
+            self.answer_cache.set(state["cache_key"], result)
+        if state["semantic"]:
+            self.semantic_cache.add(question, state["embedding"], result, state["corpus_version"])
+
+    def _dense_search(self, question_embedding, k: int) -> list:
+        """
+        Top-k vector search that never returns chunks flagged as TOC/index
+        pages at ingest. On Neo4j the flag is applied inside the vector query,
+        over-fetching RAG_TOC_OVERFETCH extra candidates so k useful chunks
+        survive; the local index masks flagged rows directly.
+        """
+        if self.retriever_backend == "local":
+            return self.vector_store.similarity_search_by_vector(question_embedding, k=k)
+
+        rows = self.neo4j.query(
+            """
+            CALL db.index.vector.queryNodes($index, $candidates, $embedding) YIELD node, score
+            WHERE NOT coalesce(node.is_toc, false)
+            RETURN node.text AS text, score,
+                   node {.*, text: Null, embedding: Null, chunk_id: elementId(node)} AS metadata
+            ORDER BY score DESC
+            LIMIT $k
+            """,
+            {
+                "index": self.index_name,
+                "candidates": k + self.toc_overfetch,
+                "embedding": question_embedding,
+                "k": k
+            },
+            read=True
+        )
+        return [self._chunk_document(row) for row in rows]
+
+    def _retrieve(self, question: str, question_embedding, timings: Timings) -> list:
+        """
+        First-stage retrieval (dense or hybrid), then the optional rerank
+        stage. Over-fetches reranker.candidates when reranking is enabled.
+        """
+        reranker = self.reranker
+        n = max(self.top_k, reranker.candidates) if reranker is not None else self.top_k
+
+        stages = {}
+
+        hybrid = self.hybrid
+        if hybrid is None:
+            if self.hybrid_enabled:
+                FALLBACKS.inc(kind="dense_only")
+            started = time.perf_counter()
+            docs = self._dense_search(question_embedding, n)
+            stages["dense_search_ms"] = (time.perf_counter() - started) * 1000
+        else:
+            docs, hybrid_timings = hybrid.retrieve(
+                question,
+                lambda candidates: self._dense_search(question_embedding, candidates),
+                n
+            )
+            stages.update(
+                dense_search_ms=hybrid_timings["dense_ms"],
+                sparse_search_ms=hybrid_timings["sparse_ms"],
+                fusion_ms=hybrid_timings["fusion_ms"]
+            )
+
+        if reranker is not None:
+            docs, rerank_timings = reranker.rerank(question, docs, self.top_k)
+            if rerank_timings.get("rerank_skipped"):
+                FALLBACKS.inc(kind="rerank_skipped")
+            if "rerank_ms" in rerank_timings:
+                stages["rerank_ms"] = rerank_timings["rerank_ms"]
+
+        for stage, elapsed_ms in stages.items():
+            timings.record(stage[:-3], elapsed_ms)
+        logger.info(f"Retrieved {len(docs)} docs (" + ", ".join(f"{k}={v:.1f}" for k, v in stages.items()) + ")")
+        return docs
+
+    async def _adense_search(self, question_embedding, k: int) -> list:
+        if self.retriever_backend == "local":
+            return self._dense_search(question_embedding, k)
+        # The Neo4j driver is synchronous, so the query runs in a worker thread
+        return await asyncio.to_thread(self._dense_search, question_embedding, k)
+
+    def _retrieval_stages(self):
+        return self.reranker, self.hybrid
+
+    async def _aretrieve(self, question: str, question_embedding, timings: Timings) -> list:
+        # The first access loads the cross-encoder and the BM25 index
+        reranker, hybrid = await asyncio.to_thread(self._retrieval_stages)
+        n = max(self.top_k, reranker.candidates) if reranker is not None else self.top_k
+
+        if hybrid is None:
+            if self.hybrid_enabled:
+                FALLBACKS.inc(kind="dense_only")
+            with timings.span("dense_search"):
+                docs = await self._adense_search(question_embedding, n)
+        else:
+            with timings.span("dense_search"):
+                dense_docs = await self._adense_search(question_embedding, hybrid.candidates)
+            # BM25 scoring and fusion are CPU-bound
+            with timings.span("sparse_search"):
+                sparse_docs = await asyncio.to_thread(hybrid.sparse_index.search_documents, question, hybrid.candidates)
+            with timings.span("fusion"):
+                docs = await asyncio.to_thread(hybrid.fuse, dense_docs, sparse_docs, n)
+
+        if reranker is not None:
+            # CPU-bound scoring pass, kept off the event loop
+            docs, rerank_timings = await asyncio.to_thread(reranker.rerank, question, docs, self.top_k)
+            if rerank_timings.get("rerank_skipped"):
+                FALLBACKS.inc(kind="rerank_skipped")
+            if "rerank_ms" in rerank_timings:
+                timings.record("rerank", rerank_timings["rerank_ms"])
+        return docs
+
+    def _build_context(self, question: str, docs: list):
+        """
+        Returns (context_text, citations, stats). In graph mode the context is
+        the citation-annotated article/clause text fetched in one Cypher round
+        trip; otherwise the chunks are deduplicated and trimmed to the token
+        budget by the context builder.
+        """
+        builder = self.context_builder
+        graph_context = self.graph_context
+        if graph_context is not None:
+            try:
+                context_text, citations = graph_context.build(docs)
+                stats = {
+                    "chunks_in": len(docs),
+                    "context_tokens": builder.counter.count(context_text),
+                    "token_budget": self.context_token_budget,
+                }
+                return context_text, citations, stats
+            except Exception as e:
+                FALLBACKS.inc(kind="plain_context")
+                logger.warning(f"Graph context failed, using plain context: {str(e)}")
+
+        # Step 4: Combine context
+        context_text, stats = builder.build(question, docs)
+        return context_text, {}, stats
+
+    def _prepare_prompt(self, question: str, docs: list, asked: str = None):
+        """
+        Returns (prompt, citations, prompt_stats) for the retrieved docs.
+        The context is selected for `question` (a follow-up's standalone
+        form); the prompt carries `asked`, the user's own wording, if given.
+        """
+        context_text, citations, stats = self._build_context(question, docs)
+        final_prompt = self._build_prompt(asked or question, context_text)
+        builder = self.context_builder
+        builder.record(stats, builder.counter.count(final_prompt.to_string()))
+        return final_prompt, citations, stats
+
+    async def _aprepare_prompt(self, question: str, docs: list, asked: str = None):
+        # Graph context queries Neo4j; the plain builder counts tokens and
+        # loads its tokenizer on first use
+        return await asyncio.to_thread(self._prepare_prompt, question, docs, asked)
+
+    def _build_prompt(self, question: str, context_text: str):
+        # Step 5: Generate prompt
+        return self.prompt.invoke({
+            "context": context_text,
+            "question": question
+        })
+
+    @staticmethod
+    def _format_sources(docs: list, citations: dict = None) -> list:
+        # Extract sources (Only from the docs we actually used)
+        sources = []
+        for doc in docs:
+            source = {
+                "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+                "metadata": doc.metadata,
+                "page": doc.metadata.get('page', 'N/A')
+            }
+            if citations:
+                ref = chunk_ref(doc.metadata)
+                if ref in citations:
+                    source["citation"] = citations[ref]
+            sources.append(source)
+        return sources
+
+    def query(self, question: str, history: dict = None) -> dict:
+        """
+        Answers a question. history ({"summary", "chunk_ids"} from the chat
+        session) turns on multi-turn mode; the result then carries the
+        session's next state under "conversation".
+        """
+        timings = Timings()
         try:
             logger.info(f"Processing query: {question}")
-            
-            # Step 1: Retrieve MANY documents (Top 25)
-            # We fetch more because the top 10 might be just Table of Contents
-            all_docs = self.retriever.invoke(question)
-            
-            # --- NEW FILTERING LOGIC STARTS HERE ---
-            useful_docs = []
-            for doc in all_docs:
-                content = doc.page_content
-                
-                # Filter 1: Skip if it explicitly says "CONTENTS" (Case insensitive)
-                if "CONTENTS" in content.upper():
-                    continue
-
-                # Filter 2: Skip if it looks like a list of sections (e.g., "301. ... 302. ...")
-                # We count how many times a pattern like "123. " appears. 
-                # If it appears more than 3 times, it's likely an index page.
-                import re
-                section_matches = len(re.findall(r'\d+\.\s', content))
-                if section_matches > 3:
-                    continue
-
-                # If it passed the checks, keep it
-                useful_docs.append(doc)
-
-            # Step 3: Take the top 5 BEST docs from the filtered list
-            # If we filtered everything out (rare), fall back to the original top 3.
-            final_docs = useful_docs[:5] if useful_docs else all_docs[:3]
-            
-            logger.info(f"Retrieved {len(all_docs)} docs, filtered down to {len(final_docs)} useful docs")
-            # ---------------------------------------
 
-            # Step 4: Combine context
-            context_text = "\n\n".join(doc.page_content for doc in final_docs)
-            
-            # Step 5: Generate prompt
-            final_prompt = self.prompt.invoke({
-                "context": context_text,
-                "question": question
-            })
+            if self.intent_gate is not None:
+                with timings.span("intent_gate"):
+                    gated = self.intent_gate.check(question)
+                if gated is not None:
+                    REQUESTS.inc(path="sync", outcome="short_circuit")
+                    return dict(gated, timings=timings.finish())
+
+            question, turn = self._resolve_follow_up(question, history)
+            cached, state = self._check_caches(question, timings, turn)
+            if cached is not None:
+                REQUESTS.inc(path="sync", outcome="cache_hit")
+                return dict(self._with_turn(cached, turn), timings=timings.finish())
+
+            final_docs = self._reuse_chunks(turn, timings)
+            if final_docs is None:
+                final_docs = self._retrieve(question, state["embedding"], timings)
+            with timings.span("prompt"):
+                final_prompt, citations, prompt_stats = self._prepare_prompt(
+                    question, final_docs, asked=turn["question"] if turn else None
+                )
             
             # Step 6: Get response from LLM
             logger.info("Generating response from LLM...")
-            response = self.model.invoke(final_prompt)
-            
-            # Extract sources (Only from the docs we actually used)
-            sources = [
-                {
-                    "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                    "metadata": doc.metadata,
-                    "page": doc.metadata.get('page', 'N/A')
-                }
-                for doc in final_docs
-            ]
+            with timings.span("llm"):
+                response = self.llm_gateway.invoke(final_prompt)
             
-            return {
+            sources = self._format_sources(final_docs, citations)
+            result = {
                 "answer": response.content,
                 "sources": sources,
                 "success": True,
-                "num_sources": len(sources)
+                "num_sources": len(sources),
+                "prompt_stats": prompt_stats
             }
+            self._remember(question, state, result)
+            REQUESTS.inc(path="sync", outcome="answered")
+            return dict(self._with_turn(result, turn), timings=timings.finish())
             
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}")
+            ERRORS.inc(stage="query")
+            REQUESTS.inc(path="sync", outcome="error")
+            return {
+                "answer": f"An error occurred: {str(e)}",
+                "sources": [],
+                "success": False,
+                "error": str(e),
+                "timings": timings.finish()
+            }
+
+    async def aquery(self, question: str, history: dict = None) -> dict:
+        """
+        Async variant of query() for the ASGI entry point. Embedding, cache
+        lookups and writes, component loading and the CPU-bound retrieval
+        stages run in worker threads; the LLM call is awaited, so a slow
+        completion does not hold a thread.
+        """
+        timings = Timings()
+        try:
+            logger.info(f"Processing async query: {question}")
+
+            if self.intent_gate is not None:
+                with timings.span("intent_gate"):
+                    gated = self.intent_gate.check(question)
+                if gated is not None:
+                    REQUESTS.inc(path="async", outcome="short_circuit")
+                    return dict(gated, timings=timings.finish())
+
+            question, turn = self._resolve_follow_up(question, history)
+            cached, state = await asyncio.to_thread(self._check_caches, question, timings, turn)
+            if cached is not None:
+                REQUESTS.inc(path="async", outcome="cache_hit")
+                return dict(self._with_turn(cached, turn), timings=timings.finish())
+
+            final_docs = await self._areuse_chunks(turn, timings)
+            if final_docs is None:
+                final_docs = await self._aretrieve(question, state["embedding"], timings)
+            with timings.span("prompt"):
+                final_prompt, citations, prompt_stats = await self._aprepare_prompt(
+                    question, final_docs, asked=turn["question"] if turn else None
+                )
+
+            logger.info("Generating response from LLM...")
+            with timings.span("llm"):
+                response = await self.llm_gateway.ainvoke(final_prompt)
+
+            sources = self._format_sources(final_docs, citations)
+            result = {
+                "answer": response.content,
+                "sources": sources,
+                "success": True,
+                "num_sources": len(sources),
+                "prompt_stats": prompt_stats
+            }
+            # The sqlite answer cache writes to disk
+            await asyncio.to_thread(self._remember, question, state, result)
+            REQUESTS.inc(path="async", outcome="answered")
+            return dict(self._with_turn(result, turn), timings=timings.finish())
+
+        except Exception as e:
+            logger.error(f"Error processing async query: {str(e)}")
+            ERRORS.inc(stage="aquery")
+            REQUESTS.inc(path="async", outcome="error")
             return {
                 "answer": f"An error occurred: {str(e)}",
                 "sources": [],
                 "success": False,
-                "error": str(e)
+                "error": str(e),
+                "timings": timings.finish()
             }
+
+    def stream_query(self, question: str, history: dict = None):
+        """
+        Streaming variant of query().
+
+        Yields events as dicts: one "sources" event as soon as retrieval is
+        done, a "token" event per LLM chunk, and a final "done" event carrying
+        the full answer and stage timings (or an "error" event). With history,
+        the "done" event also carries the session's next "conversation" state.
+        """
+        timings = Timings()
+        try:
+            logger.info(f"Processing streaming query: {question}")
+
+            gated = None
+            if self.intent_gate is not None:
+                with timings.span("intent_gate"):
+                    gated = self.intent_gate.check(question)
+            if gated is not None:
+                REQUESTS.inc(path="stream", outcome="short_circuit")
+                yield {"type": "sources", "sources": []}
+                yield {"type": "token", "content": gated["answer"]}
+                yield {"type": "done", "answer": gated["answer"], "success": True, "intent": gated["intent"],
+                       "timings": timings.finish()}
+                return
+
+            question, turn = self._resolve_follow_up(question, history)
+            cached, state = self._check_caches(question, timings, turn)
+            if cached is not None:
+                REQUESTS.inc(path="stream", outcome="cache_hit")
+                yield {"type": "sources", "sources": cached["sources"]}
+                yield {"type": "token", "content": cached["answer"]}
+                done = {"type": "done", "answer": cached["answer"], "success": True, "cached": True}
+                yield dict(self._with_turn(done, turn, cached["sources"]), timings=timings.finish())
+                return
+
+            final_docs = self._reuse_chunks(turn, timings)
+            if final_docs is None:
+                final_docs = self._retrieve(question, state["embedding"], timings)
+            with timings.span("prompt"):
+                final_prompt, citations, prompt_stats = self._prepare_prompt(
+                    question, final_docs, asked=turn["question"] if turn else None
+                )
+            sources = self._format_sources(final_docs, citations)
+            yield {"type": "sources", "sources": sources}
+
+            logger.info("Streaming response from LLM...")
+            parts = []
+            started = time.perf_counter()
+            for chunk in self.llm_gateway.stream(final_prompt):
+                if chunk.content:
+                    if not parts:
+                        timings.record("llm_first_token", (time.perf_counter() - started) * 1000)
+                    parts.append(chunk.content)
+                    yield {"type": "token", "content": chunk.content}
+            timings.record("llm", (time.perf_counter() - started) * 1000)
+
+            answer = "".join(parts)
+            self._remember(question, state, {
+                "answer": answer,
+                "sources": sources,
+                "success": True,
+                "num_sources": len(sources),
+                "prompt_stats": prompt_stats
+            })
+            REQUESTS.inc(path="stream", outcome="answered")
+            done = {"type": "done", "answer": answer, "success": True, "prompt_stats": prompt_stats}
+            yield dict(self._with_turn(done, turn, sources), timings=timings.finish())
+
+        except Exception as e:
+            logger.error(f"Error processing streaming query: {str(e)}")
+            ERRORS.inc(stage="stream_query")
+            REQUESTS.inc(path="stream", outcome="error")
+            yield {"type": "error", "answer": f"An error occurred: {str(e)}", "success": False, "error": str(e),
+                   "timings": timings.finish()}
     
+    def get_suggestions(self, text: str, k: int = 4) -> list:
+        """
+        Typeahead suggestions for partial input: article titles and clause
+        headings from the typeahead index, with vector search only for long
+        input. Without a typeahead index every call is a vector search.
+        """
+        k = clamp_k(k)
+        typeahead = self.typeahead
+        if typeahead is None:
+            return self.get_similar_questions(text, k)
+        return typeahead.suggest(text, k)
+
     def get_similar_questions(self, question: str, k: int = 3) -> list:
         """
         Get similar document chunks based on semantic similarity
@@ -219,7 +985,7 @@ class RAGService:
             List of similar document contents
         """
         try:
-            docs = self.vector_store.similarity_search(question, k=k)
+            docs = self._dense_search(self.embeddings.embed_query(question), k)
             return [
                 doc.page_content[:150] + "..." if len(doc.page_content) > 150 else doc.page_content
                 for doc in docs
@@ -230,18 +996,35 @@ class RAGService:
     
     def check_connection(self) -> dict:
         """
-        Check if Neo4j connection is working and documents are loaded
+        Check if Neo4j connection is working and documents are loaded.
+        On Neo4j this is a cached RETURN 1 ping plus a one-time check that
+        the vector index exists, so health probes stay cheap under load.
         
         Returns:
             dict with connection status and document count
         """
         try:
-            # Try to perform a simple search
-            test_docs = self.vector_store.similarity_search("test", k=1)
+            if self.retriever_backend == "local":
+                # Try to perform a simple search
+                test_docs = self.vector_store.similarity_search("test", k=1)
+                return {
+                    "connected": True,
+                    "documents_loaded": len(test_docs) > 0,
+                    "message": "Connection successful"
+                }
+
+            ping = self.neo4j.ping()
+            if ping["connected"] and not self._documents_loaded:
+                rows = self.neo4j.query(
+                    "SHOW VECTOR INDEXES YIELD name WHERE name = $index RETURN name",
+                    {"index": self.index_name},
+                    read=True
+                )
+                self._documents_loaded = len(rows) > 0
             return {
-                "connected": True,
-                "documents_loaded": len(test_docs) > 0,
-                "message": "Connection successful"
+                "connected": ping["connected"],
+                "documents_loaded": ping["connected"] and self._documents_loaded,
+                "message": ping["message"]
             }
         except Exception as e:
             logger.error(f"Connection check failed: {str(e)}")
@@ -249,4 +1032,18 @@ class RAGService:
                 "connected": False,
                 "documents_loaded": False,
                 "message": str(e)
-            }
\ No newline at end of file
+            }
+
+def warm_up_if_configured():
+    """
+    Warms the RAG service at server start when RAG_WARM_ON_STARTUP=1.
+    Called from the WSGI/ASGI entry points, not from manage.py commands.
+    """
+    load_dotenv()
+    if os.getenv("RAG_WARM_ON_STARTUP") != "1":
+        return
+    try:
+        RAGService().warm_up()
+    except Exception as e:
+        # Components are retried lazily on the first request
+        logger.error(f"RAG warm-up failed: {str(e)}")
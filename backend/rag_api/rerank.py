@@ -0,0 +1,93 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Reorders first-stage candidates with a small local cross-encoder.
+
+    All (question, chunk) pairs are scored in one batched CPU pass. The cost
+    per pair is tracked as a moving average; when scoring the candidates is
+    expected to exceed the latency budget, reranking is skipped and the
+    first-stage order is kept.
+
+    The model is warmed up on construction and the first real pass is not
+    measured either, so cold-start cost never feeds the estimate. While
+    skipping, one request every probe_interval seconds is reranked anyway to
+    re-measure, so a slow spell does not switch reranking off for long.
+    """
+
+    def __init__(self, model_name: str, candidates: int = 20, budget_ms: float = 150.0,
+                 probe_interval: float = 30.0):
+        # Imported here so the dependency is only needed when reranking is on
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.candidates = candidates
+        self.budget_ms = budget_ms
+        self.probe_interval = probe_interval
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.ms_per_pair = None
+        self.measured_at = 0.0
+        self._unmeasured = 1
+        self.skipped = 0
+        self.reranked = 0
+        self.probes = 0
+
+        # Warm-up pass; its timing is discarded
+        self._predict("warm up", ["warm up"] * min(candidates, 4))
+
+    def _predict(self, question: str, texts: list):
+        return self.model.predict(
+            [(question, text) for text in texts],
+            batch_size=len(texts),
+            show_progress_bar=False
+        )
+
+    def rerank(self, question: str, docs: list, k: int):
+        """
+        Returns (top_k_docs, timings).
+        """
+        if len(docs) <= 1:
+            return docs[:k], {}
+
+        estimate_ms = self.ms_per_pair * len(docs) if self.ms_per_pair is not None else None
+        probing = estimate_ms is not None and estimate_ms > self.budget_ms
+        if probing:
+            if time.monotonic() - self.measured_at < self.probe_interval:
+                self.skipped += 1
+                logger.info(f"Skipping rerank: estimated {estimate_ms:.1f}ms exceeds budget of {self.budget_ms:.0f}ms")
+                return docs[:k], {"rerank_skipped": 1, "rerank_estimated_ms": estimate_ms}
+            # Re-probe: this request pays for one pass to refresh the estimate
+            self.probes += 1
+
+        started = time.perf_counter()
+        scores = self._predict(question, [doc.page_content for doc in docs])
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        per_pair = elapsed_ms / len(docs)
+        if self._unmeasured:
+            self._unmeasured -= 1
+        elif self.ms_per_pair is None or probing:
+            # First measurement, or a probe: take it as is
+            self.ms_per_pair = per_pair
+        else:
+            self.ms_per_pair = 0.8 * self.ms_per_pair + 0.2 * per_pair
+        self.measured_at = time.monotonic()
+        self.reranked += 1
+
+        ranked = sorted(zip(scores, range(len(docs))), key=lambda pair: pair[0], reverse=True)
+        return [docs[i] for _, i in ranked[:k]], {"rerank_ms": elapsed_ms}
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "candidates": self.candidates,
+            "budget_ms": self.budget_ms,
+            "ms_per_pair": round(self.ms_per_pair, 3) if self.ms_per_pair is not None else None,
+            "reranked": self.reranked,
+            "skipped": self.skipped,
+            "probes": self.probes,
+        }
@@ -0,0 +1,137 @@
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def question_numbers(question: str) -> frozenset:
+    """
+    Numbers mentioned in a question ("section 302", "Article 25").
+    Dense embeddings blur them, so two questions only share an answer if these match.
+    """
+    return frozenset(re.findall(r"\d+", question))
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by question embedding.
+
+    Embeddings are kept L2-normalized in a preallocated float32 matrix, so a
+    lookup is one matrix-vector product. When full, the least recently used
+    row is overwritten. Entries belong to a corpus version and are dropped as
+    soon as a different version is seen.
+    """
+
+    def __init__(self, capacity: int = 2048, threshold: float = 0.95):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._values = [None] * capacity
+        self._numbers = [None] * capacity
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._size = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, version: str):
+        if version != self._version:
+            if self._size:
+                logger.info("Corpus version changed, clearing semantic cache")
+            self._clear()
+            self._version = version
+
+    def _clear(self):
+        self._values = [None] * self.capacity
+        self._numbers = [None] * self.capacity
+        self._last_used[:] = 0
+        self._size = 0
+
+    def lookup(self, question: str, embedding, version: str):
+        """
+        Returns (value, similarity) for the closest cached question above the
+        threshold, or (None, best_similarity).
+        """
+        query = self._normalize(embedding)
+        numbers = question_numbers(question)
+
+        with self._lock:
+            self._check_version(version)
+            if not self._size:
+                self.misses += 1
+                return None, 0.0
+
+            scores = self._vectors[:self._size] @ query
+            for index in np.argsort(scores)[::-1]:
+                if scores[index] < self.threshold:
+                    break
+                if self._numbers[index] == numbers:
+                    self._last_used[index] = time.monotonic()
+                    self.hits += 1
+                    return self._values[index], float(scores[index])
+
+            self.misses += 1
+            return None, float(scores.max())
+
+    def add(self, question: str, embedding, value: dict, version: str):
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            self._check_version(version)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+
+            if self._size < self.capacity:
+                index = self._size
+                self._size += 1
+            else:
+                index = int(np.argmin(self._last_used))
+
+            self._vectors[index] = vector
+            self._values[index] = value
+            self._numbers[index] = question_numbers(question)
+            self._last_used[index] = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "entries": self._size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def build_semantic_cache():
+    """
+    Builds the semantic cache from environment variables.
+
+    RAG_SEMANTIC_CACHE: "1" (default) to enable, "0" to disable
+    RAG_SEMANTIC_CACHE_SIZE: maximum number of cached questions (default 2048)
+    RAG_SEMANTIC_CACHE_THRESHOLD: minimum cosine similarity for a hit (default 0.95)
+    """
+    if os.getenv("RAG_SEMANTIC_CACHE", "1") != "1":
+        return None
+    return SemanticCache(
+        capacity=int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", "2048")),
+        threshold=float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    )
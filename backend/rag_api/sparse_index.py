@@ -0,0 +1,126 @@
+import json
+import logging
+import math
+import re
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .vector_index import CHUNKS_FILE
+
+logger = logging.getLogger(__name__)
+
+VOCAB_FILE = "sparse_vocab.json"
+INDPTR_FILE = "sparse_indptr.npy"
+DOCS_FILE = "sparse_docs.npy"
+WEIGHTS_FILE = "sparse_weights.npy"
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were
+which with what who whom whose when where why how under any such shall may than then there
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """
+    Lower-cased alphanumeric tokens without stopwords. Numbers are kept, so
+    "section 302" and "Article 25" match exactly.
+    """
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+
+def build_sparse_index(index_dir, k1: float = 1.5, b: float = 0.75):
+    """
+    Builds a BM25 inverted index over the chunks of an index directory.
+
+    Postings are stored in CSR form: for term t, sparse_docs[indptr[t]:indptr[t+1]]
+    are chunk rows and sparse_weights the matching precomputed BM25 weights,
+    so a query is a handful of slice-adds. Rows match chunks.json.
+    """
+    index_dir = Path(index_dir)
+    with open(index_dir / CHUNKS_FILE, encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    term_counts = [Counter(tokenize(chunk["text"])) for chunk in chunks]
+    lengths = np.array([sum(c.values()) for c in term_counts], dtype=np.float32)
+    avg_length = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+
+    postings = {}
+    for row, counts in enumerate(term_counts):
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((row, tf))
+
+    vocab = {}
+    indptr = [0]
+    docs = []
+    weights = []
+    n_docs = len(chunks)
+    for term in sorted(postings):
+        entries = postings[term]
+        idf = math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+        for row, tf in entries:
+            norm = k1 * (1 - b + b * lengths[row] / avg_length)
+            docs.append(row)
+            weights.append(idf * tf * (k1 + 1) / (tf + norm))
+        vocab[term] = len(vocab)
+        indptr.append(len(docs))
+
+    np.save(index_dir / INDPTR_FILE, np.asarray(indptr, dtype=np.int64))
+    np.save(index_dir / DOCS_FILE, np.asarray(docs, dtype=np.int32))
+    np.save(index_dir / WEIGHTS_FILE, np.asarray(weights, dtype=np.float32))
+    with open(index_dir / VOCAB_FILE, "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    return len(vocab)
+
+
+class SparseIndex:
+    """
+    BM25 lexical index over Clause/SubClause/Article text, built at ingest.
+    """
+
+    def __init__(self, index_dir, chunks: list = None):
+        index_dir = Path(index_dir)
+        if chunks is None:
+            with open(index_dir / CHUNKS_FILE, encoding="utf-8") as f:
+                chunks = json.load(f)
+        self.chunks = chunks
+        self.flagged = np.array([bool(c["metadata"].get("is_toc")) for c in chunks], dtype=bool)
+        with open(index_dir / VOCAB_FILE, encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        self.indptr = np.load(index_dir / INDPTR_FILE, mmap_mode="r")
+        self.docs = np.load(index_dir / DOCS_FILE, mmap_mode="r")
+        self.weights = np.load(index_dir / WEIGHTS_FILE, mmap_mode="r")
+        logger.info(f"Loaded sparse index: {len(self.vocab)} terms over {len(self.chunks)} chunks")
+
+    @staticmethod
+    def exists(index_dir) -> bool:
+        return (Path(index_dir) / VOCAB_FILE).exists()
+
+    def search(self, query: str, k: int) -> list:
+        """
+        Returns [(chunk_row, score)] for the top k unflagged chunks by BM25.
+        """
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            scores[self.docs[start:end]] += self.weights[start:end]
+        scores[self.flagged] = 0
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        k = min(k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def search_documents(self, query: str, k: int) -> list:
+        return [
+            Document(page_content=self.chunks[row]["text"], metadata=dict(self.chunks[row]["metadata"]))
+            for row, _ in self.search(query, k)
+        ]
@@ -1,3 +1,1143 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from langchain_core.documents import Document
+from neo4j import RoutingControl
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from rest_framework.test import APIClient
+
+from . import views
+from .answer_cache import AnswerCache, InMemoryBackend, SQLiteBackend, make_cache_key
+from .benchmark import compare, first_relevant_rank, load_queries, score
+from .chat_store import ChatStore, build_chat_store
+from .context_builder import ContextBuilder, TokenCounter, split_sentences
+from .conversation import Conversation
+from .graph_context import GraphContextBuilder, chunk_ref
+from .hybrid import HybridRetriever, reciprocal_rank_fusion
+from .intent_gate import GREETING_REPLY, NON_ENGLISH_REPLY, IntentGate, classify
+from .llm_gateway import LLMBusyError, LLMGateway
+from .llm_router import Backend, LLMRouter
+from .models import ChatMessage, ChatSession
+from .neo4j_client import Neo4jClient
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .rag_service import RAGService
+from .rerank import CrossEncoderReranker
+from .semantic_cache import SemanticCache
+from .sparse_index import SparseIndex, build_sparse_index
+from .typeahead import TypeaheadIndex, build_typeahead_index, clamp_k
+from .vector_index import LocalVectorStore, build_local_index
+
+
+def chunk(chunk_id, label, text, vector_axis, **metadata):
+    metadata.update(chunk_id=chunk_id, label=label)
+    return {"id": chunk_id, "label": label, "text": text, "metadata": metadata}, vector_axis
+
+
+# A tiny index: one unit vector per chunk, so a query along an axis finds
+# that chunk first. The TOC chunk is the best match for both kinds of search.
+CHUNKS = [
+    chunk("a1", "Article", "Cyber stalking", 0, title="Cyber stalking"),
+    chunk("c1", "Clause", "Whoever harasses a person through an information system commits cyber stalking",
+          1, article_title="Cyber stalking", number="(1)"),
+    chunk("c2", "Clause", "Spamming means sending unsolicited marketing messages", 2,
+          article_title="Spamming", number="(1)"),
+    chunk("toc", "Clause", "Cyber stalking ........ 12 Spamming ........ 13 stalking stalking", 3,
+          article_title="Contents", number="(1)", is_toc=True),
+]
+
+
+def build_index(index_dir):
+    vectors = []
+    for _, axis in CHUNKS:
+        vector = [0.0] * 4
+        vector[axis] = 1.0
+        vectors.append(vector)
+    build_local_index([c for c, _ in CHUNKS], vectors, index_dir, {"model": "test", "corpus_version": "v1"})
+    build_sparse_index(index_dir)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        corpus = {"chapters": {"CHAPTER I": {"articles": [{
+            "title": "Cyber stalking",
+            "content": {"clauses": [
+                {"clause_number": "(1)", "clause_text": "A person commits the offence of cyber stalking who, "
+                                                        "with the intent to coerce or harass, follows a person"},
+                {"clause_number": "(2)", "clause_text": "Too short"},
+            ]},
+        }]}}}
+        self.corpus = Path(self.tmp.name) / "corpus.json"
+        self.corpus.write_text(json.dumps(corpus))
+        self.held_out = Path(self.tmp.name) / "held_out.json"
+        self.held_out.write_text(json.dumps([
+            {"query": "Someone keeps messaging and following me", "article": "Cyber stalking", "clause": "(1)"},
+        ]))
+
+    def test_load_queries(self):
+        queries = load_queries(self.corpus, held_out_path=self.held_out)
+        self.assertEqual([q["kind"] for q in queries], ["held_out", "article", "clause"])
+        clause = queries[2]
+        self.assertEqual(clause["clause"], "(1)")
+        # Not a copy of the clause's opening words
+        self.assertNotIn("A person commits", clause["query"])
+        self.assertEqual(len(load_queries(self.corpus, limit=1, held_out_path=None)), 1)
+
+    def test_first_relevant_rank(self):
+        article_query = {"kind": "article", "article": "Cyber stalking", "clause": None}
+        clause_query = {"kind": "clause", "article": "Cyber stalking", "clause": "(2)"}
+        retrieved = [
+            {"title": "Spamming"},
+            {"article_title": "Cyber stalking", "number": "(1)"},
+            {"article_title": "Cyber stalking", "clause_number": "(2)", "number": "(a)"},
+        ]
+        self.assertEqual(first_relevant_rank(article_query, retrieved), 2)
+        self.assertEqual(first_relevant_rank(clause_query, retrieved), 3)
+        self.assertIsNone(first_relevant_rank(clause_query, retrieved[:2]))
+
+    def test_score(self):
+        metrics = score([1, 3, None, 2], (1, 3))
+        self.assertEqual(metrics["queries"], 4)
+        self.assertEqual(metrics["recall@1"], 0.25)
+        self.assertEqual(metrics["recall@3"], 0.75)
+        self.assertEqual(metrics["mrr"], round((1 + 1 / 3 + 1 / 2) / 4, 4))
+        self.assertEqual(score([], (1,)), {"queries": 0})
+
+    def test_compare(self):
+        report = {"metrics": {"all": {"queries": 10, "mrr": 0.6}}, "latency_ms": {"total": {"p95": 12.0}}}
+        baseline = {"metrics": {"all": {"queries": 8, "mrr": 0.5}}, "latency_ms": {"total": {"p95": 10.0}}}
+        self.assertEqual(compare(report, baseline), {"all.mrr": 0.1, "latency.total.p95": 2.0})
+
+
+class AnswerCacheTests(SimpleTestCase):
+    def test_cache_key(self):
+        key = make_cache_key("What is Spamming?", "prompt", "local", "v1")
+        self.assertEqual(key, make_cache_key("  what is   spamming ", "prompt", "local", "v1"))
+        self.assertNotEqual(key, make_cache_key("What is Spamming?", "prompt", "gemini", "v1"))
+        self.assertNotEqual(key, make_cache_key("What is Spamming?", "prompt", "local", "v2"))
+
+    def test_memory_backend_lru_and_ttl(self):
+        backend = InMemoryBackend(max_entries=2, ttl=60)
+        backend.set("a", {"answer": 1})
+        backend.set("b", {"answer": 2})
+        backend.get("a")
+        backend.set("c", {"answer": 3})
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("a"), {"answer": 1})
+
+        expired = InMemoryBackend(max_entries=2, ttl=-1)
+        expired.set("a", {"answer": 1})
+        self.assertIsNone(expired.get("a"))
+
+    def test_sqlite_backend(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = SQLiteBackend(Path(tmp) / "cache.sqlite3", max_entries=2, ttl=60)
+            for key in "abc":
+                backend.set(key, {"answer": key})
+                time.sleep(0.01)
+            self.assertEqual(len(backend), 2)
+            self.assertIsNone(backend.get("a"))
+            self.assertEqual(backend.get("c"), {"answer": "c"})
+            backend._connection().close()
+
+    def test_hit_and_miss_counters(self):
+        cache = AnswerCache(InMemoryBackend(max_entries=4, ttl=60))
+        self.assertIsNone(cache.get("k"))
+        cache.set("k", {"answer": "x"})
+        self.assertEqual(cache.get("k"), {"answer": "x"})
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+
+class SemanticCacheTests(SimpleTestCase):
+    def test_hit_above_threshold(self):
+        cache = SemanticCache(capacity=4, threshold=0.9)
+        cache.add("what is spamming", [1.0, 0.0], {"answer": "x"}, "v1")
+        value, similarity = cache.lookup("define spamming", [0.99, 0.05], "v1")
+        self.assertEqual(value, {"answer": "x"})
+        self.assertGreater(similarity, 0.9)
+        self.assertIsNone(cache.lookup("something else", [0.0, 1.0], "v1")[0])
+
+    def test_numbers_must_match(self):
+        cache = SemanticCache(capacity=4, threshold=0.9)
+        cache.add("punishment under section 20", [1.0, 0.0], {"answer": "x"}, "v1")
+        self.assertIsNone(cache.lookup("punishment under section 21", [1.0, 0.0], "v1")[0])
+
+    def test_version_change_clears(self):
+        cache = SemanticCache(capacity=4, threshold=0.9)
+        cache.add("what is spamming", [1.0, 0.0], {"answer": "x"}, "v1")
+        self.assertIsNone(cache.lookup("what is spamming", [1.0, 0.0], "v2")[0])
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_evicts_least_recently_used(self):
+        cache = SemanticCache(capacity=2, threshold=0.9)
+        cache.add("a", [1.0, 0.0, 0.0], {"answer": "a"}, "v1")
+        cache.add("b", [0.0, 1.0, 0.0], {"answer": "b"}, "v1")
+        cache.lookup("a", [1.0, 0.0, 0.0], "v1")
+        cache.add("c", [0.0, 0.0, 1.0], {"answer": "c"}, "v1")
+        self.assertIsNone(cache.lookup("b", [0.0, 1.0, 0.0], "v1")[0])
+        self.assertEqual(cache.lookup("a", [1.0, 0.0, 0.0], "v1")[0], {"answer": "a"})
+
+
+class LocalIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        build_index(self.tmp.name)
+
+    def test_dense_search_skips_toc(self):
+        store = LocalVectorStore(self.tmp.name, embeddings=None)
+        docs = store.similarity_search_by_vector([0.1, 0.2, 0.0, 1.0], k=10)
+        ids = [doc.metadata["chunk_id"] for doc in docs]
+        self.assertEqual(ids[0], "c1")
+        self.assertNotIn("toc", ids)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(store.corpus_version, "v1")
+
+    def test_get_documents(self):
+        store = LocalVectorStore(self.tmp.name, embeddings=None)
+        docs = store.get_documents(["c2", "missing", "a1"])
+        self.assertEqual([doc.metadata["chunk_id"] for doc in docs], ["c2", "a1"])
+
+
+class SparseIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        build_index(self.tmp.name)
+
+    def test_sparse_search_skips_toc(self):
+        index = SparseIndex(self.tmp.name)
+        ids = [doc.metadata["chunk_id"] for doc in index.search_documents("cyber stalking", 10)]
+        self.assertIn("c1", ids)
+        self.assertNotIn("toc", ids)
+        self.assertEqual(index.search("nothing matches", 5), [])
+
+
+class HybridFusionTests(SimpleTestCase):
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([
+            (1.0, [("a", "A"), ("b", "B")]),
+            (1.0, [("b", "B"), ("c", "C")]),
+        ], rrf_k=60)
+        self.assertEqual([key for key, _, _ in fused], ["b", "a", "c"])
+        self.assertAlmostEqual(fused[0][2], 1 / 62 + 1 / 61)
+
+    def test_weights(self):
+        fused = reciprocal_rank_fusion([(1.0, [("a", "A")]), (3.0, [("c", "C")])])
+        self.assertEqual(fused[0][0], "c")
+
+    def test_fuse_dedupes_by_chunk_id(self):
+        retriever = HybridRetriever(sparse_index=None)
+        dense = [Document(page_content="x", metadata={"chunk_id": "1"}),
+                 Document(page_content="y", metadata={"chunk_id": "2"})]
+        sparse = [Document(page_content="y", metadata={"chunk_id": "2"})]
+        docs = retriever.fuse(dense, sparse, k=5)
+        self.assertEqual([doc.metadata["chunk_id"] for doc in docs], ["2", "1"])
+
+
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="reader", password="pw")
+        self.sessions = [ChatSession.objects.create(user=self.user, title=f"Chat {i}") for i in range(5)]
+
+    def test_pages_cover_every_row_once(self):
+        queryset = ChatSession.objects.filter(user=self.user)
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = keyset_page(queryset.values("session_id", "updated_at"), "updated_at", "session_id",
+                                       cursor, size=2, descending=True)
+            seen.extend(row["session_id"] for row in rows)
+            if cursor is None:
+                break
+        expected = [s.session_id for s in queryset.order_by("-updated_at", "-session_id")]
+        self.assertEqual(seen, expected)
+
+    def test_cursor_round_trip(self):
+        session = self.sessions[0]
+        timestamp, key = decode_cursor(encode_cursor(session.updated_at, session.session_id))
+        self.assertEqual(timestamp, session.updated_at)
+        self.assertEqual(key, str(session.session_id))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor("not-a-cursor")
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor(timezone.now(), "not-a-uuid"), uuid.UUID)
+
+    def test_forged_cursor_is_a_bad_request(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        forged = encode_cursor(timezone.now(), "not-a-uuid")
+        response = client.get("/api/history/", {"cursor": forged})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cursor", response.data["error"])
+
+        session = self.sessions[0]
+        response = client.get(f"/api/history/{session.session_id}/", {"cursor": forged})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cursor", response.data["error"])
+
+
+class ChatStoreWriteTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="writer", password="pw")
+        self.store = ChatStore()
+
+    def test_new_session_is_inserted_with_its_messages(self):
+        session = self.store.new_session(self.user, "What is spamming?")
+        self.store.save_exchange(session, "What is spamming?", "Sending unsolicited messages.", new_session=True)
+        saved = ChatSession.objects.get(session_id=session.session_id)
+        self.assertEqual(saved.title, "What is spamming?")
+        roles = list(ChatMessage.objects.filter(session=saved).order_by("message_id").values_list("role", flat=True))
+        self.assertEqual(roles, ["user", "assistant"])
+        self.assertEqual(self.store.stats()["exchanges"], 1)
+
+    def test_batch_updates_state_and_touches_sessions(self):
+        first = ChatSession.objects.create(user=self.user, title="First")
+        second = ChatSession.objects.create(user=self.user, title="Second")
+        before = ChatSession.objects.get(session_id=second.session_id).updated_at
+
+        first.summary, first.last_chunk_ids = "what is spamming", ["c2"]
+        self.store._write([
+            (first, False, True, [ChatMessage(session=first, role="user", content="and the fine?")]),
+            (second, False, False, [ChatMessage(session=second, role="user", content="hello")]),
+        ])
+
+        first = ChatSession.objects.get(session_id=first.session_id)
+        self.assertEqual((first.summary, first.last_chunk_ids), ("what is spamming", ["c2"]))
+        self.assertGreater(ChatSession.objects.get(session_id=second.session_id).updated_at, before)
+        self.assertEqual(ChatMessage.objects.count(), 2)
+        self.assertEqual(self.store.stats()["batches"], 1)
+
+
+class ChatStoreOverflowTests(TransactionTestCase):
+    def test_async_save_on_a_full_queue(self):
+        user = get_user_model().objects.create_user(username="burst", password="pw")
+        store = ChatStore(write_behind=True, max_pending=1, flush_interval=0.2)
+
+        async def burst():
+            for i in range(3):
+                session = store.new_session(user, f"question {i}")
+                await store.asave_exchange(session, f"question {i}", "answer", new_session=True)
+
+        # The overflow write must not run the sync ORM on the event loop
+        async_to_sync(burst)()
+        store.flush()
+        self.assertGreaterEqual(store.stats()["overflow"], 1)
+        self.assertEqual(ChatMessage.objects.count(), 6)
+
+
+class ChatStoreWriteBehindTests(TransactionTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="behind", password="pw")
+
+    def test_failed_batch_keeps_the_writable_exchanges(self):
+        store = ChatStore(write_behind=True, flush_interval=0.1)
+        write = store._write
+
+        def flaky(exchanges):
+            if any(message.content == "poison" for exchange in exchanges for message in exchange[3]):
+                raise DatabaseError("constraint failed")
+            write(exchanges)
+
+        with mock.patch.object(store, "_write", side_effect=flaky):
+            for question in ("first", "poison", "third"):
+                session = store.new_session(self.user, question)
+                store.save_exchange(session, question, "answer", new_session=True)
+            store.flush()
+
+        self.assertEqual(ChatSession.objects.count(), 2)
+        self.assertEqual(ChatMessage.objects.count(), 4)
+        self.assertEqual(store.stats()["failed"], 1)
+        self.assertEqual(store._pending_sessions, {})
+
+    def test_queued_state_is_visible_before_the_flush(self):
+        store = ChatStore(write_behind=True, flush_interval=0.3)
+        existing = ChatSession.objects.create(user=self.user, title="Spamming")
+        session = store.get_session(self.user, existing.session_id)
+        store.save_exchange(session, "and the fine?", "answer", conversation={"summary": "spamming fine", "chunk_ids": ["c2"]})
+
+        queued = store.get_session(self.user, existing.session_id)
+        self.assertEqual((queued.summary, queued.last_chunk_ids), ("spamming fine", ["c2"]))
+
+        store.flush()
+        self.assertEqual(store._pending_sessions, {})
+        saved = store.get_session(self.user, existing.session_id)
+        self.assertEqual((saved.summary, saved.last_chunk_ids), ("spamming fine", ["c2"]))
+
+    def test_write_behind_needs_a_single_worker(self):
+        env = {"RAG_CHAT_WRITE_BEHIND": "1", "WEB_CONCURRENCY": "4"}
+        with mock.patch.dict(os.environ, env):
+            with self.assertRaises(ImproperlyConfigured):
+                build_chat_store()
+
+
+class TypeaheadTests(SimpleTestCase):
+    ENTRIES = [
+        {"text": "Cyber stalking", "kind": "Article"},
+        {"text": "Cyberbullying", "kind": "Article"},
+        {"text": "Cyber terrorism", "kind": "Article"},
+        {"text": "Cyber stalking (2): Punishable with imprisonment up to three", "kind": "Clause"},
+    ]
+
+    def test_trie_prefix_keeps_rank_order(self):
+        index = TypeaheadIndex(self.ENTRIES)
+        self.assertEqual(index.suggest("cyber", k=3), ["Cyber stalking", "Cyberbullying", "Cyber terrorism"])
+        self.assertEqual(index.suggest("Cyber st", k=4)[0], "Cyber stalking")
+        self.assertEqual(index.stats()["trie_hits"], 2)
+
+    def test_ngram_fallback_matches_inner_words(self):
+        index = TypeaheadIndex(self.ENTRIES)
+        self.assertEqual(index.suggest("terror", k=2), ["Cyber terrorism"])
+        self.assertEqual(index.suggest("stalking punish", k=2), [self.ENTRIES[3]["text"]])
+        self.assertEqual(index.suggest("zzz", k=2), [])
+
+    def test_vector_fallback_for_long_inputs(self):
+        calls = []
+
+        def fallback(text, k):
+            calls.append(text)
+            return ["Spamming"]
+
+        index = TypeaheadIndex(self.ENTRIES, vector_fallback=fallback, vector_min_chars=10)
+        self.assertEqual(index.suggest("sending unwanted adverts", k=2), ["Spamming"])
+        self.assertEqual(index.suggest("short", k=2), [])
+        self.assertEqual(len(calls), 1)
+
+    def test_debounce(self):
+        index = TypeaheadIndex(self.ENTRIES)
+        first = index.suggest("cyb", k=2)
+        self.assertEqual(index.suggest("CYB", k=2), first)
+        self.assertEqual(index.stats()["debounced"], 1)
+
+    def test_clamp_k(self):
+        self.assertEqual(clamp_k(None), 4)
+        self.assertEqual(clamp_k("0"), 1)
+        self.assertEqual(clamp_k(50), 10)
+
+    def test_build_skips_toc(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            build_index(tmp)
+            self.assertEqual(build_typeahead_index(tmp), 3)
+            index = TypeaheadIndex.load(tmp)
+            self.assertEqual(index.texts[0], "Cyber stalking")
+            self.assertFalse(any(text.startswith("Contents") for text in index.texts))
+
+
+class QueryStreamTests(TestCase):
+    EVENTS = [
+        {"type": "sources", "sources": []},
+        {"type": "token", "content": "Sending "},
+        {"type": "token", "content": "spam."},
+        {"type": "done", "answer": "Sending spam.", "success": True, "timings": {"llm": 1.0}},
+    ]
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="streamer", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        patcher = mock.patch.object(views.rag_service, "stream_query", side_effect=self.stream_query)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stream_query(self, question, history=None):
+        yield from self.EVENTS
+
+    def stream(self):
+        return self.client.post("/api/query/stream/", {"question": "What is spamming?"}, format="json")
+
+    def test_done_event_carries_the_request_timings(self):
+        body = b"".join(self.stream().streaming_content).decode()
+        done = json.loads(body.split("event: done\ndata: ")[1])
+        self.assertIn("db_read", done["timings"])
+        self.assertIn("db_write", done["timings"])
+        self.assertEqual(done["timings"]["llm"], 1.0)
+        self.assertEqual(ChatMessage.objects.get(role="assistant").content, "Sending spam.")
+
+    def test_disconnect_saves_the_partial_answer(self):
+        response = self.stream()
+        content = iter(response.streaming_content)
+        for _ in range(3):  # session, sources, first token
+            next(content)
+        response.close()
+        self.assertEqual(ChatMessage.objects.get(role="assistant").content, "Sending ")
+
+    def test_failed_save_still_ends_the_stream(self):
+        with mock.patch.object(views.chat_store, "save_exchange", side_effect=DatabaseError("down")):
+            body = b"".join(self.stream().streaming_content).decode()
+        self.assertIn("event: done", body)
+        self.assertFalse(ChatMessage.objects.exists())
+
+
+class ConversationTests(SimpleTestCase):
+    SUMMARY = "What is cyber stalking?"
+
+    def setUp(self):
+        self.conversation = Conversation(summary_chars=80)
+
+    def test_follow_up_detection(self):
+        self.assertTrue(self.conversation.is_follow_up("Is it bailable?", self.SUMMARY))
+        self.assertTrue(self.conversation.is_follow_up("and the punishment for that?", self.SUMMARY))
+        self.assertFalse(self.conversation.is_follow_up("What is spamming?", self.SUMMARY))
+        self.assertFalse(self.conversation.is_follow_up("Is it bailable?", ""))
+        # A number or an unseen name starts a new topic
+        self.assertFalse(self.conversation.is_follow_up("what about Article 25 of it?", self.SUMMARY))
+        self.assertFalse(self.conversation.is_follow_up("is it the same in Punjab?", self.SUMMARY))
+        # "this" before a noun is a determiner, not a reference
+        self.assertFalse(self.conversation.is_follow_up("What does this law say about spamming?", self.SUMMARY))
+
+    def test_rewrite(self):
+        standalone, follow_up = self.conversation.rewrite("Is it bailable?", self.SUMMARY)
+        self.assertTrue(follow_up)
+        self.assertEqual(standalone, f"Is it bailable? (follow-up to: {self.SUMMARY})")
+        self.assertEqual(self.conversation.rewrite("What is spamming?", self.SUMMARY), ("What is spamming?", False))
+
+    def test_summary_keeps_the_anchor_and_stays_bounded(self):
+        summary = self.conversation.update_summary("", self.SUMMARY, False)
+        for question in ("Is it bailable?", "and the punishment for that?", "what about the fine for it?"):
+            summary = self.conversation.update_summary(summary, question, True)
+        self.assertLessEqual(len(summary), 80)
+        self.assertTrue(summary.startswith(self.SUMMARY))
+        self.assertTrue(summary.endswith("what about the fine for it?"))
+        self.assertNotIn("bailable", summary)
+        # A new topic replaces the summary
+        self.assertEqual(self.conversation.update_summary(summary, "What is spamming?", False), "What is spamming?")
+
+    def test_covers(self):
+        docs = [Document(page_content="Cyber stalking is punishable with imprisonment and a fine.")]
+        self.assertTrue(self.conversation.covers("what is the fine for it?", docs))
+        self.assertFalse(self.conversation.covers("is it bailable?", docs))
+        self.assertEqual(self.conversation.stats()["chunks_reused"], 1)
+
+
+def fresh_service(env):
+    """A RAGService configured from env, separate from the process-wide singleton."""
+    with mock.patch.dict(os.environ, env):
+        service = object.__new__(RAGService)
+        service._initialized = False
+        service.__init__()
+    return service
+
+
+class FollowUpCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        build_index(self.tmp.name)
+        env = {
+            "RAG_RETRIEVER_BACKEND": "local",
+            "RAG_LOCAL_INDEX_DIR": self.tmp.name,
+            "RAG_LLM_BACKENDS": "local",
+            "RAG_CACHE_BACKEND": "memory",
+        }
+        self.service = fresh_service(env)
+        # Every text embeds to the same vector, so any semantic lookup is a hit
+        embeddings = mock.Mock()
+        embeddings.embed_query.return_value = [0.0, 1.0, 0.0, 0.0]
+        self.service._components["embeddings"] = embeddings
+
+    def test_two_follow_ups_in_one_session_get_their_own_answers(self):
+        history = {"summary": "What is cyber stalking?", "chunk_ids": []}
+        first = self.service.query("Is it bailable?", history=history)
+        second = self.service.query("what is the punishment for it?", history=history)
+        self.assertTrue(first["conversation"]["follow_up"])
+        self.assertTrue(second["conversation"]["follow_up"])
+        self.assertFalse(second.get("cached"))
+
+        # Standalone questions still use the semantic cache
+        self.service.query("What is cyber stalking?")
+        self.assertTrue(self.service.query("Define cyber stalking").get("cached"))
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(status_code=429, headers={"retry-after": retry_after})
+
+
+class ConnectionDropped(Exception):
+    pass
+
+
+class StubChatModel:
+    """
+    Answers "answer:<prompt>", blocking while gate is clear. Each call
+    raises the next queued failure, if any; streams raise it after
+    fail_after chunks.
+    """
+
+    def __init__(self, failures=(), chunks=("a", "b"), fail_after=0):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+        self.failures = list(failures)
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.calls = []
+
+    def _call(self, prompt):
+        self.calls.append((prompt, time.monotonic()))
+        self.started.set()
+        self.gate.wait(5)
+        if self.failures:
+            raise self.failures.pop(0)
+        return f"answer:{prompt}"
+
+    def invoke(self, prompt):
+        return self._call(prompt)
+
+    async def ainvoke(self, prompt):
+        return await asyncio.to_thread(self._call, prompt)
+
+    def stream(self, prompt):
+        self.calls.append((prompt, time.monotonic()))
+        error = self.failures.pop(0) if self.failures else None
+        for i, chunk in enumerate(self.chunks):
+            if error is not None and i == self.fail_after:
+                raise error
+            yield chunk
+
+
+class LLMGatewayTests(SimpleTestCase):
+    def call_in_thread(self, gateway, prompt):
+        results = {}
+
+        def run():
+            try:
+                results["value"] = gateway.invoke(prompt)
+            except Exception as e:
+                results["error"] = e
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread, results
+
+    def test_identical_prompts_share_one_call(self):
+        model = StubChatModel()
+        model.gate.clear()
+        gateway = LLMGateway(model)
+        leader, leader_result = self.call_in_thread(gateway, "p")
+        model.started.wait(5)
+        follower, follower_result = self.call_in_thread(gateway, "p")
+        while gateway.stats()["coalesced"] == 0:
+            time.sleep(0.005)
+        model.gate.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(leader_result["value"], "answer:p")
+        self.assertEqual(follower_result["value"], "answer:p")
+        self.assertEqual(len(model.calls), 1)
+        self.assertEqual(gateway._pending, {})
+
+    def test_follower_starts_over_when_the_leader_is_cancelled(self):
+        gateway = LLMGateway(StubChatModel())
+        future, leader = gateway._join("k")
+        self.assertTrue(leader)
+        follower_future, follower_leads = gateway._join("k")
+        self.assertIs(follower_future, future)
+        self.assertFalse(follower_leads)
+        gateway._finish("k", future, error=KeyboardInterrupt())
+        self.assertTrue(future.cancelled())
+        _, leader = gateway._join("k")
+        self.assertTrue(leader)
+
+    def test_full_queue_is_rejected(self):
+        model = StubChatModel()
+        model.gate.clear()
+        gateway = LLMGateway(model, max_in_flight=1, max_queue=1)
+        self.call_in_thread(gateway, "running")
+        model.started.wait(5)
+        self.call_in_thread(gateway, "queued")
+        while gateway.stats()["queue_depth"] < 1:
+            time.sleep(0.005)
+        with self.assertRaises(LLMBusyError):
+            gateway.invoke("rejected")
+        model.gate.set()
+        self.assertEqual(gateway.stats()["rejected"], 1)
+
+    def test_queue_timeout(self):
+        model = StubChatModel()
+        model.gate.clear()
+        gateway = LLMGateway(model, max_in_flight=1, queue_timeout=0.05)
+        self.call_in_thread(gateway, "running")
+        model.started.wait(5)
+        with self.assertRaises(LLMBusyError):
+            gateway.invoke("waiting")
+        with self.assertRaises(LLMBusyError):
+            async_to_sync(gateway.ainvoke)("waiting")
+        model.gate.set()
+        self.assertEqual(gateway.stats()["timeouts"], 2)
+        self.assertEqual(gateway.stats()["queue_depth"], 0)
+
+    def test_async_waiters_get_slots_in_order(self):
+        model = StubChatModel()
+        gateway = LLMGateway(model, max_in_flight=1)
+        order = []
+
+        async def caller(name):
+            await gateway._aacquire()
+            order.append(name)
+            await asyncio.sleep(0.01)
+            gateway._release()
+
+        async def run():
+            await gateway._aacquire()
+            tasks = []
+            for name in "abc":
+                tasks.append(asyncio.create_task(caller(name)))
+                await asyncio.sleep(0)
+            gateway._release()
+            await asyncio.gather(*tasks)
+
+        async_to_sync(run)()
+        self.assertEqual(order, ["a", "b", "c"])
+        self.assertEqual(gateway.stats()["in_flight"], 0)
+        self.assertIsNotNone(gateway.try_acquire_extra())
+
+    def test_retry_after_pauses_every_caller(self):
+        model = StubChatModel(failures=[RateLimited("0.2")])
+        gateway = LLMGateway(model, backoff=0.01)
+        failing, result = self.call_in_thread(gateway, "limited")
+        while not gateway.stats()["rate_limited"]:
+            time.sleep(0.005)
+        self.assertIsNone(gateway.try_acquire_extra())
+        self.assertEqual(gateway.invoke("other"), "answer:other")
+        failing.join(5)
+        self.assertEqual(result["value"], "answer:limited")
+        limited_at = model.calls[0][1]
+        self.assertTrue(all(at - limited_at >= 0.15 for _, at in model.calls[1:]))
+        self.assertEqual(gateway.stats()["retried"], 1)
+
+    def test_stream_retries_only_before_the_first_chunk(self):
+        model = StubChatModel(failures=[ConnectionDropped()])
+        gateway = LLMGateway(model, backoff=0.01)
+        self.assertEqual(list(gateway.stream("p")), ["a", "b"])
+        self.assertEqual(len(model.calls), 2)
+
+        model = StubChatModel(failures=[ConnectionDropped()], fail_after=1)
+        gateway = LLMGateway(model, backoff=0.01)
+        received = []
+        with self.assertRaises(ConnectionDropped):
+            for chunk in gateway.stream("p"):
+                received.append(chunk)
+        self.assertEqual(received, ["a"])
+        self.assertEqual(len(model.calls), 1)
+        self.assertEqual(gateway.stats()["in_flight"], 0)
+
+
+class StubBackendModel:
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.started = []
+
+    def _answer(self, prompt):
+        if self.error is not None:
+            raise self.error
+        return f"{self.name}:{prompt}"
+
+    def invoke(self, prompt):
+        self.started.append(time.monotonic())
+        time.sleep(self.delay)
+        return self._answer(prompt)
+
+    async def ainvoke(self, prompt):
+        self.started.append(time.monotonic())
+        await asyncio.sleep(self.delay)
+        return self._answer(prompt)
+
+
+class ExtraSlots:
+    """Counts extra slots handed to the router; limit=0 refuses every one."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.granted = 0
+        self.outstanding = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            if self.limit is not None and self.outstanding >= self.limit:
+                return None
+            self.granted += 1
+            self.outstanding += 1
+        return self.release
+
+    def release(self):
+        with self._lock:
+            self.outstanding -= 1
+
+
+class LLMRouterTests(SimpleTestCase):
+    def router(self, *models, deadline_ms=50, limit=None):
+        # Both backends are unmeasured, so they are tried in the given order
+        router = LLMRouter([Backend(model.name, model) for model in models], deadline_ms=deadline_ms)
+        router.extra_slot = ExtraSlots(limit)
+        return router
+
+    def calls(self):
+        # Each scenario runs on the sync and the async path, with a fresh router
+        for name in ("invoke", "ainvoke"):
+            with self.subTest(name):
+                yield (lambda router: router.invoke) if name == "invoke" else (lambda router: async_to_sync(router.ainvoke))
+
+    def test_hedge_fires_after_hedge_after(self):
+        for call in self.calls():
+            slow, fast = StubBackendModel("slow", delay=0.3), StubBackendModel("fast", delay=0.01)
+            router = self.router(slow, fast)
+            self.assertEqual(call(router)("p"), "fast:p")
+            delay = fast.started[0] - slow.started[0]
+            self.assertGreaterEqual(delay, 0.045)
+            self.assertLess(delay, 0.25)
+            self.assertEqual(router.backends[1].hedged, 1)
+
+    def test_refused_extra_slot_stops_the_hedge(self):
+        for call in self.calls():
+            slow, fast = StubBackendModel("slow", delay=0.2), StubBackendModel("fast")
+            router = self.router(slow, fast, limit=0)
+            self.assertEqual(call(router)("p"), "slow:p")
+            self.assertEqual(fast.started, [])
+            self.assertEqual(router.backends[1].hedged, 0)
+
+    def test_error_fails_over(self):
+        for call in self.calls():
+            failing, fast = StubBackendModel("failing", error=ConnectionDropped("down")), StubBackendModel("fast")
+            router = self.router(failing, fast, deadline_ms=5000)
+            started = time.monotonic()
+            self.assertEqual(call(router)("p"), "fast:p")
+            # No hedge delay: the next backend is asked as soon as the first fails
+            self.assertLess(time.monotonic() - started, 1)
+            self.assertEqual(router.backends[0].consecutive_failures, 1)
+            self.assertEqual(router.extra_slot.granted, 0)
+
+            router = self.router(StubBackendModel("a", error=ConnectionDropped("a down")),
+                                 StubBackendModel("b", error=ConnectionDropped("b down")))
+            with self.assertRaisesMessage(ConnectionDropped, "b down"):
+                call(router)("p")
+
+    def test_extra_slot_releases_are_balanced(self):
+        for call in self.calls():
+            slow, fast = StubBackendModel("slow", delay=0.2), StubBackendModel("fast", delay=0.01)
+            router = self.router(slow, fast)
+            call(router)("p")
+            self.assertGreaterEqual(router.extra_slot.granted, 1)
+            # A losing sync call finishes in the background on a slot of its
+            # own; a losing async call is cancelled
+            deadline = time.monotonic() + 2
+            while router.extra_slot.outstanding and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(router.extra_slot.outstanding, 0)
+
+
+class Neo4jChunkRowTests(SimpleTestCase):
+    ROW = {
+        "text": "Spamming means sending unsolicited marketing messages",
+        "score": 0.9,
+        "metadata": {"text": None, "embedding": None, "chunk_id": "4:db:7", "article_title": "Spamming"},
+    }
+
+    def setUp(self):
+        self.service = fresh_service({"RAG_RETRIEVER_BACKEND": "neo4j"})
+        self.neo4j = mock.Mock()
+        self.neo4j.query.return_value = [self.ROW]
+        self.service._components["neo4j"] = self.neo4j
+
+    def test_rows_drop_the_nulled_text_and_embedding(self):
+        expected = {"chunk_id": "4:db:7", "article_title": "Spamming"}
+        [dense] = self.service._dense_search([0.0, 1.0], 1)
+        [fetched] = self.service._fetch_chunks(["4:db:7"])
+        self.assertEqual(dense.metadata, expected)
+        self.assertEqual(fetched.metadata, expected)
+        self.assertEqual(dense.page_content, self.ROW["text"])
+        self.assertEqual(self.service._format_sources([dense])[0]["metadata"], expected)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def perf_counter(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class RerankBudgetTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.ms_per_pair = 10.0
+        clock, test = self.clock, self
+
+        class FakeCrossEncoder:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def predict(self, pairs, **kwargs):
+                clock.now += test.ms_per_pair * len(pairs) / 1000
+                # Longer chunks score higher
+                return [len(text) for _, text in pairs]
+
+        modules = {"sentence_transformers": SimpleNamespace(CrossEncoder=FakeCrossEncoder)}
+        for patcher in (mock.patch.dict(sys.modules, modules), mock.patch("rag_api.rerank.time", clock)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.reranker = CrossEncoderReranker("fake", candidates=20, budget_ms=150.0, probe_interval=30.0)
+        self.docs = [Document(page_content="x" * n) for n in range(1, 21)]
+
+    def rerank(self):
+        return self.reranker.rerank("question", self.docs, 3)
+
+    def test_cold_passes_are_not_measured(self):
+        self.ms_per_pair = 50.0  # Warm-up and first pass are slow
+        docs, timings = self.rerank()
+        self.assertEqual([len(doc.page_content) for doc in docs], [20, 19, 18])
+        self.assertIn("rerank_ms", timings)
+        self.assertIsNone(self.reranker.ms_per_pair)
+
+        self.ms_per_pair = 2.0
+        self.rerank()
+        self.assertAlmostEqual(self.reranker.ms_per_pair, 2.0)
+        self.ms_per_pair = 4.0
+        self.rerank()
+        self.assertAlmostEqual(self.reranker.ms_per_pair, 2.4)
+
+    def test_over_budget_is_skipped_until_the_next_probe(self):
+        self.rerank()
+        self.rerank()  # 10ms x 20 pairs: over the 150ms budget
+        docs, timings = self.rerank()
+        self.assertEqual(timings["rerank_skipped"], 1)
+        self.assertAlmostEqual(timings["rerank_estimated_ms"], 200.0)
+        self.assertEqual(docs, self.docs[:3])
+
+        # After probe_interval one request is reranked to re-measure
+        self.ms_per_pair = 1.0
+        self.clock.now += 30
+        docs, timings = self.rerank()
+        self.assertIn("rerank_ms", timings)
+        self.assertAlmostEqual(self.reranker.ms_per_pair, 1.0)
+        self.assertNotIn("rerank_skipped", self.rerank()[1])
+        self.assertEqual(self.reranker.stats()["probes"], 1)
+        self.assertEqual(self.reranker.stats()["skipped"], 1)
+
+
+class GraphContextTests(SimpleTestCase):
+    ROWS = [
+        {"rank": 0, "article": "Spamming", "page": 9, "chapter": "CHAPTER II", "chapter_title": "Offences",
+         "clauses": [{"number": "(1)", "text": "Sending unsolicited messages.", "sub_clauses": []},
+                     {"number": "(2)", "text": "Spamming is punishable with a fine.", "sub_clauses": [
+                         {"number": "(b)", "text": "for a repeat offence"},
+                         {"number": "(a)", "text": "for a first offence"}]}]},
+        {"rank": 1, "article": "Cyber terrorism", "page": 7, "chapter": None, "chapter_title": None,
+         "clauses": [{"number": "(1)", "text": " ".join(["word"] * 40), "sub_clauses": []}]},
+        {"rank": 2, "article": "Spoofing", "page": 10, "chapter": None, "chapter_title": None,
+         "clauses": [{"number": "(1)", "text": "Establishing a fake website.", "sub_clauses": []}]},
+    ]
+
+    def builder(self, token_budget):
+        self.queries = []
+
+        def run_query(cypher, params):
+            self.queries.append(params)
+            return self.ROWS
+
+        return GraphContextBuilder(run_query, token_budget=token_budget, count_tokens=lambda text: len(text.split()))
+
+    def test_chunk_ref(self):
+        self.assertEqual(chunk_ref({"clause_number": "(2)", "article_title": "Spamming"}), ("Spamming", "(2)"))
+        self.assertEqual(chunk_ref({"article_title": "Spamming", "number": "(1)"}), ("Spamming", "(1)"))
+        self.assertEqual(chunk_ref({"title": "Spamming"}), ("Spamming", None))
+        self.assertIsNone(chunk_ref({}))
+
+    def test_fetch_sends_each_reference_once(self):
+        builder = self.builder(1000)
+        docs = [Document(page_content="", metadata=metadata) for metadata in (
+            {"article_title": "Spamming", "number": "(1)"},
+            {"clause_number": "(1)", "article_title": "Spamming"},
+            {"title": "Spoofing"},
+            {"label": "Part"},
+        )]
+        builder.fetch(docs)
+        self.assertEqual(self.queries[0]["refs"], [
+            {"rank": 0, "article": "Spamming", "clause": "(1)"},
+            {"rank": 1, "article": "Spoofing", "clause": None},
+        ])
+        self.assertEqual(builder.build([]), ("", {}))
+        self.assertEqual(len(self.queries), 1)
+
+    def test_context_is_cited_and_ordered(self):
+        context, citations = self.builder(1000).build([Document(page_content="", metadata={"title": "Spamming"})])
+        spamming = context.split("\n\n")[0]
+        self.assertEqual(spamming.splitlines(), [
+            "[CHAPTER II (Offences) > Article: Spamming]",
+            "(1) Sending unsolicited messages.",
+            "(2) Spamming is punishable with a fine.",
+            "   (a) for a first offence",
+            "   (b) for a repeat offence",
+        ])
+        self.assertEqual(citations[("Spamming", "(2)")], "CHAPTER II (Offences) > Article: Spamming > Clause (2)")
+
+    def test_article_whose_first_clause_does_not_fit_is_skipped(self):
+        context, citations = self.builder(40).build([Document(page_content="", metadata={"title": "Spamming"})])
+        self.assertNotIn("Cyber terrorism", context)
+        self.assertNotIn(("Cyber terrorism", None), citations)
+        self.assertIn("[Article: Spoofing]\n(1) Establishing a fake website.", context)
+        self.assertLessEqual(len(context.split()), 40)
+
+
+class WordCounter(TokenCounter):
+    def count_many(self, texts):
+        return [len(text.split()) for text in texts]
+
+
+class ContextBuilderTests(SimpleTestCase):
+    PROVISO = "Provided that the court may reduce the sentence."
+
+    def test_split_sentences(self):
+        self.assertEqual(split_sentences("First part; second part.\n(a) item:  more"),
+                         ["First part;", "second part.", "(a) item:", "more"])
+
+    def test_repeated_sentences_are_dropped(self):
+        docs = [
+            Document(page_content=f"Spamming is an offence. {self.PROVISO} (a)"),
+            Document(page_content=f"Spoofing is an offence. {self.PROVISO} (a)"),
+        ]
+        context, stats = ContextBuilder(WordCounter()).build("spamming", docs)
+        self.assertEqual(context.count("Provided that"), 1)
+        # Short fragments are kept even when repeated
+        self.assertEqual(context.count("(a)"), 2)
+        self.assertEqual(stats["duplicate_sentences"], 1)
+        self.assertEqual(stats["chunks_used"], 2)
+
+    def test_long_chunk_keeps_the_relevant_sentences_in_order(self):
+        doc = Document(page_content=(
+            "Spamming means sending unsolicited messages. "
+            "The Authority may issue rules. "
+            "Whoever commits spamming shall be punished with a fine. "
+            "Records shall be kept for one year."
+        ))
+        builder = ContextBuilder(WordCounter(), max_chunk_tokens=16)
+        context, stats = builder.build("What is the fine for spamming?", [doc])
+        self.assertEqual(context, "Spamming means sending unsolicited messages. "
+                                  "Whoever commits spamming shall be punished with a fine.")
+        self.assertEqual(stats["chunks_trimmed"], 1)
+        self.assertEqual(stats["original_tokens"], 26)
+        self.assertEqual(stats["context_tokens"], 14)
+
+    def test_assembly_stops_at_the_budget(self):
+        docs = [Document(page_content=" ".join([f"w{i}"] * 6) + ".") for i in range(4)]
+        builder = ContextBuilder(WordCounter(), token_budget=14)
+        context, stats = builder.build("question", docs)
+        self.assertEqual(stats["chunks_used"], 2)
+        self.assertLessEqual(stats["context_tokens"], 14)
+        self.assertNotIn("w2", context)
+
+        builder.record(stats, prompt_tokens=40)
+        self.assertEqual(stats["prompt_tokens"], 40)
+        self.assertEqual(builder.stats()["tokenizer"], "estimate")
+        self.assertEqual(builder.stats()["max_prompt_tokens"], 40)
+
+
+class IntentGateTests(SimpleTestCase):
+    def test_greetings(self):
+        for question in ("Hi", "hello there!", "Hello sir", "Good morning", "good day, madam",
+                         "Assalam o Alaikum", "AoA", "hey bro"):
+            with self.subTest(question):
+                self.assertEqual(classify(question), "greeting")
+
+    def test_modifiers_alone_are_not_greetings(self):
+        for question in ("there", "sir", "madam", "bro", "o", "day", "good", "morning",
+                         "sir what is spamming", "hello, what is cyber stalking?", "good evening is it bailable"):
+            with self.subTest(question):
+                self.assertIsNone(classify(question))
+
+    def test_non_english(self):
+        self.assertEqual(classify("saza kya hai is jurm ki"), "non_english")
+        self.assertEqual(classify("سائبر کرائم کی سزا کیا ہے"), "non_english")
+        self.assertIsNone(classify("What is the punishment for spamming?"))
+        self.assertIsNone(classify("Article 25?"))
+        self.assertIsNone(classify("123"))
+
+    def test_check_answers_and_counts(self):
+        gate = IntentGate()
+        self.assertEqual(gate.check("hello there")["answer"], GREETING_REPLY)
+        self.assertEqual(gate.check("kya hai ye")["answer"], NON_ENGLISH_REPLY)
+        self.assertIsNone(gate.check("sir"))
+        stats = gate.stats()
+        self.assertEqual((stats["greeting"], stats["non_english"], stats["checked"]), (1, 1, 3))
+
+
+class Neo4jClientTests(SimpleTestCase):
+    def setUp(self):
+        # The driver connects lazily, so building the client needs no server
+        self.client = Neo4jClient("neo4j://localhost:7687", "neo4j", "pw", database="law", retries=2, backoff=0.0)
+        self.addCleanup(self.client.close)
+
+    def test_transient_errors_are_retried(self):
+        operation = mock.Mock(side_effect=[ServiceUnavailable("down"), TransientError("deadlock"), "ok"])
+        self.assertEqual(self.client.retry(operation, 1, key="v"), "ok")
+        operation.assert_called_with(1, key="v")
+        stats = self.client.pool_stats()
+        self.assertEqual((stats["queries"], stats["retried"], stats["failed"], stats["in_flight"]), (1, 2, 0, 0))
+
+    def test_retries_are_bounded(self):
+        operation = mock.Mock(side_effect=SessionExpired("gone"))
+        with self.assertRaises(SessionExpired):
+            self.client.retry(operation)
+        self.assertEqual(operation.call_count, 3)
+        self.assertEqual(self.client.pool_stats()["failed"], 1)
+
+    def test_other_errors_are_not_retried(self):
+        operation = mock.Mock(side_effect=ValueError("bad cypher"))
+        with self.assertRaises(ValueError):
+            self.client.retry(operation)
+        self.assertEqual(operation.call_count, 1)
+        self.assertEqual(self.client.pool_stats()["retried"], 0)
+
+    def test_backoff_grows_with_jitter(self):
+        client = Neo4jClient("neo4j://localhost:7687", "neo4j", "pw", retries=3, backoff=0.1)
+        self.addCleanup(client.close)
+        operation = mock.Mock(side_effect=[ServiceUnavailable("down")] * 3 + ["ok"])
+        with mock.patch("rag_api.neo4j_client.time.sleep") as sleep, \
+                mock.patch("rag_api.neo4j_client.random.random", return_value=0.5):
+            client.retry(operation)
+        self.assertEqual([round(call.args[0], 3) for call in sleep.call_args_list], [0.1, 0.2, 0.4])
+
+    def test_reads_are_routed_to_readers(self):
+        driver = mock.Mock()
+        driver.execute_query.return_value = ([], None, None)
+        self.client.driver = driver
+        self.client.query("MATCH (n) RETURN n", read=True)
+        self.client.query("CREATE (n)")
+        routes = [call.kwargs["routing_"] for call in driver.execute_query.call_args_list]
+        self.assertEqual(routes, [RoutingControl.READ, RoutingControl.WRITE])
+        self.assertEqual(driver.execute_query.call_args.kwargs["database_"], "law")
+
+    def test_pool_stats_without_driver_internals(self):
+        self.client.driver = mock.Mock(spec=["execute_query", "close"])
+        stats = self.client.pool_stats()
+        self.assertNotIn("open_connections", stats)
+        self.assertEqual(stats["max_pool_size"], 50)
@@ -0,0 +1,213 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from .metrics import CACHE_EVENTS, STAGE_SECONDS
+from .vector_index import CHUNKS_FILE
+
+logger = logging.getLogger(__name__)
+
+TYPEAHEAD_FILE = "typeahead.json"
+
+DEFAULT_SUGGESTIONS = 4
+MAX_SUGGESTIONS = 10
+
+# Entry ranking: article titles before clause headings, shorter first
+KIND_WEIGHTS = {"Article": 2.0, "Clause": 1.0}
+CLAUSE_LEAD_WORDS = 8
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def clamp_k(value, default: int = DEFAULT_SUGGESTIONS) -> int:
+    try:
+        k = int(value)
+    except (TypeError, ValueError):
+        k = default
+    return max(1, min(k, MAX_SUGGESTIONS))
+
+
+def build_typeahead_index(index_dir) -> int:
+    """
+    Writes the typeahead entries of an index directory: every article title
+    and a heading per clause ("<article> <number>: <first words>"), ranked.
+    TOC/index chunks are left out. Returns the number of entries.
+    """
+    index_dir = Path(index_dir)
+    with open(index_dir / CHUNKS_FILE, encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    entries = {}
+    for chunk in chunks:
+        metadata = chunk["metadata"]
+        label = chunk.get("label") or metadata.get("label")
+        if metadata.get("is_toc") or label not in KIND_WEIGHTS:
+            continue
+        if label == "Article":
+            text = metadata.get("title") or chunk["text"]
+        else:
+            lead = " ".join(chunk["text"].split()[:CLAUSE_LEAD_WORDS])
+            text = f"{metadata.get('article_title', '')} {metadata.get('number', '')}: {lead}".strip()
+        text = " ".join(text.split())
+        score = KIND_WEIGHTS[label] - len(text) / 1000
+        if text and entries.get(text, (None, -1.0))[1] < score:
+            entries[text] = (label, score)
+
+    ranked = sorted(entries.items(), key=lambda item: -item[1][1])
+    with open(index_dir / TYPEAHEAD_FILE, "w", encoding="utf-8") as f:
+        json.dump({"entries": [{"text": text, "kind": kind} for text, (kind, _) in ranked]}, f, ensure_ascii=False)
+    return len(ranked)
+
+
+class TypeaheadIndex:
+    """
+    Per-keystroke suggestions without an embedding or database call.
+
+    Entries (already ranked at ingest) go into a character trie over their
+    normalized text, capped at max_depth, where every node keeps its top
+    `top_n` entry ids; a prefix lookup is one walk down the trie. Prefixes
+    that are not the start of an entry ("terrorism pun") fall back to an
+    edge n-gram index over entry words: every word must match, the last one
+    as a prefix. Inputs of at least vector_min_chars characters that still
+    have too few matches go to the vector fallback, if one is given.
+
+    Identical (prefix, k) lookups within debounce_ttl seconds are answered
+    from a small LRU, so a client resending the same prefix costs nothing.
+    """
+
+    def __init__(self, entries: list, vector_fallback=None, vector_min_chars: int = 24,
+                 top_n: int = MAX_SUGGESTIONS, max_depth: int = 48, min_gram: int = 2, max_gram: int = 12,
+                 debounce_ttl: float = 30.0, debounce_size: int = 4096):
+        self.texts = [entry["text"] for entry in entries]
+        self.vector_fallback = vector_fallback
+        self.vector_min_chars = vector_min_chars
+        self.top_n = top_n
+        self.max_depth = max_depth
+        self.min_gram = min_gram
+        self.max_gram = max_gram
+        self.debounce_ttl = debounce_ttl
+        self.debounce_size = debounce_size
+
+        self._trie = {}
+        self._grams = {}
+        for entry_id, text in enumerate(self.texts):
+            self._insert(entry_id, normalize(text))
+
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.debounced = 0
+        self.trie_hits = 0
+        self.ngram_hits = 0
+        self.vector_fallbacks = 0
+
+    @classmethod
+    def load(cls, index_dir, **kwargs):
+        with open(Path(index_dir) / TYPEAHEAD_FILE, encoding="utf-8") as f:
+            entries = json.load(f)["entries"]
+        logger.info(f"Loaded typeahead index: {len(entries)} entries")
+        return cls(entries, **kwargs)
+
+    @staticmethod
+    def exists(index_dir) -> bool:
+        return (Path(index_dir) / TYPEAHEAD_FILE).exists()
+
+    def _insert(self, entry_id: int, text: str):
+        # Entries arrive best first, so each node's list stays ranked
+        node = self._trie
+        for char in text[:self.max_depth]:
+            node = node.setdefault(char, {"": []})
+            if len(node[""]) < self.top_n:
+                node[""].append(entry_id)
+
+        for word in set(text.split()):
+            for n in range(self.min_gram, min(len(word), self.max_gram) + 1):
+                ids = self._grams.setdefault(word[:n], [])
+                if not ids or ids[-1] != entry_id:
+                    ids.append(entry_id)
+
+    def _trie_lookup(self, prefix: str) -> list:
+        node = self._trie
+        for char in prefix[:self.max_depth]:
+            node = node.get(char)
+            if node is None:
+                return []
+        ids = node[""]
+        if len(prefix) > self.max_depth:
+            # Deeper than the trie: confirm against the full text
+            ids = [i for i in ids if normalize(self.texts[i]).startswith(prefix)]
+        return ids
+
+    def _ngram_lookup(self, prefix: str) -> list:
+        words = [w[:self.max_gram] for w in prefix.split() if len(w) >= self.min_gram]
+        if not words:
+            return []
+        postings = [self._grams.get(word, []) for word in words]
+        postings.sort(key=len)
+        matched = set(postings[0]).intersection(*postings[1:])
+        # Entry ids are ranks, so sorting the ids ranks the matches
+        return sorted(matched)
+
+    def suggest(self, text: str, k: int = DEFAULT_SUGGESTIONS) -> list:
+        started = time.perf_counter()
+        k = clamp_k(k)
+        prefix = normalize(text)
+        key = (prefix, k)
+
+        now = time.monotonic()
+        with self._lock:
+            self.lookups += 1
+            recent = self._recent.get(key)
+            if recent is not None and now - recent[0] < self.debounce_ttl:
+                self._recent.move_to_end(key)
+                self.debounced += 1
+                CACHE_EVENTS.inc(cache="typeahead", result="hit")
+                return list(recent[1])
+        CACHE_EVENTS.inc(cache="typeahead", result="miss")
+
+        ids = self._trie_lookup(prefix)[:k] if prefix else []
+        if ids:
+            self._count("trie_hits")
+        if len(ids) < k:
+            extra = [i for i in self._ngram_lookup(prefix) if i not in ids]
+            if extra:
+                self._count("ngram_hits")
+            ids += extra[:k - len(ids)]
+        suggestions = [self.texts[i] for i in ids]
+
+        if len(suggestions) < k and self.vector_fallback is not None and len(text.strip()) >= self.vector_min_chars:
+            self._count("vector_fallbacks")
+            for suggestion in self.vector_fallback(text, k):
+                if len(suggestions) >= k:
+                    break
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+
+        with self._lock:
+            self._recent[key] = (time.monotonic(), suggestions)
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.debounce_size:
+                self._recent.popitem(last=False)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage="typeahead")
+        return list(suggestions)
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self.texts),
+                "lookups": self.lookups,
+                "debounced": self.debounced,
+                "trie_hits": self.trie_hits,
+                "ngram_hits": self.ngram_hits,
+                "vector_fallbacks": self.vector_fallbacks,
+            }
@@ -4,6 +4,9 @@ from . import views
 urlpatterns = [
     # Query
     path('query/', views.query_rag, name='query_rag'),
+    path('query/stream/', views.query_rag_stream, name='query_rag_stream'),
+    path('query/async/', views.query_rag_async, name='query_rag_async'),
+    path('suggestions/', views.get_suggestions, name='get_suggestions'),
 
     # Chat history
     path('history/', views.get_user_sessions, name='user_sessions'),
@@ -12,4 +15,5 @@ urlpatterns = [
 
     #Helth to check is database connected or not
     path('health/', views.health_check, name='health_check'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,179 @@
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parent.parent / "documents" / "index"
+
+# Files that make up an index directory
+MANIFEST_FILE = "manifest.json"
+CHUNKS_FILE = "chunks.json"
+VECTORS_FILE = "vectors.npy"
+CENTROIDS_FILE = "centroids.npy"
+OFFSETS_FILE = "offsets.npy"
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0):
+    """
+    Spherical k-means (cosine). Returns (centroids, assignments).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    assignments = np.zeros(len(vectors), dtype=np.int64)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = _normalize_rows(centroids)
+    return centroids.astype(np.float32), assignments
+
+
+def build_local_index(chunks: list, vectors, out_dir, manifest: dict, partitions: int = 0):
+    """
+    Writes a local vector index.
+
+    chunks: one dict per vector with "id", "label", "text" and "metadata"
+    vectors: embeddings in the same order as chunks
+    manifest: extra fields (model, corpus_version, ...) stored in manifest.json
+    partitions: number of k-means partitions; 0 builds a flat index
+
+    Vectors are stored L2-normalized as float32, so a cosine search is a dot
+    product. In a partitioned index rows are grouped by partition, so each
+    partition is one contiguous slice of the memory-mapped matrix.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    matrix = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+    order = np.arange(len(chunks))
+    partitions = min(partitions, len(chunks))
+
+    if partitions > 1:
+        centroids, assignments = _kmeans(matrix, partitions)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(partitions + 1)).astype(np.int64)
+        np.save(out_dir / CENTROIDS_FILE, centroids)
+        np.save(out_dir / OFFSETS_FILE, offsets)
+    else:
+        partitions = 0
+        for name in (CENTROIDS_FILE, OFFSETS_FILE):
+            (out_dir / name).unlink(missing_ok=True)
+
+    np.save(out_dir / VECTORS_FILE, matrix[order])
+    with open(out_dir / CHUNKS_FILE, "w", encoding="utf-8") as f:
+        json.dump([chunks[i] for i in order], f, ensure_ascii=False)
+    with open(out_dir / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(dict(manifest, count=len(chunks), dimensions=int(matrix.shape[1]), partitions=partitions), f, indent=2)
+
+
+class LocalVectorStore:
+    """
+    In-process alternative to the Neo4j vector index, backed by an index
+    directory built by load_documents.py.
+
+    The embeddings matrix is memory-mapped; top-k cosine search is a single
+    matrix-vector product over the whole matrix, or over the `nprobe`
+    closest partitions when the index was built with partitions.
+    """
+
+    def __init__(self, index_dir, embeddings, nprobe: int = 4):
+        self.index_dir = Path(index_dir)
+        self.embeddings = embeddings
+        self.nprobe = nprobe
+
+        with open(self.index_dir / MANIFEST_FILE, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        with open(self.index_dir / CHUNKS_FILE, encoding="utf-8") as f:
+            self.chunks = json.load(f)
+        self.vectors = np.load(self.index_dir / VECTORS_FILE, mmap_mode="r")
+        # TOC/index chunks flagged at ingest never come back from a search
+        self.flagged = np.array([bool(c["metadata"].get("is_toc")) for c in self.chunks], dtype=bool)
+        # chunk_id -> row, built on the first lookup by id
+        self._rows_by_id = None
+
+        self.centroids = None
+        self.offsets = None
+        if self.manifest.get("partitions"):
+            self.centroids = np.load(self.index_dir / CENTROIDS_FILE)
+            self.offsets = np.load(self.index_dir / OFFSETS_FILE)
+
+        logger.info(
+            f"Loaded local vector index: {len(self.chunks)} chunks, "
+            f"{self.manifest.get('partitions', 0)} partitions"
+        )
+
+    @property
+    def corpus_version(self) -> str:
+        return self.manifest.get("corpus_version", "unversioned")
+
+    def _candidate_rows(self, query: np.ndarray):
+        """
+        Returns (row_indices, scores) to rank: every row for a flat index,
+        only the rows of the closest partitions otherwise.
+        """
+        if self.centroids is None:
+            return None, np.asarray(self.vectors @ query)
+
+        closest = np.argsort(self.centroids @ query)[::-1][:self.nprobe]
+        rows = np.concatenate([np.arange(self.offsets[p], self.offsets[p + 1]) for p in closest])
+        return rows, np.asarray(self.vectors[rows] @ query)
+
+    def search(self, embedding, k: int) -> list:
+        """
+        Returns [(chunk_index, score)] for the top k unflagged chunks.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        rows, scores = self._candidate_rows(query)
+        flagged = self.flagged if rows is None else self.flagged[rows]
+        scores = np.where(flagged, -np.inf, scores)
+        k = min(k, int(len(scores) - flagged.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if rows is not None:
+            return [(int(rows[i]), float(scores[i])) for i in top]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def _document(self, index: int) -> Document:
+        chunk = self.chunks[index]
+        return Document(page_content=chunk["text"], metadata=dict(chunk["metadata"]))
+
+    def get_documents(self, chunk_ids: list) -> list:
+        """
+        Returns the chunks with the given metadata chunk_ids, in that order;
+        unknown ids are skipped.
+        """
+        if self._rows_by_id is None:
+            self._rows_by_id = {c["metadata"].get("chunk_id"): row for row, c in enumerate(self.chunks)}
+        rows = (self._rows_by_id.get(chunk_id) for chunk_id in chunk_ids)
+        return [self._document(row) for row in rows if row is not None]
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4) -> list:
+        return [(self._document(i), score) for i, score in self.search(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4) -> list:
+        return [self._document(i) for i, _ in self.search(embedding, k)]
+
+    async def asimilarity_search_by_vector(self, embedding, k: int = 4) -> list:
+        # Sub-millisecond CPU work, not worth a thread hop
+        return self.similarity_search_by_vector(embedding, k)
+
+    def similarity_search(self, query: str, k: int = 4) -> list:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k)
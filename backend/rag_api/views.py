@@ -3,10 +3,20 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.authtoken.models import Token
 from .models import ChatSession, ChatMessage
 from rest_framework import status
 from .rag_service import RAGService
+from .metrics import REGISTRY, Timings
+from .pagination import keyset_page, page_size
+from .chat_store import build_chat_store
+import json
 import logging
+import os
+import uuid
 
 # from rest_framework.response import Response
 # from rest_framework import status
@@ -71,17 +81,19 @@ import logging
 
 logger = logging.getLogger(__name__)
 rag_service = RAGService()
+# Chat history writes: one transaction per exchange, optionally write-behind
+chat_store = build_chat_store()
 
 
 @api_view(['POST'])
 def get_suggestions(request):
     """
-    Get similar questions/topics based on input
+    Typeahead suggestions for partial input
     
     Request body:
     {
         "question": "Your partial question",
-        "k": 4  
+        "k": 4  (clamped to 1-10)
     }
     
     Response:
@@ -99,7 +111,7 @@ def get_suggestions(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        suggestions = rag_service.get_similar_questions(question, k)
+        suggestions = rag_service.get_suggestions(question, k)
         
         return Response(
             {'suggestions': suggestions},
@@ -113,6 +125,14 @@ def get_suggestions(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@require_GET
+def metrics(request):
+    """
+    Stage latency histograms, cache/fallback/error counters and component
+    gauges in the Prometheus text exposition format.
+    """
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @api_view(['GET'])
 def health_check(request):
     """
@@ -126,7 +146,19 @@ def health_check(request):
                 'service': 'Legal Advisor RAG API',
                 'neo4j_connected': connection_status['connected'],
                 'documents_loaded': connection_status['documents_loaded'],
-                'message': connection_status['message']
+                'message': connection_status['message'],
+                'answer_cache': rag_service.answer_cache_stats(),
+                'semantic_cache': rag_service.semantic_cache_stats(),
+                'embedding_cache': rag_service.embedding_cache_stats(),
+                'reranker': rag_service.reranker_stats(),
+                'context': rag_service.context_stats(),
+                'intent_gate': rag_service.intent_gate_stats(),
+                'typeahead': rag_service.typeahead_stats(),
+                'neo4j_pool': rag_service.neo4j_stats(),
+                'chat_store': chat_store.stats(),
+                'conversation': rag_service.conversation_stats(),
+                'llm_gateway': rag_service.llm_gateway_stats(),
+                'llm_backends': rag_service.llm_backend_stats()
             },
             status=status.HTTP_200_OK
         )
@@ -157,62 +189,222 @@ def query_rag(request):
         if not question:
             return Response({'error': 'Question is required'}, status=400)
 
-        # Step A: Get or Create Session
-        if session_id:
-            # Continue existing session
-            session = get_object_or_404(ChatSession, session_id=session_id, user=user)
-        else:
-            # Start new session (Title = first 50 chars of question)
-            title = question[:50] + "..." if len(question) > 50 else question
-            session = ChatSession.objects.create(user=user, title=title)
-
-        # Step B: Save User Message to DB
-        ChatMessage.objects.create(
-            session=session,
-            role='user',
-            content=question
-        )
-           
-
-        # Step C: Get AI Response
-        result = rag_service.query(question)
+        timings = Timings()
+
+        # Step A: Get or Start Session (a new one is saved with its first messages)
+        with timings.span("db_read"):
+            if session_id:
+                # Continue existing session
+                try:
+                    session = chat_store.get_session(user, session_id)
+                except ChatSession.DoesNotExist:
+                    return Response({'detail': 'No ChatSession matches the given query.'}, status=404)
+            else:
+                session = chat_store.new_session(user, question)
+
+        # Step B: Get AI Response
+        # Follow-ups are rewritten using the session's summary
+        result = rag_service.query(question, history=chat_store.history(session))
         answer = result.get('answer', 'No answer found.')
         sources = result.get('sources', [])
         # print(sources)
-        # Step D: Save AI Message to DB
-        ChatMessage.objects.create(
-            session=session,
-            role='assistant',
-            content=answer
-        )
+        # Step C: Save both messages and touch the session in one transaction
+        with timings.span("db_write"):
+            chat_store.save_exchange(session, question, answer, new_session=not session_id,
+                                     conversation=result.get('conversation'))
 
-        # Step E: Return Response with Session ID (Critical for frontend tracking)
-        return Response({
+        # Step D: Return Response with Session ID (Critical for frontend tracking)
+        payload = {
             'session_id': session.session_id,
             'title': session.title,
             'answer': answer,
-            'sources': sources
-        })
+            'sources': sources,
+            'prompt_stats': result.get('prompt_stats')
+        }
+        if _wants_timings(request.query_params, request.data):
+            payload['timings'] = dict(result.get('timings', {}), **timings.as_dict())
+        return Response(payload)
 
     except Exception as e:
         logger.error(f"Error in query_rag: {str(e)}")
         return Response({'error': str(e)}, status=500)
 
+def _wants_timings(params, body) -> bool:
+    """
+    Per-stage timings are added to query responses with ?timings=1, a
+    "timings": true body field, or RAG_RESPONSE_TIMINGS=1.
+    """
+    if os.getenv("RAG_RESPONSE_TIMINGS") == "1" or params.get('timings') in ('1', 'true'):
+        return True
+    return body.get('timings') is True
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+#  Query RAG with a streamed answer (server-sent events)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def query_rag_stream(request):
+    """
+    Same as query_rag, but streams the answer as server-sent events:
+    "session", then "sources", then one "token" per LLM chunk, then "done"
+    (or "error"). The exchange is saved once the stream ends; if the client
+    disconnects first, the answer streamed so far is saved.
+    """
+    try:
+        user = request.user
+        question = request.data.get('question', '')
+        session_id = request.data.get('session_id')
+
+        if not question:
+            return Response({'error': 'Question is required'}, status=400)
+
+        timings = Timings()
+        with timings.span("db_read"):
+            if session_id:
+                try:
+                    session = chat_store.get_session(user, session_id)
+                except ChatSession.DoesNotExist:
+                    return Response({'detail': 'No ChatSession matches the given query.'}, status=404)
+            else:
+                session = chat_store.new_session(user, question)
+
+        def save(answer, conversation=None):
+            # A failed save must not cut the stream short
+            try:
+                with timings.span("db_write"):
+                    chat_store.save_exchange(session, question, answer, new_session=not session_id,
+                                             conversation=conversation)
+            except Exception as e:
+                logger.error(f"Error saving streamed exchange: {str(e)}")
+
+        def event_stream():
+            events = rag_service.stream_query(question, history=chat_store.history(session))
+            parts = []
+            finished = False
+            try:
+                yield _sse('session', {'session_id': session.session_id, 'title': session.title})
+                for event in events:
+                    if event['type'] == 'token':
+                        parts.append(event['content'])
+                    elif event['type'] in ('done', 'error'):
+                        finished = True
+                        save(event['answer'], event.get('conversation'))
+                        event = dict(event, timings=dict(event.get('timings', {}), **timings.as_dict()))
+                    yield _sse(event['type'], event)
+            finally:
+                # Also reached when the client goes away mid-stream
+                events.close()
+                if not finished:
+                    save("".join(parts))
+
+        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+        return response
+
+    except Exception as e:
+        logger.error(f"Error in query_rag_stream: {str(e)}")
+        return Response({'error': str(e)}, status=500)
+
+async def _aauthenticate(request):
+    """Resolve the DRF token from the Authorization header without blocking the event loop."""
+    keyword, _, key = request.headers.get('Authorization', '').partition(' ')
+    if keyword != 'Token' or not key.strip():
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(key=key.strip())
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+#  Query RAG on the event loop (serve backend.asgi:application)
+@csrf_exempt
+@require_POST
+async def query_rag_async(request):
+    """
+    Async version of query_rag. Retrieval, the LLM call and the ORM writes
+    are awaited, so one ASGI process can hold many slow LLM calls at once.
+    """
+    try:
+        user = await _aauthenticate(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+        try:
+            body = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+
+        question = body.get('question', '')
+        session_id = body.get('session_id')
+
+        if not question:
+            return JsonResponse({'error': 'Question is required'}, status=400)
+
+        timings = Timings()
+        with timings.span("db_read"):
+            if session_id:
+                try:
+                    session = await chat_store.aget_session(user, session_id)
+                except ChatSession.DoesNotExist:
+                    return JsonResponse({'detail': 'No ChatSession matches the given query.'}, status=404)
+            else:
+                session = chat_store.new_session(user, question)
+
+        result = await rag_service.aquery(question, history=chat_store.history(session))
+        answer = result.get('answer', 'No answer found.')
+        sources = result.get('sources', [])
+
+        with timings.span("db_write"):
+            await chat_store.asave_exchange(session, question, answer, new_session=not session_id,
+                                            conversation=result.get('conversation'))
+
+        payload = {
+            'session_id': str(session.session_id),
+            'title': session.title,
+            'answer': answer,
+            'sources': sources,
+            'prompt_stats': result.get('prompt_stats')
+        }
+        if _wants_timings(request.GET, body):
+            payload['timings'] = dict(result.get('timings', {}), **timings.as_dict())
+        return JsonResponse(payload)
+
+    except Exception as e:
+        logger.error(f"Error in query_rag_async: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
+
 # Get User's Chat History (For Sidebar) 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_user_sessions(request):
-    """Fetch all chat sessions for the logged-in user"""
+    """
+    Fetch the logged-in user's chat sessions, most recent first, one page
+    at a time: {"results": [...], "next_cursor": "..."}. Pass next_cursor
+    back as ?cursor= for the next page; ?limit= sets the page size.
+    """
     try:
-        sessions = ChatSession.objects.filter(user=request.user).order_by('-updated_at')
+        sessions = ChatSession.objects.filter(user=request.user).values('session_id', 'title', 'updated_at')
+        rows, next_cursor = keyset_page(
+            sessions, 'updated_at', 'session_id',
+            request.query_params.get('cursor'), page_size(request.query_params),
+            descending=True, key_type=uuid.UUID
+        )
         data = [
             {
-                'id': str(s.session_id),
-                'name': s.title, # Using 'name' to match your React 'chats' state
-                'updated_at': s.updated_at
-            } for s in sessions
+                'id': str(s['session_id']),
+                'name': s['title'], # Using 'name' to match your React 'chats' state
+                'updated_at': s['updated_at']
+            } for s in rows
         ]
-        return Response(data)
+        return Response({'results': data, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
@@ -220,19 +412,32 @@ def get_user_sessions(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_session_messages(request, session_id):
-    """Fetch all messages for a specific session ID"""
+    """
+    Fetch the messages of a session in order, one page at a time:
+    {"results": [...], "next_cursor": "..."} (see get_user_sessions).
+    ?order=desc pages from the newest message back, so a client can show
+    the latest page first and load earlier ones on demand.
+    """
     try:
-        session = get_object_or_404(ChatSession, session_id=session_id, user=request.user)
-        messages = ChatMessage.objects.filter(session=session).order_by('created_at')
+        get_object_or_404(ChatSession.objects.only('session_id'), session_id=session_id, user=request.user)
+        messages = ChatMessage.objects.filter(session_id=session_id).values('message_id', 'role', 'content', 'created_at')
+        rows, next_cursor = keyset_page(
+            messages, 'created_at', 'message_id',
+            request.query_params.get('cursor'), page_size(request.query_params),
+            descending=request.query_params.get('order') == 'desc', key_type=int
+        )
         
         data = [
             {
-                'type': 'user' if m.role == 'user' else 'bot', # Map to your React 'type'
-                'content': m.content,
-                'timestamp': m.created_at.strftime("%H:%M") # Format time
-            } for m in messages
+                'id': m['message_id'],
+                'type': 'user' if m['role'] == 'user' else 'bot', # Map to your React 'type'
+                'content': m['content'],
+                'timestamp': m['created_at'].strftime("%H:%M") # Format time
+            } for m in rows
         ]
-        return Response(data)
+        return Response({'results': data, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
     
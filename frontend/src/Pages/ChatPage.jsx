@@ -1,4 +1,4 @@
-import React, { useState, useRef, useEffect } from 'react';
+import React, { useState, useRef, useEffect, useLayoutEffect } from 'react';
 import { Send, Menu, Plus, LogOut, User, Scale, MessageSquare, Loader2, AlertCircle, CheckCircle, Trash2 } from 'lucide-react';
 import './ChatPage.css';
 import { queryLegalQuestion, checkHealth, getUserSessions, getSessionMessages, deleteChatSession } from './api';
@@ -8,18 +8,28 @@ export default function ChatPage() {
   
   // 'chats' now only stores the Sidebar list (id, title)
   const [chats, setChats] = useState([]); 
+  // Cursor of the next sidebar page (null once every session is loaded)
+  const [sessionsCursor, setSessionsCursor] = useState(null);
+  const [isLoadingMoreSessions, setIsLoadingMoreSessions] = useState(false);
   
   // 'activeChat' stores the UUID of the current session, or 'new'
   const [activeChat, setActiveChat] = useState('new'); 
   
   // 'messages' stores the content of the CURRENT active chat
   const [messages, setMessages] = useState([]);
+  // Cursor of the page of messages before the oldest one shown
+  const [messagesCursor, setMessagesCursor] = useState(null);
+  const [isLoadingEarlier, setIsLoadingEarlier] = useState(false);
   
   const [sidebarOpen, setSidebarOpen] = useState(true);
   const [isLoading, setIsLoading] = useState(false);
   const [isHistoryLoading, setIsHistoryLoading] = useState(false); // For sidebar loading
   const [backendStatus, setBackendStatus] = useState('checking');
   const messagesEndRef = useRef(null);
+  const chatAreaRef = useRef(null);
+  const activeChatRef = useRef(activeChat);
+  // Distance from the bottom to keep when earlier messages are prepended
+  const restoreScrollRef = useRef(null);
   const [username, setUsername] = useState('Guest');
 
   // 1. Initial Setup: Check Auth, Health, and Load Sidebar History
@@ -38,6 +48,8 @@ export default function ChatPage() {
 
   // 2. Load Messages when Active Chat Changes
   useEffect(() => {
+    activeChatRef.current = activeChat;
+    setMessagesCursor(null);
     if (activeChat === 'new') {
       setMessages([]);
     } else {
@@ -45,8 +57,14 @@ export default function ChatPage() {
     }
   }, [activeChat]);
 
-  // Auto-scroll to bottom
-  useEffect(() => {
+  // Auto-scroll to bottom, except when earlier messages were added on top
+  useLayoutEffect(() => {
+    const area = chatAreaRef.current;
+    if (restoreScrollRef.current !== null && area) {
+      area.scrollTop = area.scrollHeight - restoreScrollRef.current;
+      restoreScrollRef.current = null;
+      return;
+    }
     scrollToBottom();
   }, [messages, isLoading]);
 
@@ -93,8 +111,9 @@ export default function ChatPage() {
   const loadSidebarHistory = async () => {
     setIsHistoryLoading(true);
     try {
-      const sessions = await getUserSessions();
+      const { sessions, nextCursor } = await getUserSessions();
       setChats(sessions); // Expecting array of { id, name, updated_at }
+      setSessionsCursor(nextCursor);
     } catch (error) {
       console.error("Failed to load history:", error);
     } finally {
@@ -102,17 +121,37 @@ export default function ChatPage() {
     }
   };
 
+  const loadMoreSessions = async () => {
+    if (!sessionsCursor || isLoadingMoreSessions) return;
+    setIsLoadingMoreSessions(true);
+    try {
+      const { sessions, nextCursor } = await getUserSessions(sessionsCursor);
+      setChats(prev => [...prev, ...sessions.filter(s => !prev.some(chat => chat.id === s.id))]);
+      setSessionsCursor(nextCursor);
+    } catch (error) {
+      console.error("Failed to load more history:", error);
+    } finally {
+      setIsLoadingMoreSessions(false);
+    }
+  };
+
+  // Infinite scroll: fetch the next page as the sidebar nears its end
+  const handleChatListScroll = (e) => {
+    const list = e.currentTarget;
+    if (list.scrollHeight - list.scrollTop - list.clientHeight < 80) {
+      loadMoreSessions();
+    }
+  };
+
   const loadChatMessages = async (sessionId) => {
     setIsLoading(true); // Reuse loading state or create a specific one for fetching
     try {
-      const msgs = await getSessionMessages(sessionId);
-      // Backend returns: { type: 'user'|'bot', content: '...', timestamp: '...' }
-      // We need to add local IDs for React keys if the backend doesn't provide unique IDs for rendering
-      const formattedMsgs = msgs.map((msg, index) => ({
-        ...msg,
-        id: index // Simple index for display key, ideally backend sends UUID
-      }));
-      setMessages(formattedMsgs);
+      // Latest page only; earlier pages load as the user scrolls up
+      // Backend returns: { id, type: 'user'|'bot', content: '...', timestamp: '...' }
+      const { messages: msgs, nextCursor } = await getSessionMessages(sessionId);
+      if (activeChatRef.current !== sessionId) return;
+      setMessages(msgs);
+      setMessagesCursor(nextCursor);
     } catch (error) {
       console.error("Failed to load messages:", error);
     } finally {
@@ -120,6 +159,30 @@ export default function ChatPage() {
     }
   };
 
+  const loadEarlierMessages = async () => {
+    if (!messagesCursor || isLoadingEarlier || activeChat === 'new') return;
+    const sessionId = activeChat;
+    setIsLoadingEarlier(true);
+    try {
+      const { messages: older, nextCursor } = await getSessionMessages(sessionId, messagesCursor);
+      if (activeChatRef.current !== sessionId) return;
+      const area = chatAreaRef.current;
+      restoreScrollRef.current = area ? area.scrollHeight - area.scrollTop : null;
+      setMessages(prev => [...older, ...prev]);
+      setMessagesCursor(nextCursor);
+    } catch (error) {
+      console.error("Failed to load earlier messages:", error);
+    } finally {
+      setIsLoadingEarlier(false);
+    }
+  };
+
+  const handleChatAreaScroll = (e) => {
+    if (e.currentTarget.scrollTop < 80) {
+      loadEarlierMessages();
+    }
+  };
+
   const handleSendMessage = async () => {
     if (!message.trim() || isLoading || backendStatus !== 'connected') return;
 
@@ -205,7 +268,7 @@ export default function ChatPage() {
           </button>
         </div>
 
-        <div className="chat-list">
+        <div className="chat-list" onScroll={handleChatListScroll}>
           {isHistoryLoading ? (
              <div style={{padding: '20px', textAlign: 'center', color: '#666'}}>
                <Loader2 size={20} className="spinner" />
@@ -233,6 +296,13 @@ export default function ChatPage() {
               </div>
             ))
           )}
+
+          {/* More sessions: loaded on scroll, or here if the list does not scroll yet */}
+          {!isHistoryLoading && sessionsCursor && (
+            <button className="load-more-btn" onClick={loadMoreSessions} disabled={isLoadingMoreSessions}>
+              {isLoadingMoreSessions ? <Loader2 size={16} className="spinner" /> : 'Load more'}
+            </button>
+          )}
         </div>
 
         <div className="sidebar-footer">
@@ -284,7 +354,7 @@ export default function ChatPage() {
         </header>
 
         {/* Chat Area */}
-        <section className="chat-area">
+        <section className="chat-area" ref={chatAreaRef} onScroll={handleChatAreaScroll}>
           {messages.length === 0 && activeChat === 'new' ? (
             <div className="empty-state">
               <div className="empty-icon">
@@ -298,8 +368,14 @@ export default function ChatPage() {
             </div>
           ) : (
             <div className="messages-container">
+              {messagesCursor && (
+                <button className="load-more-btn" onClick={loadEarlierMessages} disabled={isLoadingEarlier}>
+                  {isLoadingEarlier ? <Loader2 size={16} className="spinner" /> : 'Load earlier messages'}
+                </button>
+              )}
+
               {messages.map((msg, idx) => (
-                <div key={idx} className={`message-wrapper ${msg.type}`}>
+                <div key={msg.id ?? idx} className={`message-wrapper ${msg.type}`}>
                   {msg.type === 'bot' && (
                     <div className="bot-avatar">
                       <Scale size={20} color="white" />
@@ -49,22 +49,28 @@ export const queryLegalQuestion = async (question, sessionId = null) => {
     return await response.json();
 };
 
-// Fetch Sidebar Data
-export const getUserSessions = async () => {
-    const response = await fetch(`${API_BASE_URL}/history/`, {
+// Fetch Sidebar Data: one page of sessions, most recent first.
+// Pass the returned nextCursor back in to load the next page (null on the last one).
+export const getUserSessions = async (cursor = null) => {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const response = await fetch(`${API_BASE_URL}/history/${query}`, {
         headers: getHeaders()
     });
     if (!response.ok) throw new Error('Failed to fetch history');
-    return await response.json();
+    const data = await response.json();
+    return { sessions: data.results, nextCursor: data.next_cursor };
 };
 
-// Fetch Chat Messages
-export const getSessionMessages = async (sessionId) => {
-    const response = await fetch(`${API_BASE_URL}/history/${sessionId}/`, {
+// Fetch Chat Messages: one page, starting from the newest message.
+// Messages come back oldest first; nextCursor loads the page before them.
+export const getSessionMessages = async (sessionId, cursor = null) => {
+    const query = `?order=desc${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`;
+    const response = await fetch(`${API_BASE_URL}/history/${sessionId}/${query}`, {
         headers: getHeaders()
     });
     if (!response.ok) throw new Error('Failed to fetch messages');
-    return await response.json();
+    const data = await response.json();
+    return { messages: data.results.reverse(), nextCursor: data.next_cursor };
 };
 
 